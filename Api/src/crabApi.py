@@ -1,20 +1,40 @@
 #!/usr/local/bin/python
 #---------------------------------------------------------------------------------------------------
 # Access CRAB3 data via HTCondor
+#
+# The schedulers are queried in parallel, each with its own timeout, and the job ads are summed up
+# per dataset while they are read. CPUs of all sites come from a single collector query.
+#
+# For tests a collector (and the matching scheduler factory) can be passed in, see fakeCondor.py for
+# a local stand-in that does not need the HTCondor bindings.
 #---------------------------------------------------------------------------------------------------
-import os, htcondor, ConfigParser
+import os, time, threading, Queue, ConfigParser
+try:
+    import htcondor
+except ImportError:
+    htcondor = None
 from email.MIMEText import MIMEText
 from email.MIMEMultipart import MIMEMultipart
 from email.Utils import formataddr
 from subprocess import Popen, PIPE
 
 class crabApi():
-    def __init__(self):
+    def __init__(self, collector=None, scheddFactory=None, nThreads=8, timeout=300):
         config = ConfigParser.RawConfigParser()
         config.read(os.path.join(os.path.dirname(__file__), 'api.cfg'))
-        collectorName = config.get('crab', 'collector')
         self.fromEmail = config.items('from_email')[0]
         self.toEmails = config.items('error_emails')
+        self.nThreads = nThreads
+        self.timeout = timeout
+        # site -> cpus from the last collector query, and the time of that query
+        self.siteCpus = dict()
+        self.siteCpusTime = 0
+        if collector is not None:
+            self.collector = collector
+            self.scheddFactory = scheddFactory
+            return
+        self.scheddFactory = htcondor.Schedd
+        collectorName = config.get('crab', 'collector')
         # Will try to get schedulers 3 times before reporting an error
         for attempt in range(3):
             try:
@@ -60,32 +80,143 @@ class crabApi():
         returnObjects = self.collector.query(types, query, attributes)
         return returnObjects
 
+    def scheddTypes(self):
+        if htcondor is None:
+            return 'Schedd'
+        return htcondor.DaemonTypes.Schedd
+
+    def startdTypes(self):
+        if htcondor is None:
+            return 'Startd'
+        return htcondor.AdTypes.Startd
+
+    def queryAllSchedds(self, query, attributes, consumer):
+        # query all schedulers in parallel (at most nThreads at a time), every scheduler is retried up
+        # to 3 times and has timeout seconds to answer. consumer(ads) is called in the worker thread
+        # and has to return a partial result, the list of partial results is returned.
+        schedulers = self.locateAll(self.scheddTypes())
+        slots = threading.BoundedSemaphore(self.nThreads)
+        results = Queue.Queue()
+        started = dict()
+        lock = threading.Lock()
+
+        def worker(index, scheduler):
+            slots.acquire()
+            try:
+                lock.acquire()
+                started[index] = time.time()
+                lock.release()
+                e = ""
+                for attempt in range(3):
+                    try:
+                        schedd = self.scheddFactory(scheduler)
+                        if hasattr(schedd, 'xquery'):
+                            ads = schedd.xquery(query, attributes)
+                        else:
+                            ads = schedd.query(query, attributes)
+                        result = consumer(ads)
+                    except IOError, err:
+                        e = err
+                        continue
+                    else:
+                        results.put((index, result, None))
+                        return
+                results.put((index, None, e))
+            finally:
+                slots.release()
+
+        for index, scheduler in enumerate(schedulers):
+            thread = threading.Thread(target=worker, args=(index, scheduler))
+            thread.daemon = True
+            thread.start()
+
+        partials = []
+        pending = set(range(len(schedulers)))
+        while pending:
+            try:
+                index, result, e = results.get(timeout=1)
+            except Queue.Empty:
+                # give up on schedulers that are past their timeout, their threads are left behind
+                lock.acquire()
+                timedOut = [i for i in pending if i in started and time.time() - started[i] > self.timeout]
+                lock.release()
+                for i in timedOut:
+                    pending.discard(i)
+                    self.error("Query of scheduler %s timed out after %d seconds" % (schedulers[i].get('Name', i), self.timeout))
+                continue
+            if index not in pending:
+                continue
+            pending.discard(index)
+            if e:
+                self.error(e)
+                continue
+            partials.append(result)
+        return partials
+
     def getJobs(self, timestamp):
         data = []
         query = 'TaskType =?= "ROOT" && JobStatus =?= 2 && QDate < %d' % (timestamp)
         attributes = ["CRAB_InputData", "QDate", "CRAB_UserHN", "CRAB_JobCount", "DAG_NodesQueued"]
-        schedulers = self.locateAll(htcondor.DaemonTypes.Schedd)
-        for scheduler in schedulers:
-            # query all schedulers, if error retry up to 3 times
-            for attempt in range(3):
-                try:
-                    schedd = htcondor.Schedd(scheduler)
-                    jobs = schedd.query(query, attributes)
-                    for job in jobs:
-                        data.append(job)
-                except IOError, e:
-                    continue
-                else:
-                    break
-            else:
-                self.error(e)
+        for jobs in self.queryAllSchedds(query, attributes, list):
+            data.extend(jobs)
         return data
 
-    def getCpus(self, site):
-        cpus = 0
-        query = 'GLIDEIN_CMSSite =?= "%s" && CPUs > 0' % (site)
+    def getJobSummary(self, timestamp):
+        # running CRAB tasks summed up per input dataset:
+        # dataset -> {'tasks': n, 'jobs': n, 'queued': n, 'users': set of users, 'firstQDate': t}
+        query = 'TaskType =?= "ROOT" && JobStatus =?= 2 && QDate < %d' % (timestamp)
+        attributes = ["CRAB_InputData", "QDate", "CRAB_UserHN", "CRAB_JobCount", "DAG_NodesQueued"]
+
+        def summarize(ads):
+            summary = dict()
+            for ad in ads:
+                dataset = ad.get("CRAB_InputData")
+                if not dataset:
+                    continue
+                if dataset not in summary:
+                    summary[dataset] = {'tasks': 0, 'jobs': 0, 'queued': 0, 'users': set(), 'firstQDate': None}
+                entry = summary[dataset]
+                entry['tasks'] += 1
+                entry['jobs'] += int(ad.get("CRAB_JobCount", 0) or 0)
+                entry['queued'] += int(ad.get("DAG_NodesQueued", 0) or 0)
+                if ad.get("CRAB_UserHN"):
+                    entry['users'].add(ad.get("CRAB_UserHN"))
+                qDate = ad.get("QDate")
+                if qDate is not None and (entry['firstQDate'] is None or qDate < entry['firstQDate']):
+                    entry['firstQDate'] = qDate
+            return summary
+
+        summary = dict()
+        for partial in self.queryAllSchedds(query, attributes, summarize):
+            for dataset, entry in partial.iteritems():
+                if dataset not in summary:
+                    summary[dataset] = entry
+                    continue
+                total = summary[dataset]
+                total['tasks'] += entry['tasks']
+                total['jobs'] += entry['jobs']
+                total['queued'] += entry['queued']
+                total['users'] |= entry['users']
+                if entry['firstQDate'] is not None and (total['firstQDate'] is None or entry['firstQDate'] < total['firstQDate']):
+                    total['firstQDate'] = entry['firstQDate']
+        return summary
+
+    def getAllCpus(self, maxAge=600):
+        # cpus of all sites from one collector query, kept for maxAge seconds
+        if self.siteCpus and time.time() - self.siteCpusTime < maxAge:
+            return self.siteCpus
+        siteCpus = dict()
+        query = 'CPUs > 0'
         attributes = ["GLIDEIN_CMSSite", "CPUs"]
-        ads = self.query(htcondor.AdTypes.Startd, query, attributes)
+        ads = self.query(self.startdTypes(), query, attributes)
         for ad in ads:
-            cpus += ad.get("CPUs")
-        return cpus
+            site = ad.get("GLIDEIN_CMSSite")
+            if not site:
+                continue
+            siteCpus[site] = siteCpus.get(site, 0) + ad.get("CPUs")
+        self.siteCpus = siteCpus
+        self.siteCpusTime = time.time()
+        return siteCpus
+
+    def getCpus(self, site):
+        return self.getAllCpus().get(site, 0)
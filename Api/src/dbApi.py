@@ -11,8 +11,15 @@
 # If we can't connect to the databse an exception is thrown.
 # If a query fail we print an error message and return an empty list, leaving it up to caller to
 # abort or keep executing.
+#
+# Besides dbQuery there are:
+#  dbStream       -- generator over the rows of a large query, rows are fetched from the server in
+#                    chunks on a dedicated connection so memory use does not depend on the result size
+#  dbExecuteMany  -- bulk write, one executemany call per chunk of rows
+#  dbQueryCached  -- dbQuery with the result kept in memory for repeated read-only lookups (site and
+#                    dataset id maps etc.), the cache is cleared by every write through this api
 #---------------------------------------------------------------------------------------------------
-import os, MySQLdb, ConfigParser
+import os, time, MySQLdb, MySQLdb.cursors, ConfigParser
 from email.MIMEText import MIMEText
 from email.MIMEMultipart import MIMEMultipart
 from email.Utils import formataddr
@@ -24,20 +31,28 @@ class dbApi():
         config.read(os.path.join(os.path.dirname(__file__), 'api.cfg'))
         self.fromEmail = config.items('from_email')[0]
         self.toEmails = config.items('error_emails')
-        host = config.get('db', 'host')
-        db = config.get('db', 'db')
-        user = config.get('db', 'username')
-        passwd = config.get('db', 'password')
+        self.connectArgs = {'host': config.get('db', 'host'), 'db': config.get('db', 'db'),
+                            'user': config.get('db', 'username'),
+                            'passwd': config.get('db', 'password')}
+        self.dbCon = self.connect()
+        # (query, values) -> (time, data)
+        self.cache = dict()
+
+    def connect(self, cursorclass=None):
+        args = dict(self.connectArgs)
+        if cursorclass:
+            args['cursorclass'] = cursorclass
         # Will try to connect 3 times before reporting an error
         for attempt in range(3):
             try:
-                self.dbCon = MySQLdb.connect(host=host, user=user, passwd=passwd, db=db)
+                dbCon = MySQLdb.connect(**args)
             except MySQLdb.Error, e:
                 continue
             else:
                 break
         else:
             self.error(e.args[1])
+        return dbCon
 
     def error(self, e):
         title = "FATAL IntelROCCS Error -- MIT Database"
@@ -64,18 +79,24 @@ class dbApi():
 #===================================================================================================
 #  M A I N   F U N C T I O N
 #===================================================================================================
+    def _values(self, values):
+        # numbers and NULL are passed as they are, everything else as string
+        return tuple([value if value is None or isinstance(value, (int, long, float)) else str(value)
+                      for value in values])
+
     def dbQuery(self, query, values=()):
         data = []
         e = ""
-        values = tuple([str(value) for value in values])
+        values = self._values(values)
+        if not query.lstrip().upper().startswith('SELECT'):
+            self.cache.clear()
         # Will try to call db 3 times before reporting an error
         for attempt in range(3):
             try:
                 with self.dbCon:
                     cur = self.dbCon.cursor()
                     cur.execute(query, values)
-                    for row in cur:
-                        data.append(row)
+                    data = list(cur.fetchall())
             except MySQLdb.Error, err:
                 e = err.args[1]
                 continue
@@ -87,3 +108,82 @@ class dbApi():
         else:
             self.error(e)
         return data
+
+    def dbStream(self, query, values=(), chunkSize=10000):
+        # rows are yielded as they come from the server, a failed query is retried only as long as
+        # no row has been returned to the caller
+        e = ""
+        values = self._values(values)
+        for attempt in range(3):
+            dbCon = None
+            nRows = 0
+            try:
+                dbCon = self.connect(MySQLdb.cursors.SSCursor)
+                cur = dbCon.cursor()
+                cur.execute(query, values)
+                while True:
+                    rows = cur.fetchmany(chunkSize)
+                    if not rows:
+                        break
+                    for row in rows:
+                        nRows += 1
+                        yield row
+                cur.close()
+            except MySQLdb.Error, err:
+                e = err.args[1]
+                if nRows > 0:
+                    break
+                continue
+            except TypeError, err:
+                e = err
+                continue
+            else:
+                return
+            finally:
+                if dbCon:
+                    dbCon.close()
+        self.error(e)
+
+    def dbExecuteMany(self, query, rows, chunkSize=1000):
+        # one executemany per chunk (for INSERTs MySQLdb sends a chunk as one multi-row statement),
+        # each chunk is committed on its own and retried 3 times, returns the number of affected rows
+        nAffected = 0
+        self.cache.clear()
+        chunk = []
+        for row in rows:
+            chunk.append(self._values(row))
+            if len(chunk) >= chunkSize:
+                nAffected += self._executeChunk(query, chunk)
+                chunk = []
+        if chunk:
+            nAffected += self._executeChunk(query, chunk)
+        return nAffected
+
+    def _executeChunk(self, query, chunk):
+        e = ""
+        for attempt in range(3):
+            try:
+                with self.dbCon:
+                    cur = self.dbCon.cursor()
+                    nAffected = cur.executemany(query, chunk)
+            except MySQLdb.Error, err:
+                e = err.args[1]
+                continue
+            except TypeError, err:
+                e = err
+                continue
+            else:
+                return nAffected or 0
+        self.error(e)
+
+    def dbQueryCached(self, query, values=(), ttl=600):
+        # only for read-only lookups, the caller gets its own copy of the cached rows
+        key = (query, self._values(values))
+        if key in self.cache and time.time() - self.cache[key][0] < ttl:
+            return list(self.cache[key][1])
+        data = self.dbQuery(query, values)
+        self.cache[key] = (time.time(), data)
+        return list(data)
+
+    def clearCache(self):
+        self.cache.clear()
@@ -0,0 +1,60 @@
+#!/usr/local/bin/python
+#---------------------------------------------------------------------------------------------------
+# Local stand-in for the HTCondor collector and schedulers, to test crabApi without a pool and
+# without the HTCondor bindings. Constraints are not evaluated, every scheduler returns all its job
+# ads and the collector all its startd ads.
+#
+# Example:
+#   collector = fakeCondor.fakeCollector(schedds={'crab3@vocms1': [{'CRAB_InputData': '/A/B/C'}]},
+#                                        startds=[{'GLIDEIN_CMSSite': 'T2_US_MIT', 'CPUs': 8}])
+#   crab = crabApi.crabApi(collector=collector, scheddFactory=collector.schedd)
+#---------------------------------------------------------------------------------------------------
+import time, threading
+
+class fakeSchedd():
+    def __init__(self, name, ads, delay=0):
+        self.name = name
+        self.ads = ads
+        self.delay = delay
+
+    def xquery(self, query='', attributes=[]):
+        # ads are handed out one by one, like the real xquery
+        if self.delay > 0:
+            time.sleep(self.delay)
+        for ad in self.ads:
+            yield dict(ad)
+
+    def query(self, query='', attributes=[]):
+        return list(self.xquery(query, attributes))
+
+class fakeCollector():
+    def __init__(self, schedds=None, startds=None, delays=None, failures=None):
+        # schedds: name -> job ads, delays: name -> seconds before answering,
+        # failures: name -> number of queries failing with IOError before one succeeds
+        self.schedds = schedds if schedds is not None else {}
+        self.startds = startds if startds is not None else []
+        self.delays = delays if delays is not None else {}
+        self.failures = dict(failures) if failures is not None else {}
+        self.lock = threading.Lock()
+        self.nQueries = 0
+
+    def locateAll(self, types):
+        return [{'Name': name, 'MyType': 'Scheduler'} for name in sorted(self.schedds)]
+
+    def query(self, types, query='', attributes=[]):
+        self.lock.acquire()
+        self.nQueries += 1
+        self.lock.release()
+        return [dict(ad) for ad in self.startds]
+
+    def schedd(self, location):
+        # scheduler factory for crabApi, takes the ad returned by locateAll
+        name = location['Name']
+        self.lock.acquire()
+        try:
+            if self.failures.get(name, 0) > 0:
+                self.failures[name] -= 1
+                raise IOError("Failed to connect to scheduler %s" % (name))
+        finally:
+            self.lock.release()
+        return fakeSchedd(name, self.schedds[name], self.delays.get(name, 0))
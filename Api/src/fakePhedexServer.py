@@ -0,0 +1,221 @@
+#!/usr/local/bin/python
+#---------------------------------------------------------------------------------------------------
+# Offline fake of the PhEDEx data service, to benchmark the PhEDEx clients without network access or
+# grid proxy. It answers all calls of the data service (/phedex/datasvc/json/<instance>/<call>)
+# with small canned JSON replies, supports keep-alive and gzip and, given a certificate, HTTPS.
+# --delay adds a server side latency (in ms) to every reply.
+#
+# A self-signed certificate for the HTTPS benchmark can be made with:
+#   openssl req -x509 -nodes -newkey rsa:2048 -days 1 -subj /CN=localhost \
+#               -keyout fake.key -out fake.crt
+#
+# Run a server:
+#   ./fakePhedexServer.py --port=8443 --cert=fake.crt --key=fake.key
+# Compare a new connection per call (as urllib2 did) with the shared phedexClient:
+#   ./fakePhedexServer.py --benchmark --calls=500 --threads=4 --cert=fake.crt --key=fake.key
+#---------------------------------------------------------------------------------------------------
+import sys, getopt, json, gzip, ssl, threading, time, urllib, urllib2, urlparse, StringIO
+import BaseHTTPServer, SocketServer
+import phedexClient
+
+class fakePhedexHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1 and a content length on every reply, the reply is buffered and sent
+    # in one go (line by line writes run into delayed ACKs on persistent connections)
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    delay = 0.
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, call, values):
+        dataset = values.get('dataset', '/Fake/Dataset-v1/AOD')
+        node = values.get('node', 'T2_XX_Fake')
+        replies = {
+            'data': {'dbs': [{'name': 'fake', 'dataset': [{'name': dataset, 'is_open': 'n',
+                                                             'block': []}]}]},
+            'blockreplicas': {'block': [{'name': dataset + '#1', 'bytes': 10**9, 'dataset': dataset,
+                                         'replica': [{'node': node, 'group': 'AnalysisOps'}]}]},
+            'subscriptions': {'dataset': [{'name': dataset, 'subscription': [
+                        {'node': node, 'level': 'DATASET', 'group': 'AnalysisOps'}]}]},
+            'subscribe': {'request_created': [{'id': 1}]},
+            'delete': {'request_created': [{'id': 2}]},
+            'updatesubscription': {'dataset': [{'name': dataset}]},
+            'deletions': {'dataset': []},
+            }
+        if call not in replies:
+            return None
+        return json.dumps({'phedex': replies[call]})
+
+    def answer(self, values):
+        if self.delay > 0:
+            time.sleep(self.delay)
+        call = self.path.split('?')[0].rstrip('/').split('/')[-1]
+        body = self.reply(call, values)
+        status = 200
+        if body is None:
+            status = 400
+            body = 'unknown call %s' % (call)
+        headers = {'Content-Type': 'application/json'}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buffer = StringIO.StringIO()
+            gzipFile = gzip.GzipFile(fileobj=buffer, mode='wb')
+            gzipFile.write(body)
+            gzipFile.close()
+            body = buffer.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        for key in headers:
+            self.send_header(key, headers[key])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = ''
+        if '?' in self.path:
+            query = self.path.split('?', 1)[1]
+        self.answer(dict(urlparse.parse_qsl(query, keep_blank_values=True)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.answer(dict(urlparse.parse_qsl(self.rfile.read(length), keep_blank_values=True)))
+
+class fakePhedexServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # clients dropping their connections are normal here
+        pass
+
+def startServer(port=0, cert='', key='', delay=0.):
+    """
+    _startServer_
+
+    Start the fake server in a background thread, return the server and its base url.
+    """
+    fakePhedexHandler.delay = delay
+    server = fakePhedexServer(('localhost', port), fakePhedexHandler)
+    scheme = 'http'
+    if cert:
+        server.socket = ssl.wrap_socket(server.socket, certfile=cert, keyfile=key or None,
+                                        server_side=True)
+        scheme = 'https'
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base = '%s://localhost:%d/phedex/datasvc' % (scheme, server.server_address[1])
+    return server, base
+
+#===================================================================================================
+#  B E N C H M A R K
+#===================================================================================================
+def runCalls(callOne, nCalls, nThreads):
+    # run nCalls calls spread over nThreads threads, return the wall time
+    counter = {'left': nCalls}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            lock.acquire()
+            if counter['left'] <= 0:
+                lock.release()
+                return
+            counter['left'] -= 1
+            lock.release()
+            callOne()
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for i in range(nThreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+def benchmark(base, nCalls, nThreads):
+    url = base + '/json/prod/blockreplicas'
+    values = {'dataset': '/Fake/Dataset-v1/AOD', 'node': 'T2_XX_Fake'}
+    context = None
+    try:
+        context = ssl._create_unverified_context()
+    except AttributeError:
+        pass
+
+    # the old way: a new connection (and TLS handshake) for every call
+    def newConnectionCall():
+        request = urllib2.Request(url, urllib.urlencode(values))
+        if url.startswith('https') and context is not None:
+            response = urllib2.urlopen(request, context=context)
+        else:
+            response = urllib2.urlopen(request)
+        json.loads(response.read())
+
+    client = phedexClient.phedexClient(context=context, maxConnections=nThreads)
+
+    def pooledCall():
+        status, body = client.call(url, values)
+        json.loads(body)
+
+    print " Benchmark: %d calls to %s with %d threads" % (nCalls, url, nThreads)
+    for name, callOne in (('new connection per call', newConnectionCall),
+                          ('shared phedexClient', pooledCall)):
+        wall = runCalls(callOne, nCalls, nThreads)
+        print "   %-24s %8.3f s  %8.1f calls/s" % (name, wall, nCalls/wall)
+    print "   phedexClient opened %d connections for %d requests" % \
+        (client.nConnections, client.nRequests)
+    client.close()
+
+#===================================================================================================
+#  M A I N
+#===================================================================================================
+if __name__ == '__main__':
+    usage  = " Usage: fakePhedexServer.py [ --port=0 ] [ --cert=<file> --key=<file> ] [ --delay=0 ]\n"
+    usage += "                            [ --benchmark [ --calls=200 ] [ --threads=1 ] ]\n"
+    valid = ['port=', 'cert=', 'key=', 'delay=', 'benchmark', 'calls=', 'threads=', 'help']
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", valid)
+    except getopt.GetoptError, ex:
+        print usage
+        print str(ex)
+        sys.exit(1)
+
+    port = 0
+    cert = ''
+    key = ''
+    delay = 0.
+    bench = False
+    nCalls = 200
+    nThreads = 1
+    for opt, arg in opts:
+        if opt == "--help":
+            print usage
+            sys.exit(0)
+        if opt == "--port":
+            port = int(arg)
+        if opt == "--cert":
+            cert = arg
+        if opt == "--key":
+            key = arg
+        if opt == "--delay":
+            delay = float(arg)/1000.
+        if opt == "--benchmark":
+            bench = True
+        if opt == "--calls":
+            nCalls = int(arg)
+        if opt == "--threads":
+            nThreads = int(arg)
+
+    server, base = startServer(port, cert, key, delay)
+    if bench:
+        benchmark(base, nCalls, nThreads)
+        server.shutdown()
+        sys.exit(0)
+
+    print " Fake PhEDEx data service at %s (Ctrl-C to stop)" % (base)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
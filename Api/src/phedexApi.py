@@ -18,12 +18,19 @@
 # If a valid call is made but no data was found a JSON structure is still returned, it is up to
 # the caller to check for actual data.
 #---------------------------------------------------------------------------------------------------
-import os, urllib, urllib2, httplib, json, ConfigParser
+import os, json, ConfigParser
+import phedexClient
 from email.MIMEText import MIMEText
 from email.MIMEMultipart import MIMEMultipart
 from email.Utils import formataddr
 from subprocess import Popen, PIPE
 
+def getProxy():
+    proxy = os.environ.get('X509_USER_PROXY')
+    if not proxy:
+        proxy = "/tmp/x509up_u%d" % (os.geteuid(),)
+    return proxy
+
 class phedexApi:
     def __init__(self):
         config = ConfigParser.RawConfigParser()
@@ -31,38 +38,35 @@ class phedexApi:
         self.fromEmail = config.items('from_email')[0]
         self.toEmails = config.items('error_emails')
         self.phedexBase = config.get('phedex', 'base')
+        self.client = phedexClient.getClient(getProxy())
 
 #===================================================================================================
 #  H E L P E R S
 #===================================================================================================
-    def call(self, url, values):
-        data = urllib.urlencode(values)
-        opener = urllib2.build_opener(HTTPSGridAuthHandler())
-        request = urllib2.Request(url, data)
-        strout = ""
+    def call(self, url, values, readOnly=True):
+        # connection problems and server errors of read-only calls are already retried by the shared
+        # client, here we only retry read-only calls with a bad answer, calls which change something
+        # are made once
+        jsonData = ""
         e = ""
         msg = ""
-        # Will try to call 3 times before reporting an error
-        for attempt in range(3):
+        for attempt in range(3 if readOnly else 1):
             try:
-                strout = opener.open(request)
-                response = strout.read()
-                jsonData = json.loads(response)
-            except urllib2.HTTPError, err:
+                status, response = self.client.call(url, values, idempotent=readOnly)
+            except phedexClient.phedexClientError, err:
                 e = err
-                msg = e.read()
-                continue
-            except urllib2.URLError, err:
-                e = err
-                msg = e.read()
+                break
+            if status != 200:
+                e = "HTTP status %d" % (status)
+                msg = response
                 continue
+            try:
+                jsonData = json.loads(response)
             except ValueError, err:
                 e = err
                 continue
-            else:
-                break
-        else:
-            self.error(e, msg)
+            return jsonData
+        self.error(e, msg)
         return jsonData
 
     def error(self, e, errMsg):
@@ -147,7 +151,7 @@ class phedexApi:
         values = {'node':node, 'data':data, 'level':level, 'rm_subscriptions':rm_subscriptions, 'comments':comments}
         url = "%s/json/%s/delete" % (self.phedexBase, instance)
         try:
-            jsonData = self.call(url, values)
+            jsonData = self.call(url, values, readOnly=False)
         except Exception:
             self.error("ERROR -- delete call failed", "values: node=%s, level=%s, rm_subscriptions=%s, comments=%s, instance=%s\n" % (node, level, rm_subscriptions, comments, instance))
         return jsonData
@@ -183,7 +187,7 @@ class phedexApi:
         values = {'node':node, 'data':data, 'level':level, 'priority':priority, 'move':move, 'static':static, 'custodial':custodial, 'group':group, 'time_start':time_start, 'request_only':request_only, 'no_mail':no_mail, 'comments':comments}
         url = "%s/json/%s/subscribe" % (self.phedexBase, instance)
         try:
-            jsonData = self.call(url, values)
+            jsonData = self.call(url, values, readOnly=False)
         except Exception:
             self.error("ERROR -- subscribe call failed", "values: node=%s, data=%s, level=%s, priority=%s, move=%s, static=%s, custodial=%s, group=%s, time_start=%s, request_only=%s, no_mail=%s, comments=%s, instance=%s\n" % (node, data, level, priority, move, static, custodial, group, time_start, request_only, no_mail, comments, instance))
         return jsonData
@@ -210,28 +214,7 @@ class phedexApi:
         values = {'decision':decision, 'request':request, 'node':node, 'comments':comments}
         url = "%s/json/%s/updaterequests" % (self.phedexBase, instance)
         try:
-            jsonData = self.call(url, values)
+            jsonData = self.call(url, values, readOnly=False)
         except Exception:
             self.error("ERROR -- updateRequest call failed", "values: decision=%s, request=%s, node=%s, comments=%s, instance=%s\n" % (decision, request, node, comments, instance))
         return jsonData
-
-#===================================================================================================
-#  H E L P E R   C L A S S
-#===================================================================================================
-class HTTPSGridAuthHandler(urllib2.HTTPSHandler):
-    def __init__(self):
-        urllib2.HTTPSHandler.__init__(self)
-        self.key = self.getProxy()
-        self.cert = self.key
-
-    def https_open(self, req):
-        return self.do_open(self.getConnection, req)
-
-    def getProxy(self):
-        proxy = os.environ.get('X509_USER_PROXY')
-        if not proxy:
-            proxy = "/tmp/x509up_u%d" % (os.geteuid(),)
-        return proxy
-
-    def getConnection(self, host, timeout=300):
-        return httplib.HTTPSConnection(host, key_file=self.key, cert_file=self.cert)
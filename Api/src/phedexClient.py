@@ -0,0 +1,234 @@
+#!/usr/bin/python
+#---------------------------------------------------------------------------------------------------
+#
+# HTTPS client shared by all PhEDEx API implementations (Api, Detox, Undertaker, DataDealer). Every
+# call used to build a new urllib2 opener, which means a new TCP connection and a new TLS handshake
+# with the grid proxy. This client keeps a pool of persistent connections per host, asks for gzip
+# transfer, uses request timeouts, retries failed calls with exponential backoff and limits the
+# number of concurrent requests per host. Only read-only calls are retried, a call that changes
+# something (subscribe, delete, ...) could otherwise be made twice.
+#
+# This is the only copy: the Detox and Undertaker install scripts copy it next to their modules, the
+# local setups and DataDealer import it from here.
+#
+# Usage:
+#   client = phedexClient.getClient(proxy)
+#   status, body = client.call(url, values)
+#   status, body = client.call(url, values, idempotent=False)   (subscribe, delete, ...)
+#
+#---------------------------------------------------------------------------------------------------
+import socket, ssl, threading, time, urllib, urlparse, httplib, zlib
+
+####################################################################################################
+#
+#                                  P h E D E x   C L I E N T
+#
+####################################################################################################
+class phedexClientError(Exception):
+    """
+    _phedexClientError_
+
+    Raised when a call could not be completed, not even after all retries.
+    """
+    pass
+
+class phedexClient:
+    """
+    _phedexClient_
+
+    Persistent connection pool for PhEDEx calls.
+
+    Class variables:
+    certFile       -- Certificate (grid proxy) for the server, None for no client certificate
+    keyFile        -- Key connected to the certificate
+    timeout        -- Socket timeout of every request in seconds
+    maxConnections -- Maximum number of concurrent requests per host
+    retries        -- Number of attempts for a call
+    backoff        -- Wait before the first retry in seconds, doubled for every further retry
+    context        -- SSL context for the connections (default: the standard one)
+    """
+    def __init__(self, certFile=None, keyFile=None, timeout=300, maxConnections=4, retries=3,
+                 backoff=1.0, context=None):
+        self.certFile = certFile
+        self.keyFile = keyFile
+        self.timeout = timeout
+        self.maxConnections = maxConnections
+        self.retries = retries
+        self.backoff = backoff
+        self.context = context
+
+        # (scheme, host) -> idle connections and semaphore limiting the requests
+        self.idle = {}
+        self.slots = {}
+        self.lock = threading.Lock()
+
+        # simple counters, useful for benchmarking
+        self.nConnections = 0
+        self.nRequests = 0
+
+    ############################################################################
+    #                                                                          #
+    #                      C O N N E C T I O N   P O O L                       #
+    #                                                                          #
+    ############################################################################
+    def getSlot(self, scheme, host):
+        self.lock.acquire()
+        try:
+            if (scheme, host) not in self.slots:
+                self.slots[(scheme, host)] = threading.BoundedSemaphore(self.maxConnections)
+                self.idle[(scheme, host)] = []
+            return self.slots[(scheme, host)]
+        finally:
+            self.lock.release()
+
+    def getConnection(self, scheme, host):
+        self.lock.acquire()
+        try:
+            if len(self.idle[(scheme, host)]) > 0:
+                return self.idle[(scheme, host)].pop()
+            self.nConnections += 1
+        finally:
+            self.lock.release()
+
+        if scheme == 'http':
+            return httplib.HTTPConnection(host, timeout=self.timeout)
+        if self.context is not None:
+            return httplib.HTTPSConnection(host, key_file=self.keyFile, cert_file=self.certFile,
+                                           timeout=self.timeout, context=self.context)
+        return httplib.HTTPSConnection(host, key_file=self.keyFile, cert_file=self.certFile,
+                                       timeout=self.timeout)
+
+    def releaseConnection(self, scheme, host, connection):
+        self.lock.acquire()
+        try:
+            self.idle[(scheme, host)].append(connection)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """
+        _close_
+
+        Close all idle connections.
+        """
+        self.lock.acquire()
+        try:
+            for key in self.idle:
+                for connection in self.idle[key]:
+                    connection.close()
+                self.idle[key] = []
+        finally:
+            self.lock.release()
+
+    ############################################################################
+    #                                                                          #
+    #                                  C A L L                                 #
+    #                                                                          #
+    ############################################################################
+    def request(self, scheme, host, path, data, headers, idempotent=True):
+        # one attempt on a pooled connection, a connection the server closed while idle is replaced
+        # once without counting as a failed attempt, calls which are not idempotent only if the
+        # request could not be sent
+        for attempt in range(2):
+            connection = self.getConnection(scheme, host)
+            reused = connection.sock is not None
+            sent = False
+            try:
+                if data is None:
+                    connection.request('GET', path, headers=headers)
+                else:
+                    connection.request('POST', path, data, headers)
+                sent = True
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error, ssl.SSLError):
+                connection.close()
+                if reused and attempt == 0 and (idempotent or not sent):
+                    continue
+                raise
+            if response.getheader('connection', '').lower() == 'close' or response.will_close:
+                connection.close()
+            else:
+                self.releaseConnection(scheme, host, connection)
+            if response.getheader('content-encoding', '').lower() == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            return response.status, body
+
+    def call(self, url, values=None, method='POST', idempotent=None):
+        """
+        _call_
+
+        Make a call to url with the given values (dictionary), as POST form data or GET query.
+        For idempotent calls (default: GET calls only) server errors (5xx) and connection problems
+        are retried with backoff, other calls are made once. Other HTTP errors are returned to the
+        caller.
+
+        Return values:
+        1 -- HTTP status
+        2 -- Response body (uncompressed)
+        """
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        data = None
+        if values is None:
+            values = {}
+        if method == 'GET':
+            query = '&'.join([q for q in (parts.query, urllib.urlencode(values)) if q])
+            if query:
+                path = path + '?' + query
+        else:
+            data = urllib.urlencode(values)
+            if parts.query:
+                path = path + '?' + parts.query
+        headers = {'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        if idempotent is None:
+            idempotent = (method == 'GET')
+        attempts = self.retries if idempotent else 1
+
+        slot = self.getSlot(parts.scheme, parts.netloc)
+        error = ''
+        for attempt in range(attempts):
+            if attempt > 0:
+                time.sleep(self.backoff * 2**(attempt-1))
+            slot.acquire()
+            try:
+                self.nRequests += 1
+                status, body = self.request(parts.scheme, parts.netloc, path, data, headers,
+                                            idempotent)
+            except (httplib.HTTPException, socket.error, ssl.SSLError), e:
+                error = "%s: %s" % (e.__class__.__name__, str(e))
+                continue
+            finally:
+                slot.release()
+            if status >= 500:
+                error = "HTTP status %d: %s" % (status, body[:500])
+                continue
+            return status, body
+        raise phedexClientError("Call to %s failed after %d attempts (%s)" % \
+                                (url, attempts, error))
+
+####################################################################################################
+#
+#                      O N E   C L I E N T   P E R   C E R T I F I C A T E
+#
+####################################################################################################
+sharedClients = {}
+sharedClientsLock = threading.Lock()
+
+def getClient(proxy=None):
+    """
+    _getClient_
+
+    Return the client of this process for the given grid proxy (used as certificate and key), so all
+    PhEDEx calls of a process share the connections.
+    """
+    sharedClientsLock.acquire()
+    try:
+        if proxy not in sharedClients:
+            sharedClients[proxy] = phedexClient(certFile=proxy, keyFile=proxy)
+        return sharedClients[proxy]
+    finally:
+        sharedClientsLock.release()
@@ -19,6 +19,8 @@ class phedexData:
         self.phedexCache = config.get('phedex', 'cache')
         self.cacheDeadline = config.getint('phedex', 'expiration_timer')
         self.phedexApi = phedexApi.phedexApi()
+        # apiCall -> (connection, version of the cache file)
+        self.caches = dict()
 
 #===================================================================================================
 #  H E L P E R S
@@ -43,9 +45,6 @@ class phedexData:
     def updateCache(self, apiCall):
         if not os.path.exists(self.phedexCache):
             os.makedirs(self.phedexCache)
-        cacheFile = "%s/%s.db" % (self.phedexCache, apiCall)
-        if os.path.isfile(cacheFile):
-            os.remove(cacheFile)
         jsonData = ""
         # can easily extend this to support more api calls
         if apiCall == "blockReplicas":
@@ -56,150 +55,160 @@ class phedexData:
             self.buildBlockReplicasCache(jsonData)
         return 0
 
+    def getCache(self, apiCall):
+        # open connection to the up to date cache, None if the cache could not be updated
+        # the connection is kept as long as the cache file is not replaced, this way sqlite keeps the
+        # compiled statements of the queries
+        if self.shouldAccessPhedex(apiCall):
+            # update
+            error = self.updateCache(apiCall)
+            if error:
+                return None
+        cacheFile = "%s/%s.db" % (self.phedexCache, apiCall)
+        stat = os.stat(cacheFile)
+        version = (stat.st_ino, stat.st_mtime)
+        if apiCall in self.caches and self.caches[apiCall][1] == version:
+            return self.caches[apiCall][0]
+        if apiCall in self.caches:
+            self.caches[apiCall][0].close()
+        cache = sqlite3.connect(cacheFile)
+        self.caches[apiCall] = (cache, version)
+        return cache
+
     def buildBlockReplicasCache(self, jsonData):
+        # the new cache is built next to the old one, with bulk inserts in a single transaction and
+        # without syncing, indexes are only created after the load. The finished database replaces
+        # the old one in one rename, so readers never see a partial cache.
         cacheFile = "%s/%s.db" % (self.phedexCache, 'blockReplicas')
-        if os.path.isfile(cacheFile):
-            os.remove(cacheFile)
-        blockReplicasCache = sqlite3.connect(cacheFile)
+        tmpFile = "%s.%d.tmp" % (cacheFile, os.getpid())
+        if os.path.isfile(tmpFile):
+            os.remove(tmpFile)
+        blockReplicasCache = sqlite3.connect(tmpFile)
+        blockReplicasCache.execute('PRAGMA journal_mode=WAL')
+        blockReplicasCache.execute('PRAGMA synchronous=OFF')
+        datasets = jsonData.get('phedex').get('dataset')
+        datasetIds = dict()
+
+        def datasetRows():
+            for dataset in datasets:
+                datasetName = dataset.get('name')
+                #if re.match('.+/USER', datasetName):
+                #   continue
+                sizeBytes = 0
+                for block in dataset.get('block'):
+                    sizeBytes += int(block.get('bytes'))
+                sizeGb = float(sizeBytes)/10**9
+                datasetId = datasetIds.setdefault(datasetName, len(datasetIds) + 1)
+                yield (datasetId, datasetName, sizeGb)
+
+        def replicaRows():
+            for dataset in datasets:
+                datasetId = datasetIds[dataset.get('name')]
+                for replica in dataset.get('block')[0].get('replica'):
+                    yield (replica.get('node'), datasetId, replica.get('group'))
+
         with blockReplicasCache:
             cur = blockReplicasCache.cursor()
             cur.execute('CREATE TABLE Datasets (DatasetId INTEGER PRIMARY KEY AUTOINCREMENT, DatasetName TEXT UNIQUE, SizeGb INTEGER)')
             cur.execute('CREATE TABLE Replicas (SiteName TEXT, DatasetId INTEGER, GroupName TEXT, FOREIGN KEY(DatasetId) REFERENCES Datasets(DatasetId))')
-        datasets = jsonData.get('phedex').get('dataset')
-        for dataset in datasets:
-            datasetName = dataset.get('name')
-            #if re.match('.+/USER', datasetName):
-            #   continue
-            sizeBytes = 0
-            for block in dataset.get('block'):
-                sizeBytes += int(block.get('bytes'))
-            sizeGb = float(sizeBytes)/10**9
-            with blockReplicasCache:
-                cur = blockReplicasCache.cursor()
-                cur.execute('INSERT OR REPLACE INTO Datasets(DatasetName, SizeGb) VALUES(?, ?)', (datasetName, sizeGb))
-                datasetId = cur.lastrowid
-                for replica in dataset.get('block')[0].get('replica'):
-                    siteName = replica.get('node')
-                    groupName = replica.get('group')
-                    cur.execute('INSERT INTO Replicas(SiteName, DatasetId, GroupName) VALUES(?, ?, ?)', (siteName, datasetId, groupName))
+            cur.executemany('INSERT OR REPLACE INTO Datasets(DatasetId, DatasetName, SizeGb) VALUES(?, ?, ?)', datasetRows())
+            cur.executemany('INSERT INTO Replicas(SiteName, DatasetId, GroupName) VALUES(?, ?, ?)', replicaRows())
+            cur.execute('CREATE INDEX ReplicasSiteGroup ON Replicas (SiteName, GroupName, DatasetId)')
+            cur.execute('CREATE INDEX ReplicasGroup ON Replicas (GroupName, DatasetId)')
+            cur.execute('CREATE INDEX ReplicasDataset ON Replicas (DatasetId, GroupName)')
+        # back to a single file before it is moved into place
+        blockReplicasCache.execute('PRAGMA journal_mode=DELETE')
+        blockReplicasCache.close()
+        os.rename(tmpFile, cacheFile)
 
     def getAllDatasets(self):
         datasets = ""
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return datasets
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return datasets
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT DISTINCT DatasetName FROM Datasets NATURAL JOIN Replicas WHERE GroupName=?', ('AnalysisOps',))
-            datasets = []
-            for row in cur:
-                if re.match('.+/USER', row[0]):
-                    continue
-                datasets.append(row[0])
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT DatasetName FROM Datasets WHERE DatasetId IN (SELECT DatasetId FROM Replicas WHERE GroupName=?)', ('AnalysisOps',))
+        datasets = []
+        for row in cur:
+            if re.match('.+/USER', row[0]):
+                continue
+            datasets.append(row[0])
         return datasets
 
     def getAnalysisOpsDatasetsAtSite(self, siteName):
         datasets = []
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return datasets
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return datasets
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT DISTINCT DatasetName FROM Datasets NATURAL JOIN Replicas WHERE GroupName=? and SiteName=?', ('AnalysisOps', siteName))
-            datasets = []
-            for row in cur:
-                if re.match('.+/USER', row[0]):
-                    continue
-                datasets.append(row[0])
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT DatasetName FROM Datasets WHERE DatasetId IN (SELECT DatasetId FROM Replicas WHERE SiteName=? AND GroupName=?)', (siteName, 'AnalysisOps'))
+        for row in cur:
+            if re.match('.+/USER', row[0]):
+                continue
+            datasets.append(row[0])
         return datasets
 
     def getSitesWithDataset(self, datasetName):
-        datasets = []
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return datasets
+        sites = []
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return sites
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT DISTINCT SiteName FROM Replicas NATURAL JOIN Datasets WHERE DatasetName=?', (datasetName,))
-            sites = []
-            for row in cur:
-                sites.append(row[0])
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT DISTINCT Replicas.SiteName FROM Datasets JOIN Replicas ON Replicas.DatasetId=Datasets.DatasetId WHERE Datasets.DatasetName=?', (datasetName,))
+        for row in cur:
+            sites.append(row[0])
         return sites
 
     def getDatasetSize(self, datasetName):
         sizeGb = 1000000
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return sizeGb
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return sizeGb
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT SizeGb FROM Datasets WHERE DatasetName=?', (datasetName,))
-            row = cur.fetchone()
-            if row:
-                sizeGb = row[0]
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT SizeGb FROM Datasets WHERE DatasetName=?', (datasetName,))
+        row = cur.fetchone()
+        if row:
+            sizeGb = row[0]
         return sizeGb
 
     def getNumberReplicas(self, datasetName):
         replicas = 100
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return replicas
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return replicas
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT count(*) FROM Replicas NATURAL JOIN Datasets WHERE Datasets.DatasetName=?', (datasetName,))
-            row = cur.fetchone()
-            if row:
-                replicas = row[0]
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT count(*) FROM Datasets JOIN Replicas ON Replicas.DatasetId=Datasets.DatasetId WHERE Datasets.DatasetName=?', (datasetName,))
+        row = cur.fetchone()
+        if row:
+            replicas = row[0]
         return replicas
 
     def getSiteReplicas(self, datasetName):
         sites = []
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return sites
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return sites
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT SiteName FROM Replicas NATURAL JOIN Datasets WHERE Datasets.DatasetName=? AND Replicas.GroupName=?', (datasetName, 'AnalysisOps'))
-            for row in cur:
-                sites.append(row[0])
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT Replicas.SiteName FROM Datasets JOIN Replicas ON Replicas.DatasetId=Datasets.DatasetId WHERE Datasets.DatasetName=? AND Replicas.GroupName=?', (datasetName, 'AnalysisOps'))
+        for row in cur:
+            sites.append(row[0])
         return sites
 
     def getSiteStorage(self, siteName):
         storageGb = 0
-        if self.shouldAccessPhedex('blockReplicas'):
-            # update
-            error = self.updateCache('blockReplicas')
-            if error:
-                return storageGb
+        blockReplicasCache = self.getCache('blockReplicas')
+        if blockReplicasCache is None:
+            return storageGb
         # access cache
-        blockReplicasCache = sqlite3.connect("%s/blockReplicas.db" % (self.phedexCache))
-        with blockReplicasCache:
-            cur = blockReplicasCache.cursor()
-            cur.execute('SELECT SizeGb FROM Datasets NATURAL JOIN Replicas WHERE Replicas.SiteName=? AND Replicas.GroupName=?', (siteName, 'AnalysisOps'))
-            for row in cur:
-                storageGb += row[0]
+        cur = blockReplicasCache.cursor()
+        cur.execute('SELECT SUM(Datasets.SizeGb) FROM Replicas JOIN Datasets ON Datasets.DatasetId=Replicas.DatasetId WHERE Replicas.SiteName=? AND Replicas.GroupName=?', (siteName, 'AnalysisOps'))
+        row = cur.fetchone()
+        if row and row[0]:
+            storageGb = row[0]
         return storageGb
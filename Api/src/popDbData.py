@@ -2,7 +2,7 @@
 #---------------------------------------------------------------------------------------------------
 # getPhedexData.py
 #---------------------------------------------------------------------------------------------------
-import os, sqlite3, ConfigParser, datetime, time
+import os, sqlite3, ConfigParser, datetime, time, threading, Queue
 import popDbApi
 
 class popDbData:
@@ -21,47 +21,87 @@ class popDbData:
         td = dt - epoch
         return td.seconds + td.days*86400
 
-    def buildDSStatInTimeWindowCache(self, siteNames, validDatasets):
+    def fetchDSStatInTimeWindows(self, windows, nThreads=8):
+        # fetch the DSStatInTimeWindow data of the (date, site) windows in parallel, results are
+        # returned through a queue as (date, siteName, jsonData), jsonData is None if the call failed
+        # (the api already reported it)
+        windowQueue = Queue.Queue()
+        for window in windows:
+            windowQueue.put(window)
+        resultQueue = Queue.Queue()
+
+        def worker():
+            while True:
+                try:
+                    date, siteName = windowQueue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    jsonData = self.popDbApi.DSStatInTimeWindow(tstart=date, tstop=date, sitename=siteName)
+                except Exception:
+                    jsonData = None
+                resultQueue.put((date, siteName, jsonData))
+
+        threads = []
+        for i in range(min(nThreads, windowQueue.qsize())):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads, resultQueue
+
+    def buildDSStatInTimeWindowCache(self, siteNames, validDatasets, nThreads=8):
+        # the cache keeps the last 14 days, every (date, site) window that was downloaded is recorded
+        # so later builds only fetch the missing windows
         if not os.path.exists(self.popDbCache):
             os.makedirs(self.popDbCache)
         cacheFile = "%s/%s.db" % (self.popDbCache, 'DSStatInTimeWindow')
         timeNow = time.time()
-        deltaNSeconds = 60*60*28
-        if os.path.isfile(cacheFile):
-            modTime = os.path.getmtime(cacheFile)
-            if (os.path.getsize(cacheFile)) == 0 or ((timeNow-deltaNSeconds) > modTime):
-                os.remove(cacheFile)
         deltaNSeconds = 60*60*self.cacheDeadline
-        if os.path.isfile(cacheFile):
+        if os.path.isfile(cacheFile) and os.path.getsize(cacheFile) > 0:
             modTime = os.path.getmtime(cacheFile)
-            if (timeNow-deltaNSeconds) > modTime:
-                days = [1]
-            else:
+            if (timeNow-deltaNSeconds) <= modTime:
                 return 0
-        else:
-            days = range(1, 15)
         popDbCache = sqlite3.connect(cacheFile)
         utcNow = datetime.datetime.utcnow()
         today = datetime.date(utcNow.year, utcNow.month, utcNow.day)
+        dates = [(today - datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(1, 15)]
         with popDbCache:
             cur = popDbCache.cursor()
             cur.execute('CREATE TABLE IF NOT EXISTS DSStatInTimeWindow(Date TEXT, SiteName TEXT, DatasetName TEXT, Accesses INTEGER, Cpus INTEGER, Users INTEGER)')
-            for siteName in siteNames:
-                for i in days:
-                    date = today - datetime.timedelta(days=i)
-                    tstart = date.strftime('%Y-%m-%d')
-                    tstop = tstart
-                    jsonData = self.popDbApi.DSStatInTimeWindow(tstart=tstop, tstop=tstop, sitename=siteName)
-                    siteName = jsonData.get('SITENAME')
-                    datasets = jsonData.get('DATA')
-                    for dataset in datasets:
-                        datasetName = dataset.get('COLLNAME')
-                        if datasetName not in validDatasets:
-                            continue
-                        accesses = dataset.get('NACC')
-                        cpus = dataset.get('TOTCPU')
-                        users = dataset.get('NUSERS')
-                        cur.execute('INSERT INTO DSStatInTimeWindow(Date, SiteName, DatasetName, Accesses, Cpus, Users) VALUES(?, ?, ?, ?, ?, ?)', (tstart, siteName, datasetName, accesses, cpus, users))
+            cur.execute('CREATE TABLE IF NOT EXISTS Windows(Date TEXT, SiteName TEXT, PRIMARY KEY (Date, SiteName))')
+            cur.execute('CREATE INDEX IF NOT EXISTS DSStatDatasetDate ON DSStatInTimeWindow (DatasetName, Date)')
+            cur.execute('CREATE INDEX IF NOT EXISTS DSStatSiteDate ON DSStatInTimeWindow (SiteName, Date)')
+            # forget everything that is out of the time window
+            cur.execute('DELETE FROM DSStatInTimeWindow WHERE Date<?', (dates[-1],))
+            cur.execute('DELETE FROM Windows WHERE Date<?', (dates[-1],))
+            cur.execute('SELECT Date, SiteName FROM Windows')
+            present = set(cur.fetchall())
+        windows = [(date, siteName) for siteName in siteNames for date in dates if (date, siteName) not in present]
+        if not windows:
+            os.utime(cacheFile, None)
+            return 0
+
+        threads, resultQueue = self.fetchDSStatInTimeWindows(windows, nThreads)
+        # the workers download, all writes happen here in one transaction per window
+        for i in range(len(windows)):
+            date, siteName, jsonData = resultQueue.get()
+            if not jsonData:
+                continue
+            rows = []
+            for dataset in jsonData.get('DATA'):
+                datasetName = dataset.get('COLLNAME')
+                if datasetName not in validDatasets:
+                    continue
+                rows.append((date, siteName, datasetName, dataset.get('NACC'), dataset.get('TOTCPU'), dataset.get('NUSERS')))
+            with popDbCache:
+                cur = popDbCache.cursor()
+                cur.execute('DELETE FROM DSStatInTimeWindow WHERE Date=? AND SiteName=?', (date, siteName))
+                cur.executemany('INSERT INTO DSStatInTimeWindow(Date, SiteName, DatasetName, Accesses, Cpus, Users) VALUES(?, ?, ?, ?, ?, ?)', rows)
+                cur.execute('INSERT OR REPLACE INTO Windows(Date, SiteName) VALUES(?, ?)', (date, siteName))
+        for thread in threads:
+            thread.join()
+        popDbCache.close()
         return 0
 
     def buildGetSingleDSstatCache(self, datasets):
@@ -92,6 +132,43 @@ class popDbData:
                 accesses = 0
         return accesses
 
+    def getDatasetMatrix(self, column, dates, datasetNames=None):
+        # sums of column per dataset and date for all given dates in one query, returns a dictionary
+        # datasetName -> list of values in the order of dates (0 if no data). Without datasetNames
+        # all datasets in the cache are returned. Bulk version of getDatasetAccesses/Cpus/Users for
+        # callers needing many datasets and dates, nothing in this tree calls it yet.
+        matrix = dict()
+        if datasetNames is not None:
+            for datasetName in datasetNames:
+                matrix[datasetName] = [0]*len(dates)
+        if not dates:
+            return matrix
+        dateIndex = dict()
+        for i, date in enumerate(dates):
+            dateIndex[date] = i
+        popDbCache = sqlite3.connect("%s/%s.db" % (self.popDbCache, 'DSStatInTimeWindow'))
+        with popDbCache:
+            cur = popDbCache.cursor()
+            sql = 'SELECT DatasetName, Date, sum(%s) FROM DSStatInTimeWindow WHERE Date IN (%s) GROUP BY DatasetName, Date' % (column, ','.join('?'*len(dates)))
+            cur.execute(sql, tuple(dates))
+            for datasetName, date, value in cur:
+                if datasetName not in matrix:
+                    if datasetNames is not None:
+                        continue
+                    matrix[datasetName] = [0]*len(dates)
+                matrix[datasetName][dateIndex[date]] = value or 0
+        popDbCache.close()
+        return matrix
+
+    def getDatasetAccessMatrix(self, dates, datasetNames=None):
+        return self.getDatasetMatrix('Accesses', dates, datasetNames)
+
+    def getDatasetCpuMatrix(self, dates, datasetNames=None):
+        return self.getDatasetMatrix('Cpus', dates, datasetNames)
+
+    def getDatasetUserMatrix(self, dates, datasetNames=None):
+        return self.getDatasetMatrix('Users', dates, datasetNames)
+
     def getDatasetCpus(self, date, datasetName):
         # access cache
         popDbCache = sqlite3.connect("%s/%s.db" % (self.popDbCache, 'DSStatInTimeWindow'))
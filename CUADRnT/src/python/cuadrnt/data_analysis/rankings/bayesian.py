@@ -22,7 +22,6 @@ Description: Bayesian based ranking algorithm
 import logging
 from sklearn.naive_bayes import GaussianNB
 from sklearn.linear_model import BayesianRidge
-from sklearn.externals import joblib
 
 # package modules
 from cuadrnt.data_analysis.rankings.generic import GenericRanking
@@ -36,13 +35,9 @@ class BayesianRanking(GenericRanking):
         GenericRanking.__init__(self, config)
         self.logger = logging.getLogger(__name__)
         self.name = 'bayesian'
-        for data_tier in self.data_tiers:
-            try:
-                self.clf_trend[data_tier] = joblib.load(self.data_path + '/' + self.name + '_trend_' + data_tier + '.pkl')
-                self.clf_avg[data_tier] = joblib.load(self.data_path + '/' + self.name + '_avg_' + data_tier + '.pkl')
-            except:
-                self.logger.info('%s classifier and regressor for data tier %s need to be trained', self.name, data_tier)
-                self.clf_trend[data_tier] = GaussianNB()
-                self.clf_avg[data_tier] = BayesianRidge()
-        self.train()
-        self.test()
+
+    def new_models(self):
+        """
+        Untrained classifier and regressor
+        """
+        return GaussianNB(), BayesianRidge()
@@ -7,17 +7,18 @@ Description: Generic class for all ranking algorithms
 
 # system modules
 import logging
+import os
 import datetime
-import json
-import math
 import numpy as np
 from sklearn.externals import joblib
 
 # package modules
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.data_management.tools.sites import SiteManager
 from cuadrnt.data_management.tools.datasets import DatasetManager
 from cuadrnt.data_management.tools.popularity import PopularityManager
 from cuadrnt.data_management.core.storage import StorageManager
+from cuadrnt.data_management.core.feature_store import FeatureStore
 
 class GenericRanking(object):
     """
@@ -26,64 +27,142 @@ class GenericRanking(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.sites = SiteManager(self.config)
-        self.datasets = DatasetManager(self.config)
-        self.popularity = PopularityManager(self.config)
-        self.storage = StorageManager(self.config)
         self.max_replicas = int(config['rocker_board']['max_replicas'])
         self.name = 'generic'
         self.data_path = self.config['paths']['data']
         self.data_tiers = config['tools']['valid_tiers'].split(',')
-        self.preprocessed_data = dict()
         self.clf_trend = dict()
         self.clf_avg = dict()
 
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
+
+    @lazy_property
+    def datasets(self):
+        """
+        Dataset manager, created on first use
+        """
+        return DatasetManager(self.config)
+
+    @lazy_property
+    def popularity(self):
+        """
+        Popularity manager, created on first use
+        """
+        return PopularityManager(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    @lazy_property
+    def feature_store(self):
+        """
+        Training data of all data tiers, opened on first use
+        """
+        return FeatureStore(self.data_path)
+
+    def new_models(self):
+        """
+        Untrained classifier and regressor, implemented by subclasses
+        Return (trend classifier, average regressor)
+        """
+        raise NotImplementedError
+
+    def model_file(self, model, data_tier):
+        """
+        File of a persisted trend classifier or average regressor
+        """
+        return self.data_path + '/' + self.name + '_' + model + '_' + data_tier + '.pkl'
+
+    def load_models(self, data_tier):
+        """
+        Load persisted classifier and regressor of a data tier on first use
+        Arrays in the pickles are memory mapped, not read into memory
+        Models which were never trained are trained now, normally this is done by ml_training
+        """
+        if (data_tier in self.clf_trend) and (data_tier in self.clf_avg):
+            return
+        try:
+            self.clf_trend[data_tier] = joblib.load(self.model_file('trend', data_tier), mmap_mode='r')
+            self.clf_avg[data_tier] = joblib.load(self.model_file('avg', data_tier), mmap_mode='r')
+        except (IOError, OSError, EOFError):
+            self.logger.warning('%s classifier and regressor for data tier %s need to be trained', self.name, data_tier)
+            self.train(data_tiers=[data_tier])
+
+    def predict_batch(self, features, data_tier):
+        """
+        Predict trend and average for all feature rows of a data tier in one call
+        Return arrays of trend and average predictions, one entry per row
+        """
+        self.load_models(data_tier)
+        features = np.asarray(features, dtype=float)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        trends = self.clf_trend[data_tier].predict(features)
+        avgs = self.clf_avg[data_tier].predict(features)
+        return trends, avgs
+
     def predict_trend(self, features, data_tier):
         """
         Predict trend based on features
         """
-        prediction = self.clf_trend[data_tier].predict(features)
+        self.load_models(data_tier)
+        prediction = self.clf_trend[data_tier].predict(np.asarray(features, dtype=float).reshape(1, -1))
         return prediction[0]
 
     def predict_avg(self, features, data_tier):
         """
         Predict trend based on features
         """
-        prediction = self.clf_avg[data_tier].predict(features)
+        self.load_models(data_tier)
+        prediction = self.clf_avg[data_tier].predict(np.asarray(features, dtype=float).reshape(1, -1))
         return prediction[0]
 
-    def train(self):
+    def load_training_data(self, data_tier):
+        """
+        Training and test sets of a data tier from the feature store, memory mapped views
+        Old json training data is moved into the feature store the first time
+        """
+        if not self.feature_store.n_rows(data_tier):
+            json_file = self.data_path + '/training_data_' + data_tier + '.json'
+            if os.path.exists(json_file):
+                self.feature_store.import_json(data_tier, json_file)
+        return self.feature_store.split(data_tier)
+
+    def train(self, data_tiers=list()):
         """
-        Training classifier and regressor
+        Training classifier and regressor, all data tiers by default
+        Run as a separate step (ml_training), rankings only load the stored models
         """
-        for data_tier in self.data_tiers:
-            fd = open(self.data_path + '/training_data_' + data_tier + '.json', 'r')
-            self.preprocessed_data[data_tier] = json.load(fd)
-            fd.close()
-            tot = len(self.preprocessed_data[data_tier]['features'])
-            p = int(math.ceil(tot*0.8))
-            training_features = np.array(self.preprocessed_data[data_tier]['features'][:p])
-            trend_training_classifications = np.array(self.preprocessed_data[data_tier]['trend_classifications'][:p])
-            avg_training_classifications = np.array(self.preprocessed_data[data_tier]['avg_classifications'][:p])
+        for data_tier in data_tiers or self.data_tiers:
+            training_data, test_data = self.load_training_data(data_tier)
+            training_features, trend_training_classifications, avg_training_classifications = training_data
+            self.clf_trend[data_tier], self.clf_avg[data_tier] = self.new_models()
             t1 = datetime.datetime.utcnow()
             self.clf_trend[data_tier].fit(training_features, trend_training_classifications)
             self.clf_avg[data_tier].fit(training_features, avg_training_classifications)
             t2 = datetime.datetime.utcnow()
             td = t2 - t1
             self.logger.info('Training %s for data tier %s took %s', self.name, data_tier, str(td))
-            joblib.dump(self.clf_trend[data_tier], self.data_path + '/' + self.name + '_trend_' + data_tier + '.pkl')
-            joblib.dump(self.clf_avg[data_tier], self.data_path + '/' + self.name + '_avg_' + data_tier + '.pkl')
+            joblib.dump(self.clf_trend[data_tier], self.model_file('trend', data_tier))
+            joblib.dump(self.clf_avg[data_tier], self.model_file('avg', data_tier))
 
-    def test(self):
+    def test(self, data_tiers=list()):
         """
-        Test accuracy/score of classifier and regressor
+        Test accuracy/score of classifier and regressor, all data tiers by default
         """
-        for data_tier in self.data_tiers:
-            tot = len(self.preprocessed_data[data_tier]['features'])
-            p = int(math.floor(tot*0.2))
-            test_features = np.array(self.preprocessed_data[data_tier]['features'][p:])
-            trend_test_classifications = np.array(self.preprocessed_data[data_tier]['trend_classifications'][p:])
-            avg_test_classifications = np.array(self.preprocessed_data[data_tier]['avg_classifications'][p:])
+        for data_tier in data_tiers or self.data_tiers:
+            self.load_models(data_tier)
+            training_data, test_data = self.load_training_data(data_tier)
+            test_features, trend_test_classifications, avg_test_classifications = test_data
             accuracy_trend = self.clf_trend[data_tier].score(test_features, trend_test_classifications)
             accuracy_avg = self.clf_avg[data_tier].score(test_features, avg_test_classifications)
             self.logger.info('The accuracy of %s trend classifier for data tier %s is %.3f', self.name, data_tier, accuracy_trend)
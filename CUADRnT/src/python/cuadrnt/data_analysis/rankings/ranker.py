@@ -9,11 +9,11 @@ Description: Generic class for all ranking algorithms
 import logging
 import datetime
 import operator
-import threading
-import Queue
+from pymongo import UpdateOne
 
 # package modules
 from cuadrnt.utils.utils import datetime_day
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.data_management.tools.sites import SiteManager
 from cuadrnt.data_management.tools.datasets import DatasetManager
 from cuadrnt.data_management.tools.popularity import PopularityManager
@@ -26,30 +26,43 @@ class Ranker(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.sites = SiteManager(self.config)
-        self.datasets = DatasetManager(self.config)
-        self.popularity = PopularityManager(self.config)
-        self.storage = StorageManager(self.config)
         self.max_replicas = int(config['rocker_board']['max_replicas'])
-        self.MAX_THREADS = int(config['threading']['max_threads'])
         self.dataset_popularity = dict()
 
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
+
+    @lazy_property
+    def datasets(self):
+        """
+        Dataset manager, created on first use
+        """
+        return DatasetManager(self.config)
+
+    @lazy_property
+    def popularity(self):
+        """
+        Popularity manager, created on first use
+        """
+        return PopularityManager(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
     def get_dataset_rankings(self, date=datetime_day(datetime.datetime.utcnow())):
         """
         Generate dataset rankings
         """
-        self.dataset_popularity = dict()
         dataset_names = self.datasets.get_db_datasets()
-        q = Queue.Queue()
-        for i in range(self.MAX_THREADS):
-            worker = threading.Thread(target=self.get_dataset_popularity, args=(q,))
-            worker.daemon = True
-            worker.start()
-        # self.dataset_features = self.popularity.get_features(dataset_names, date)
-        # self.dataset_tiers = self.datasets.get_data_tiers(dataset_names)
-        for dataset_name in dataset_names:
-            q.put((dataset_name, date))
-        q.join()
+        self.dataset_popularity = self.popularity.get_average_popularities(dataset_names, date)
         dataset_rankings = self.normalize_popularity(date)
         return dataset_rankings
 
@@ -57,9 +70,12 @@ class Ranker(object):
         """
         Generate site rankings
         """
+        # new ranking cycle, read quotas, cpus and site usage again
+        self.sites.clear_site_snapshot()
         # get all sites which can be replicated to
         site_names = self.sites.get_available_sites()
         site_rankings = dict()
+        requests = list()
         for site_name in site_names:
             # get popularity
             popularity = self.get_site_popularity(site_name, date)
@@ -79,27 +95,13 @@ class Ranker(object):
             # store into dict
             site_rankings[site_name] = rank
             # insert into database
-            coll = 'site_rankings'
             query = {'name':site_name, 'date':date}
             data = {'$set':{'name':site_name, 'date':date, 'rank':rank, 'popularity':popularity}}
-            self.storage.update_data(coll=coll, query=query, data=data, upsert=True)
+            requests.append(UpdateOne(query, data, upsert=True))
+        coll = 'site_rankings'
+        self.storage.bulk_write(coll=coll, requests=requests)
         return site_rankings
 
-    def get_dataset_popularity(self, q):
-        """
-        Get the estimated popularity for dataset
-        """
-        while True:
-            # collect features
-            data = q.get()
-            dataset_name = data[0]
-            date = data[1]
-            popularity = 0.0
-            # get average
-            popularity = self.popularity.get_average_popularity(dataset_name, date)
-            self.dataset_popularity[dataset_name] = popularity
-            q.task_done()
-
     def get_site_popularity(self, site_name, date=datetime_day(datetime.datetime.utcnow())):
         """
         Get popularity for site
@@ -157,12 +159,14 @@ class Ranker(object):
         min_pop = min(self.dataset_popularity.iteritems(), key=operator.itemgetter(1))[1]
         n = float(min_pop + (self.max_replicas - 1))/max_pop
         m = 1 - n*min_pop
+        requests = list()
         for dataset_name, popularity in self.dataset_popularity.items():
             # store into dict
             rank = int(n*self.dataset_popularity[dataset_name] + m)
             dataset_rankings[dataset_name] = rank
-            coll = 'dataset_rankings'
-            query = data = {'name':dataset_name, 'date':date}
+            query = {'name':dataset_name, 'date':date}
             data = {'$set':{'name':dataset_name, 'date':date, 'rank':rank, 'popularity':popularity}}
-            self.storage.update_data(coll=coll, query=query, data=data, upsert=True)
+            requests.append(UpdateOne(query, data, upsert=True))
+        coll = 'dataset_rankings'
+        self.storage.bulk_write(coll=coll, requests=requests)
         return dataset_rankings
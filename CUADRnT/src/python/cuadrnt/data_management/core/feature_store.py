@@ -0,0 +1,160 @@
+#!/usr/bin/env python2.7
+"""
+File       : feature_store.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: Append-only binary store of machine learning features and labels for each data tier
+           : Each data tier has three .npy files (features, trend labels, average labels) which grow
+           : by a block of rows for every featurized day, and feature_store.json holds the schema,
+           : row counts and featurized days of all data tiers
+           : Arrays are opened memory mapped, training and test sets are views, not copies
+"""
+
+# system modules
+import logging
+import os
+import json
+import math
+import struct
+import numpy as np
+
+# Get module specific logger
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+# fixed size of the .npy header so it can be rewritten in place when rows are appended
+HEADER_SIZE = 256
+
+def write_npy_header(fd, dtype, shape):
+    """
+    Write a .npy (version 1.0) header of HEADER_SIZE bytes at the start of the file
+    """
+    header = "{'descr': %s, 'fortran_order': False, 'shape': %s, }" % (repr(np.lib.format.dtype_to_descr(np.dtype(dtype))), repr(tuple(shape)))
+    header = header.ljust(HEADER_SIZE - 10 - 1) + '\n'
+    fd.seek(0)
+    fd.write(np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header)
+
+class FeatureStore(object):
+    """
+    Features and labels of all data tiers
+    """
+    ARRAYS = (('features', np.float64), ('trends', np.int64), ('avgs', np.float64))
+
+    def __init__(self, path):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.schema_file = os.path.join(self.path, 'feature_store.json')
+        self.schema = self.read_schema()
+
+    def read_schema(self):
+        """
+        Read schema of the store, an empty schema if the store is new
+        """
+        try:
+            fd = open(self.schema_file, 'r')
+        except IOError:
+            return {'version':SCHEMA_VERSION, 'tiers':dict()}
+        schema = json.load(fd)
+        fd.close()
+        if schema.get('version') != SCHEMA_VERSION:
+            raise ValueError('Feature store %s has version %s, expected %d' % (self.schema_file, schema.get('version'), SCHEMA_VERSION))
+        return schema
+
+    def write_schema(self):
+        """
+        Replace the schema file in one step
+        """
+        tmp_file = self.schema_file + '.tmp'
+        fd = open(tmp_file, 'w')
+        json.dump(self.schema, fd, indent=1, sort_keys=True)
+        fd.close()
+        os.rename(tmp_file, self.schema_file)
+
+    def array_file(self, data_tier, name):
+        """
+        File of one of the arrays of a data tier
+        """
+        return os.path.join(self.path, '%s_%s.npy' % (name, data_tier))
+
+    def n_rows(self, data_tier):
+        """
+        Number of stored rows of a data tier
+        """
+        return self.schema['tiers'].get(data_tier, dict()).get('n_rows', 0)
+
+    def days(self, data_tier):
+        """
+        Days already featurized for a data tier
+        """
+        return set(self.schema['tiers'].get(data_tier, dict()).get('days', list()))
+
+    def append(self, data_tier, features, trends, avgs, day='', feature_names=list()):
+        """
+        Append rows of features and labels to a data tier, day (YYYY-MM-DD) is marked as featurized
+        Rows are written before the schema, rows of an interrupted append are dropped by the next one
+        """
+        trends = np.asarray(trends, dtype=np.int64)
+        avgs = np.asarray(avgs, dtype=np.float64)
+        n_new = len(trends)
+        features = np.asarray(features, dtype=np.float64).reshape(n_new, -1) if n_new else None
+        if len(avgs) != n_new:
+            raise ValueError('Got %d trend labels but %d average labels' % (n_new, len(avgs)))
+        if data_tier not in self.schema['tiers']:
+            self.schema['tiers'][data_tier] = {'n_rows':0, 'n_features':None, 'feature_names':list(feature_names), 'days':list()}
+        tier = self.schema['tiers'][data_tier]
+        if n_new:
+            if tier['n_features'] is None:
+                tier['n_features'] = features.shape[1]
+            if features.shape[1] != tier['n_features']:
+                raise ValueError('Data tier %s has %d features, got %d' % (data_tier, tier['n_features'], features.shape[1]))
+            n_rows = tier['n_rows']
+            for (name, dtype), values in zip(self.ARRAYS, (features, trends, avgs)):
+                file_name = self.array_file(data_tier, name)
+                row_shape = values.shape[1:]
+                row_bytes = int(np.prod(row_shape))*np.dtype(dtype).itemsize
+                fd = open(file_name, 'r+b' if os.path.exists(file_name) else 'w+b')
+                try:
+                    fd.truncate(HEADER_SIZE + n_rows*row_bytes)
+                    fd.seek(0, 2)
+                    fd.write(np.ascontiguousarray(values, dtype=dtype).tostring())
+                    write_npy_header(fd, dtype, (n_rows + n_new,) + row_shape)
+                    fd.flush()
+                    os.fsync(fd.fileno())
+                finally:
+                    fd.close()
+            tier['n_rows'] = n_rows + n_new
+        if day and (day not in tier['days']):
+            tier['days'].append(day)
+        self.write_schema()
+        self.logger.debug('Appended %d rows to data tier %s', n_new, data_tier)
+
+    def load(self, data_tier):
+        """
+        Open features, trend labels and average labels of a data tier memory mapped
+        """
+        n_rows = self.n_rows(data_tier)
+        if not n_rows:
+            raise IOError('No features stored for data tier %s in %s' % (data_tier, self.path))
+        arrays = list()
+        for name, dtype in self.ARRAYS:
+            array = np.load(self.array_file(data_tier, name), mmap_mode='r')
+            arrays.append(array[:n_rows])
+        return tuple(arrays)
+
+    def split(self, data_tier, fraction=0.8):
+        """
+        Training and test sets of a data tier, the oldest fraction of rows is used for training
+        Return (features, trends, avgs) for training and for test
+        """
+        features, trends, avgs = self.load(data_tier)
+        p = int(math.ceil(len(trends)*fraction))
+        return (features[:p], trends[:p], avgs[:p]), (features[p:], trends[p:], avgs[p:])
+
+    def import_json(self, data_tier, file_name):
+        """
+        Move old training_data_<tier>.json data into the store
+        """
+        fd = open(file_name, 'r')
+        data = json.load(fd)
+        fd.close()
+        self.append(data_tier, data['features'], data['trend_classifications'], data['avg_classifications'])
+        self.logger.info('Imported %d rows of %s into feature store', len(data['features']), file_name)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python2.7
+"""
+File       : preprocess.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: Build machine learning features and labels from popularity data, run every night
+           : Only days which are not in the feature store yet are featurized
+           : Features of a dataset for a day are the log popularity of the 7 days before, size and
+           : number of files. Labels are the average log popularity of the day and the 6 days after
+           : and whether it is higher than the average of the 7 days before (trend)
+"""
+
+# system modules
+import logging
+import sys
+import getopt
+import datetime
+import multiprocessing
+import numpy as np
+from logging.handlers import TimedRotatingFileHandler
+
+# package modules
+from cuadrnt.utils.utils import lazy_property
+from cuadrnt.utils.utils import datetime_day
+from cuadrnt.utils.utils import datetime_to_string
+from cuadrnt.utils.config import get_config
+from cuadrnt.data_management.core.storage import StorageManager
+from cuadrnt.data_management.core.feature_store import FeatureStore
+
+# days of popularity used as features before the day and averaged for the label from the day on
+WINDOW = 7
+FEATURE_NAMES = ['pop_%d' % (i) for i in range(-WINDOW, 0)] + ['size_gb', 'n_files']
+
+def featurize_tier(args):
+    """
+    Features and labels of all datasets of one data tier for a list of days
+    Runs in a worker process, only numpy work, no database access
+    pops is the dataset x day matrix of log popularities, day_indices are the columns of the days
+    to featurize, every one with WINDOW columns before and WINDOW-1 after it
+    Return data tier and [(day_index, features, trends, avgs), ...]
+    """
+    data_tier, pops, sizes_gb, n_files, day_indices = args
+    results = list()
+    if not len(pops):
+        return data_tier, [(day_index, np.zeros((0, len(FEATURE_NAMES))), np.zeros(0), np.zeros(0)) for day_index in day_indices]
+    # rolling window sums from the cumulative sum over days
+    cumsum = np.zeros((pops.shape[0], pops.shape[1] + 1))
+    cumsum[:, 1:] = np.cumsum(pops, axis=1)
+    # one day at a time, only the features of the active datasets of a day are copied
+    for day_index in day_indices:
+        window = pops[:, day_index - WINDOW:day_index]
+        prev_avgs = (cumsum[:, day_index] - cumsum[:, day_index - WINDOW])/WINDOW
+        next_avgs = (cumsum[:, day_index + WINDOW] - cumsum[:, day_index])/WINDOW
+        # datasets without any accesses around the day do not tell anything
+        active = window.any(axis=1) | (next_avgs != 0)
+        features = np.hstack([window[active], sizes_gb[active][:, np.newaxis], n_files[active][:, np.newaxis]])
+        trends = (next_avgs[active] > prev_avgs[active]).astype(np.int64)
+        results.append((int(day_index), features, trends, next_avgs[active]))
+    return data_tier, results
+
+class Preprocess(object):
+    """
+    Featurize new days of popularity data for all data tiers into the feature store
+    """
+    def __init__(self, config=dict()):
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.data_tiers = config['tools']['valid_tiers'].split(',')
+        self.data_path = self.config['paths']['data']
+        self.MAX_THREADS = int(config['threading']['max_threads'])
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    @lazy_property
+    def feature_store(self):
+        """
+        Feature store, opened on first use
+        """
+        return FeatureStore(self.data_path)
+
+    def get_popularity_range(self):
+        """
+        First and last day with popularity data
+        """
+        coll = 'dataset_popularity'
+        pipeline = list()
+        group = {'$group':{'_id':None, 'first':{'$min':'$date'}, 'last':{'$max':'$date'}}}
+        pipeline.append(group)
+        data = self.storage.get_data(coll=coll, pipeline=pipeline)
+        try:
+            return datetime_day(data[0]['first']), datetime_day(data[0]['last'])
+        except (IndexError, KeyError, TypeError):
+            return None, None
+
+    def get_pending_days(self):
+        """
+        Days which have enough popularity data around them and are not featurized for all data tiers
+        """
+        first_date, last_date = self.get_popularity_range()
+        if not first_date:
+            return list()
+        done = None
+        for data_tier in self.data_tiers:
+            days = self.feature_store.days(data_tier)
+            done = days if done is None else done & days
+        start_date = first_date + datetime.timedelta(days=WINDOW)
+        end_date = last_date - datetime.timedelta(days=WINDOW - 2)
+        days = list()
+        for i in range(int((end_date - start_date).days)):
+            date = start_date + datetime.timedelta(days=i)
+            if datetime_to_string(date) not in done:
+                days.append(date)
+        return days
+
+    def get_datasets(self):
+        """
+        Data tier, size and number of files of all datasets in one query
+        """
+        coll = 'dataset_data'
+        pipeline = list()
+        match = {'$match':{'data_tier':{'$in':self.data_tiers}}}
+        pipeline.append(match)
+        project = {'$project':{'name':1, 'data_tier':1, 'size_bytes':1, 'n_files':1, '_id':0}}
+        pipeline.append(project)
+        return self.storage.get_data(coll=coll, pipeline=pipeline)
+
+    def get_popularity_matrix(self, dataset_index, start_date, n_days):
+        """
+        Dataset x day matrix of log(n_accesses*n_cpus), 0 for days without accesses
+        Read in one query for the whole date range
+        """
+        pops = np.zeros((len(dataset_index), n_days))
+        end_date = start_date + datetime.timedelta(days=n_days - 1)
+        coll = 'dataset_popularity'
+        pipeline = list()
+        match = {'$match':{'date':{'$gte':start_date, '$lte':end_date}}}
+        pipeline.append(match)
+        project = {'$project':{'name':1, 'date':1, 'n_accesses':1, 'n_cpus':1, '_id':0}}
+        pipeline.append(project)
+        data = self.storage.get_data(coll=coll, pipeline=pipeline)
+        for pop_data in data:
+            try:
+                row = dataset_index[pop_data['name']]
+            except KeyError:
+                continue
+            column = int((datetime_day(pop_data['date']) - start_date).days)
+            value = float(pop_data.get('n_accesses') or 0)*float(pop_data.get('n_cpus') or 0)
+            if value > 0:
+                pops[row, column] = np.log(value)
+        return pops
+
+    def start(self):
+        """
+        Begin Preprocess
+        """
+        t1 = datetime.datetime.utcnow()
+        days = self.get_pending_days()
+        if not days:
+            self.logger.info('No new days to preprocess')
+            return
+        start_date = days[0] - datetime.timedelta(days=WINDOW)
+        n_days = int((days[-1] - start_date).days) + WINDOW
+        datasets = self.get_datasets()
+        dataset_index = dict((dataset['name'], i) for i, dataset in enumerate(datasets))
+        pops = self.get_popularity_matrix(dataset_index, start_date, n_days)
+        day_indices = [int((date - start_date).days) for date in days]
+        # split the matrix by data tier, every tier is featurized in its own process
+        jobs = list()
+        for data_tier in self.data_tiers:
+            rows = [i for i, dataset in enumerate(datasets) if dataset['data_tier'] == data_tier]
+            sizes_gb = np.array([float(datasets[i].get('size_bytes') or 0)/10**9 for i in rows])
+            n_files = np.array([float(datasets[i].get('n_files') or 0) for i in rows])
+            done = self.feature_store.days(data_tier)
+            tier_days = [day_index for day_index, date in zip(day_indices, days) if datetime_to_string(date) not in done]
+            jobs.append((data_tier, pops[rows], sizes_gb, n_files, tier_days))
+        pool = multiprocessing.Pool(max(1, min(self.MAX_THREADS, len(jobs))))
+        try:
+            results = pool.map(featurize_tier, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        # only this process writes to the feature store
+        for data_tier, tier_results in results:
+            for day_index, features, trends, avgs in tier_results:
+                day = datetime_to_string(start_date + datetime.timedelta(days=day_index))
+                self.feature_store.append(data_tier, features, trends, avgs, day=day, feature_names=FEATURE_NAMES)
+            self.logger.info('Preprocessed %d days for data tier %s', len(tier_results), data_tier)
+        t2 = datetime.datetime.utcnow()
+        td = t2 - t1
+        self.logger.info('Preprocess took %s', str(td))
+
+def main(argv):
+    """
+    Main driver for Preprocess
+    """
+    log_level = logging.WARNING
+    config = get_config(path='/var/opt/cuadrnt', file_name='cuadrnt.cfg')
+    try:
+        opts, args = getopt.getopt(argv, 'h', ['help', 'log='])
+    except getopt.GetoptError:
+        print "usage: preprocess.py [--log=notset|debug|info|warning|error|critical]"
+        print "   or: preprocess.py --help"
+        sys.exit()
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            print "usage: preprocess.py [--log=notset|debug|info|warning|error|critical]"
+            print "   or: preprocess.py --help"
+            sys.exit()
+        elif opt in ('--log'):
+            log_level = getattr(logging, arg.upper())
+            if not isinstance(log_level, int):
+                print "%s is not a valid log level" % (str(arg))
+                print "usage: preprocess.py [--log=notset|debug|info|warning|error|critical]"
+                print "   or: preprocess.py --help"
+                sys.exit()
+        else:
+            print "usage: preprocess.py [--log=notset|debug|info|warning|error|critical]"
+            print "   or: preprocess.py --help"
+            print "error: option %s not recognized" % (str(opt))
+            sys.exit()
+
+    log_path = config['paths']['log']
+    log_file = 'preprocess.log'
+    file_name = '%s/%s' % (log_path, log_file)
+    logger = logging.getLogger()
+    logger.setLevel(log_level)
+    handler = TimedRotatingFileHandler(file_name, when='midnight', interval=1, backupCount=10)
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s:%(funcName)s:%(lineno)d: %(message)s', datefmt='%H:%M')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+    preprocess = Preprocess(config)
+    preprocess.start()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+    sys.exit()
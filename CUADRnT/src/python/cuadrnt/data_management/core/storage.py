@@ -8,6 +8,7 @@ Description: Maintain a mongodb instance which is used for caching data, store c
 # system modules
 import logging
 import datetime
+import threading
 from subprocess import call
 from pymongo import MongoClient, ASCENDING
 from pymongo.errors import ServerSelectionTimeoutError, DocumentTooLarge, AutoReconnect, BulkWriteError
@@ -17,6 +18,54 @@ from cuadrnt.utils.utils import datetime_day
 from cuadrnt.utils.utils import datetime_remove_timezone
 from cuadrnt.utils.db_utils import get_object_id
 
+# Get module specific logger
+logger = logging.getLogger(__name__)
+
+# Process wide registry, all storage managers of a process share one client per mongodb uri and
+# indexes are only created the first time a database is used
+_clients = dict()
+_indexed_dbs = set()
+_registry_lock = threading.Lock()
+
+def get_client(uri, opt_path=''):
+    """
+    Get the shared client for a mongodb uri
+    Start the server if it is not running
+    """
+    with _registry_lock:
+        if uri not in _clients:
+            client = MongoClient(host=uri, serverSelectionTimeoutMS=5000)
+            try:
+                client.server_info()
+            except ServerSelectionTimeoutError:
+                # server is not running, start it
+                logger.info('Starting mongodb server %s', uri)
+                call(["start_mongodb", opt_path])
+            _clients[uri] = client
+        return _clients[uri]
+
+def get_db(uri, db_name, services=list(), opt_path=''):
+    """
+    Get database from the shared client
+    Dataset name index, cache expiry indexes for the services and expiry index for cpu samples of sites
+    are created on first use
+    """
+    db = get_client(uri, opt_path)[db_name]
+    with _registry_lock:
+        if (uri, db_name) in _indexed_dbs:
+            return db
+        try:
+            db['dataset_data'].create_index([('name', ASCENDING)], background=True, unique=True)
+        except ServerSelectionTimeoutError:
+            logger.error("Couldn't establish connection to mongodb server %s", uri)
+        else:
+            for service in services:
+                db[service].create_index('datetime', expireAfterSeconds=86400)
+            # cpu samples are kept for 30 days
+            db['site_cpu'].create_index('date', expireAfterSeconds=30*86400)
+            _indexed_dbs.add((uri, db_name))
+    return db
+
 class StorageManager(object):
     """
     Helper class to access local mongodb instance
@@ -28,23 +77,9 @@ class StorageManager(object):
         self.DB_NAME = str(self.config['mongodb']['db'])
         self.OPT_PATH = str(config['paths']['opt'])
         self.BACKUP_DB_NAME = self.DB_NAME + '-backup'
-        self.client = MongoClient(host=self.URI, serverSelectionTimeoutMS=5000)
-        try:
-            self.client.server_info()
-        except ServerSelectionTimeoutError:
-            # server is not running, start it
-            self.logger.info('Starting mongodb server %s', self.URI)
-            call(["start_mongodb", self.OPT_PATH])
-        self.db = self.client[self.DB_NAME]
-        data_coll = self.db['dataset_data']
-        try:
-            data_coll.create_index([('name', ASCENDING)], background=True, unique=True)
-        except ServerSelectionTimeoutError:
-            self.logger.error("Couldn't establish connection to mongodb server %s", self.URI)
-        else:
-            for service in config['services'].keys():
-                cache_coll = self.db[service]
-                cache_coll.create_index('datetime', expireAfterSeconds=86400)
+        self.BATCH_SIZE = int(self.config['mongodb'].get('batch_size', 1000))
+        self.client = get_client(self.URI, self.OPT_PATH)
+        self.db = get_db(self.URI, self.DB_NAME, config['services'].keys(), self.OPT_PATH)
 
     def insert_cache(self, coll, api, params=dict(), data=dict()):
         """
@@ -158,6 +193,42 @@ class StorageManager(object):
             self.logger.error("Couldn't establish connection to mongodb server %s", self.URI)
         return result
 
+    def bulk_write(self, coll, requests=list(), ordered=False, batch_size=0):
+        """
+        Execute write operations (UpdateOne, ReplaceOne, ...) on any collection in batches
+        Unordered by default so the server can apply a batch in any order and continue after errors
+        Return total number of matched, modified and upserted documents
+        """
+        counts = {'matched':0, 'modified':0, 'upserted':0}
+        if not batch_size:
+            batch_size = self.BATCH_SIZE
+        db_coll = self.db[coll]
+        requests = list(requests)
+        for start in range(0, len(requests), batch_size):
+            batch = requests[start:start+batch_size]
+            for i in range(2):
+                try:
+                    result = db_coll.bulk_write(batch, ordered=ordered)
+                except AutoReconnect:
+                    call(["start_mongodb", self.OPT_PATH])
+                    continue
+                except BulkWriteError as bwe:
+                    details = bwe.details
+                    self.logger.warning('%d write errors in %s\n\tFirst error: %s', len(details['writeErrors']), coll, str(details['writeErrors'][:1]))
+                    counts['matched'] += details['nMatched']
+                    counts['modified'] += details['nModified']
+                    counts['upserted'] += details['nUpserted']
+                    break
+                else:
+                    counts['matched'] += result.matched_count
+                    counts['modified'] += result.modified_count
+                    counts['upserted'] += result.upserted_count
+                    break
+            else:
+                self.logger.error("Couldn't establish connection to mongodb server %s", self.URI)
+        self.logger.debug('Bulk write of %d operations in %s: %s', len(requests), coll, str(counts))
+        return counts
+
     def delete_data(self, coll, query=dict()):
         """
         Delete data in any collection
@@ -223,3 +294,5 @@ class StorageManager(object):
         if not (self.DB_NAME == 'cuadrnt-test'):
             return
         self.client.drop_database(self.DB_NAME)
+        with _registry_lock:
+            _indexed_dbs.discard((self.URI, self.DB_NAME))
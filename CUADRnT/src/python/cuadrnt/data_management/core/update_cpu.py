@@ -13,6 +13,7 @@ import datetime
 from logging.handlers import TimedRotatingFileHandler
 
 # package modules
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.utils.config import get_config
 from cuadrnt.data_management.tools.sites import SiteManager
 
@@ -24,7 +25,13 @@ class UpdateCPU(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.sites = SiteManager(self.config)
+
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
 
     def start(self):
         """
@@ -13,6 +13,7 @@ import datetime
 from logging.handlers import TimedRotatingFileHandler
 
 # package modules
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.utils.config import get_config
 from cuadrnt.data_management.tools.sites import SiteManager
 from cuadrnt.data_management.tools.datasets import DatasetManager
@@ -26,10 +27,34 @@ class UpdateDB(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.storage = StorageManager(self.config)
-        self.sites = SiteManager(self.config)
-        self.datasets = DatasetManager(self.config)
-        self.popularity = PopularityManager(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
+
+    @lazy_property
+    def datasets(self):
+        """
+        Dataset manager, created on first use
+        """
+        return DatasetManager(self.config)
+
+    @lazy_property
+    def popularity(self):
+        """
+        Popularity manager, created on first use
+        """
+        return PopularityManager(self.config)
 
     def start(self):
         """
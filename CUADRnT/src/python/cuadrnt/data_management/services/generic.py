@@ -9,10 +9,22 @@ Description: Generic service module
 import logging
 
 # package modules
+from cuadrnt.utils.utils import lazy_property
+from cuadrnt.utils.cache_utils import canonical_params
+from cuadrnt.utils.cache_utils import LRUCache
+from cuadrnt.utils.cache_utils import SingleFlight
 from cuadrnt.utils.web_utils import get_secure_data
 from cuadrnt.utils.web_utils import get_data
+from cuadrnt.utils.web_utils import configure
+from cuadrnt.utils import web_utils
 from cuadrnt.data_management.core.storage import StorageManager
 
+# In process cache in front of the mongodb cache and coalescing of concurrent misses,
+# shared by all services of the process, keys are (service, api, canonical params)
+# Entries expire with the mongodb cache, large responses are not kept in memory
+memory_cache = LRUCache(max_size=256, ttl=86400)
+in_flight = SingleFlight()
+
 class GenericService(object):
     """
     Generic cuadrnt service class
@@ -24,36 +36,68 @@ class GenericService(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.storage = StorageManager(self.config)
+        configure(self.config.get('web', dict()))
         self.SERVICE = 'generic'
         self.TARGET_URL = ''
 
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
     def fetch(self, api, params=dict(), method='get', secure=True, cache=True, cache_only=False, force_cache=False):
         """
         Get data from url using parameters params
         If param cache is true update cache on cache miss
         If param cache_only is true just update the cache, don't return any data.
             Use this parameter to spawn external thread to update cache in background
+        Cached data is first looked up in memory, then in mongodb. Concurrent misses for the same
+        call wait for one request to the service. Returned data is shared, don't modify it
         """
         if cache:
+            key = canonical_params(params)
+            cache_key = (self.SERVICE, str(api), key)
+            in_memory = self.memory_cacheable(api, method)
             json_data = dict()
-            if not force_cache:
-                json_data = self.storage.get_cache(self.SERVICE, api, params)
+            if in_memory and not force_cache:
+                json_data = memory_cache.get(cache_key)
             if not json_data:
-                if secure:
-                    json_data = get_secure_data(target_url=self.TARGET_URL, api=api, params=params, method=method)
-                else:
-                    json_data = get_data(target_url=self.TARGET_URL, api=api, file_=params)
-                if type(json_data) is not dict:
-                    json_data = {'data':json_data}
-                self.storage.insert_cache(self.SERVICE, api, params, json_data)
+                json_data = in_flight.do(cache_key, lambda: self.fetch_cache(api, params, key, method, secure, force_cache))
+                if in_memory and json_data:
+                    memory_cache.put(cache_key, json_data)
             if not cache_only:
                 return json_data
         else:
-            if secure:
-                json_data = get_secure_data(target_url=self.TARGET_URL, api=api, params=params, method=method)
-            else:
-                json_data = get_data(target_url=self.TARGET_URL, api=api, file_=params)
-            if type(json_data) is not dict:
-                json_data = {'data':json_data}
-            return json_data
+            return self.fetch_service(api, params, method, secure)
+
+    def memory_cacheable(self, api, method='get'):
+        """
+        Only keep small responses in memory, streamed apis and batched post calls are large
+        """
+        return (method == 'get') and (str(api) not in web_utils.STREAM_APIS)
+
+    def fetch_cache(self, api, params, key, method='get', secure=True, force_cache=False):
+        """
+        Get data from the mongodb cache, call the service and update the cache on a miss
+        """
+        json_data = dict()
+        if not force_cache:
+            json_data = self.storage.get_cache(self.SERVICE, api, key)
+        if not json_data:
+            json_data = self.fetch_service(api, params, method, secure)
+            self.storage.insert_cache(self.SERVICE, api, key, dict(json_data))
+        return json_data
+
+    def fetch_service(self, api, params=dict(), method='get', secure=True):
+        """
+        Call the service
+        """
+        if secure:
+            json_data = get_secure_data(target_url=self.TARGET_URL, api=api, params=params, method=method)
+        else:
+            json_data = get_data(target_url=self.TARGET_URL, api=api, file_=params)
+        if type(json_data) is not dict:
+            json_data = {'data':json_data}
+        return json_data
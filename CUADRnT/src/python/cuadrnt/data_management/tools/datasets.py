@@ -10,14 +10,17 @@ import logging
 import threading
 import Queue
 import datetime
+from pymongo import UpdateOne
 
 # package modules
 from cuadrnt.utils.utils import timestamp_to_datetime
 from cuadrnt.utils.utils import datetime_day
 from cuadrnt.utils.utils import get_json
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.data_management.services.phedex import PhEDExService
 from cuadrnt.data_management.services.dbs import DBSService
 from cuadrnt.data_management.tools.sites import SiteManager
+from cuadrnt.data_management.tools.sites import SiteSnapshot
 from cuadrnt.data_management.core.storage import StorageManager
 
 class DatasetManager(object):
@@ -27,23 +30,43 @@ class DatasetManager(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.phedex = PhEDExService(self.config)
-        self.dbs = DBSService(self.config)
-        self.storage = StorageManager(self.config)
-        self.sites = SiteManager(self.config)
         self.valid_tiers = config['tools']['valid_tiers'].split(',')
         self.MAX_THREADS = int(config['threading']['max_threads'])
+        self.BATCH_SIZE = int(config['tools'].get('metadata_batch_size', 100))
+
+    @lazy_property
+    def phedex(self):
+        """
+        PhEDEx service, created on first use
+        """
+        return PhEDExService(self.config)
+
+    @lazy_property
+    def dbs(self):
+        """
+        DBS service, created on first use
+        """
+        return DBSService(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
 
     def initiate_db(self):
         """
         Initiate dataset data in database
         Get general data and popularity data from beginning
         """
-        q = Queue.Queue()
-        for i in range(self.MAX_THREADS):
-            worker = threading.Thread(target=self.insert_dataset_data, args=(i, q))
-            worker.daemon = True
-            worker.start()
         active_sites = self.sites.get_active_sites()
         api = 'blockreplicas'
         params = [('node', active_sites), ('create_since', 0.0), ('complete', 'y'), ('dist_complete', 'y'), ('group', 'AnalysisOps'), ('show_dataset', 'y')]
@@ -52,12 +75,8 @@ class DatasetManager(object):
         t2 = datetime.datetime.utcnow()
         td = t2 - t1
         self.logger.info('Call to PhEDEx took %s', str(td))
-        count = 1
         t1 = datetime.datetime.utcnow()
-        for dataset_data in get_json(get_json(phedex_data, 'phedex'), 'dataset'):
-            q.put((dataset_data, count))
-            count += 1
-        q.join()
+        self.insert_datasets(get_json(get_json(phedex_data, 'phedex'), 'dataset'))
         t2 = datetime.datetime.utcnow()
         td = t2 - t1
         self.logger.info('Inserting dataset data took %s', str(td))
@@ -82,28 +101,24 @@ class DatasetManager(object):
         td = t2 - t1
         self.logger.info('Call to PhEDEx took %s', str(td))
         current_datasets = set()
-        q = Queue.Queue()
-        for i in range(self.MAX_THREADS):
-            worker = threading.Thread(target=self.insert_dataset_data, args=(i, q))
-            worker.daemon = True
-            worker.start()
-        count = 1
         t1 = datetime.datetime.utcnow()
+        new_datasets = list()
+        replica_requests = list()
         for dataset_data in get_json(get_json(phedex_data, 'phedex'), 'dataset'):
             dataset_name = get_json(dataset_data, 'name')
             current_datasets.add(dataset_name)
             if dataset_name not in dataset_names:
                 # this is a new dataset which need to be inserted into the database
-                q.put((dataset_data, count))
-                count += 1
+                new_datasets.append(dataset_data)
             else:
                 # update replicas
                 replicas = self.get_replicas(dataset_data)
-                coll = 'dataset_data'
                 query = {'name':dataset_name}
                 data = {'$set':{'replicas':replicas}}
-                data = self.storage.update_data(coll=coll, query=query, data=data)
-        q.join()
+                replica_requests.append(UpdateOne(query, data))
+        coll = 'dataset_data'
+        self.storage.bulk_write(coll=coll, requests=replica_requests)
+        self.insert_datasets(new_datasets)
         deprecated_datasets = dataset_names - current_datasets
         for dataset_name in deprecated_datasets:
             self.remove_dataset(dataset_name)
@@ -112,72 +127,97 @@ class DatasetManager(object):
         self.logger.info('Updating dataset data took %s', str(td))
         self.logger.info('Done updating datasets in DB')
 
+    def insert_datasets(self, datasets_data):
+        """
+        Insert new datasets into the database and initiate all data
+        datasets_data is a list of PhEDEx dataset data (with blocks and replicas)
+        Datasets are handled in batches of BATCH_SIZE, one PhEDEx and one DBS call per batch
+        """
+        q = Queue.Queue()
+        for i in range(self.MAX_THREADS):
+            worker = threading.Thread(target=self.insert_dataset_data, args=(i, q))
+            worker.daemon = True
+            worker.start()
+        count = 1
+        for i in range(0, len(datasets_data), self.BATCH_SIZE):
+            q.put((datasets_data[i:i+self.BATCH_SIZE], count))
+            count += 1
+        q.join()
+
     def insert_dataset_data(self, i, q):
         """
-        Insert a new dataset into the database and initiate all data
+        Fetch metadata of a batch of new datasets, merge it and write all datasets in one bulk upsert
+        Datasets missing in PhEDEx or DBS are not inserted
         """
         while True:
             data = q.get()
-            dataset_data = data[0]
+            datasets_data = data[0]
             count = data[1]
-            self.logger.debug('Inserting dataset number %d', count)
-            dataset_name = get_json(dataset_data, 'name')
-            coll = 'dataset_data'
-            query = {'name':dataset_name}
-            data = {'$set':{'name':dataset_name}}
-            data = self.storage.update_data(coll=coll, query=query, data=data, upsert=True)
+            self.logger.debug('Inserting dataset batch number %d', count)
             try:
-                self.insert_phedex_data(dataset_name)
-                self.insert_dbs_data(dataset_name)
-                replicas = self.get_replicas(dataset_data)
-                query = {'name':dataset_name}
-                data = {'$set':{'name':dataset_name, 'replicas':replicas}}
-                data = self.storage.update_data(coll=coll, query=query, data=data)
-            except:
+                dataset_names = [get_json(dataset_data, 'name') for dataset_data in datasets_data]
+                phedex_data = self.get_phedex_data(dataset_names)
+                dbs_data = self.get_dbs_data(dataset_names)
+                requests = list()
+                for dataset_data in datasets_data:
+                    dataset_name = get_json(dataset_data, 'name')
+                    try:
+                        data = {'name':dataset_name}
+                        data.update(phedex_data[dataset_name])
+                        data.update(dbs_data[dataset_name])
+                    except KeyError:
+                        self.logger.warning("Couldn't get metadata for dataset %s", dataset_name)
+                        continue
+                    data['replicas'] = self.get_replicas(dataset_data, n_files=data['n_files'])
+                    query = {'name':dataset_name}
+                    requests.append(UpdateOne(query, {'$set':data}, upsert=True))
                 coll = 'dataset_data'
-                query = {'name':dataset_name}
-                self.storage.delete_data(coll=coll, query=query)
+                self.storage.bulk_write(coll=coll, requests=requests)
+            except Exception as e:
+                self.logger.warning("Couldn't insert dataset batch number %d\n    Reason:\n    %s", count, str(e))
             q.task_done()
 
-    def insert_phedex_data(self, dataset_name):
+    def get_phedex_data(self, dataset_names):
         """
-        Fetch phedex data about dataset and insert into database
+        Fetch size and number of files of datasets from phedex in one call
+        Return {dataset_name:{'size_bytes':size_bytes, 'n_files':n_files}}
         """
         api = 'data'
-        params = {'dataset':dataset_name, 'level':'block', 'create_since':0.0}
-        phedex_data = self.phedex.fetch(api=api, params=params)
-        size_bytes = 0
-        n_files = 0
-        dataset_data = get_json(get_json(get_json(phedex_data, 'phedex'), 'dbs')[0],'dataset')[0]
-        for block_data in get_json(dataset_data, 'block'):
-            size_bytes += get_json(block_data, 'bytes')
-            n_files += get_json(block_data, 'files')
-        coll = 'dataset_data'
-        query = {'name':dataset_name}
-        data = {'$set':{'size_bytes':size_bytes, 'n_files':n_files}}
-        self.storage.update_data(coll=coll, query=query, data=data, upsert=False)
+        params = [('dataset', dataset_names), ('level', 'block'), ('create_since', 0.0)]
+        phedex_data = self.phedex.fetch(api=api, params=params, method='post')
+        datasets = dict()
+        for dbs_data in get_json(get_json(phedex_data, 'phedex'), 'dbs'):
+            for dataset_data in get_json(dbs_data, 'dataset'):
+                size_bytes = 0
+                n_files = 0
+                for block_data in get_json(dataset_data, 'block'):
+                    size_bytes += get_json(block_data, 'bytes')
+                    n_files += get_json(block_data, 'files')
+                datasets[get_json(dataset_data, 'name')] = {'size_bytes':size_bytes, 'n_files':n_files}
+        return datasets
 
-    def insert_dbs_data(self, dataset_name):
-        """
-        Fetch dbs data about dataset and insert into database
-        """
-        api = 'datasets'
-        params = {'dataset':dataset_name, 'detail':True, 'dataset_access_type':'*'}
-        dbs_data = self.dbs.fetch(api=api, params=params)
-        dataset_data = get_json(dbs_data, 'data')[0]
-        ds_name = get_json(dataset_data, 'primary_ds_name')
-        physics_group = get_json(dataset_data, 'physics_group_name')
-        data_tier = get_json(dataset_data, 'data_tier_name')
-        creation_date = datetime_day(timestamp_to_datetime(get_json(dataset_data, 'creation_date')))
-        ds_type = get_json(dataset_data, 'primary_ds_type')
-        coll = 'dataset_data'
-        query = {'name':dataset_name}
-        data = {'$set':{'ds_name':ds_name, 'physics_group':physics_group, 'data_tier':data_tier, 'creation_date':creation_date, 'ds_type':ds_type}}
-        self.storage.update_data(coll=coll, query=query, data=data, upsert=False)
+    def get_dbs_data(self, dataset_names):
+        """
+        Fetch general data about datasets from dbs in one call
+        Return {dataset_name:{'ds_name':ds_name, ...}}
+        """
+        api = 'datasetlist'
+        params = {'dataset':dataset_names, 'detail':True, 'dataset_access_type':'*'}
+        dbs_data = self.dbs.fetch(api=api, params=params, method='json')
+        datasets = dict()
+        for dataset_data in get_json(dbs_data, 'data'):
+            ds_name = get_json(dataset_data, 'primary_ds_name')
+            physics_group = get_json(dataset_data, 'physics_group_name')
+            data_tier = get_json(dataset_data, 'data_tier_name')
+            creation_date = datetime_day(timestamp_to_datetime(get_json(dataset_data, 'creation_date')))
+            ds_type = get_json(dataset_data, 'primary_ds_type')
+            datasets[get_json(dataset_data, 'dataset')] = {'ds_name':ds_name, 'physics_group':physics_group, 'data_tier':data_tier, 'creation_date':creation_date, 'ds_type':ds_type}
+        return datasets
 
-    def get_replicas(self, dataset_data):
+    def get_replicas(self, dataset_data, n_files=None):
         """
         Generator function to get all replicas of a dataset
+        Sites need all n_files files of the dataset, read from the database if not given
         """
         replicas_check = dict()
         dataset_name = get_json(dataset_data, 'name')
@@ -188,7 +228,8 @@ class DatasetManager(object):
                 except:
                     replicas_check[get_json(replica_data, 'node')] = get_json(replica_data, 'files')
         replicas = list()
-        n_files = self.get_n_files(dataset_name)
+        if n_files is None:
+            n_files = self.get_n_files(dataset_name)
         for site, site_files in replicas_check.items():
             if site_files == n_files:
                 replicas.append(site)
@@ -308,6 +349,28 @@ class DatasetManager(object):
         size_gb = float(data[0]['size_bytes'])/10**9
         return size_gb
 
+    def get_replica_snapshot(self):
+        """
+        Get size in GB and replica sites of all datasets in one query
+        Return sizes {dataset_name:size_gb} and replicas {dataset_name:[site_name, ...]}
+        """
+        coll = 'dataset_data'
+        pipeline = list()
+        match = {'$match':{'data_tier': {'$in':self.valid_tiers}}}
+        pipeline.append(match)
+        project = {'$project':{'name':1, 'size_bytes':1, 'replicas':1, '_id':0}}
+        pipeline.append(project)
+        data = self.storage.get_data(coll=coll, pipeline=pipeline)
+        sizes = dict()
+        replicas = dict()
+        for dataset_data in data:
+            try:
+                sizes[dataset_data['name']] = float(dataset_data['size_bytes'])/10**9
+            except KeyError:
+                continue
+            replicas[dataset_data['name']] = dataset_data.get('replicas', list())
+        return sizes, replicas
+
     def get_current_num_replicas(self):
         """
         Get the current number of replicas for all datasets
@@ -397,32 +460,12 @@ class DatasetManager(object):
     def get_all_site_size(self, site_names):
         """
         Get the total storage used in the system
+        Read from a new snapshot, the one of a site manager can be older than the replica data
         """
+        snapshot = SiteSnapshot(self.storage)
         sites_sizes = dict()
         for site_name in site_names:
-            # get all datasets with a replica at the site and how many replicas it has
-            coll = 'dataset_data'
-            pipeline = list()
-            match = {'$match':{'replicas':site_name}}
-            pipeline.append(match)
-            project = {'$project':{'name':1, '_id':0}}
-            pipeline.append(project)
-            data = self.storage.get_data(coll=coll, pipeline=pipeline)
-            dataset_names = [dataset_data['name'] for dataset_data in data]
-            # get the popularity of the dataset and decide by number of replicas
-            coll = 'dataset_data'
-            pipeline = list()
-            match = {'$match': {'name':{'$in':dataset_names}}}
-            pipeline.append(match)
-            group = {'$group':{'_id':'$name', 'size_bytes':{'$sum':'$size_bytes'}, 'n_replicas':{'$first':{'$size':'$replicas'}}}}
-            pipeline.append(group)
-            project = {'$project':{'size_bytes':1, 'n_replicas':1, '_id':1}}
-            pipeline.append(project)
-            data = self.storage.get_data(coll=coll, pipeline=pipeline)
-            size = 0.0
-            for dataset in data:
-                size += (float(dataset['size_bytes'])/10**12)*dataset['n_replicas']
-            sites_sizes[site_name] = size
+            sites_sizes[site_name] = float(snapshot.weighted_sizes.get(site_name, 0))/10**12
         return sites_sizes
 
     def get_total_storage(self):
@@ -12,6 +12,7 @@ import Queue
 import threading
 from math import log
 import numpy as np
+from pymongo import UpdateOne
 
 # package modules
 # from cuadrnt.utils.utils import pop_db_timestamp_to_datetime
@@ -20,6 +21,7 @@ from cuadrnt.utils.utils import datetime_day
 from cuadrnt.utils.utils import pop_db_timestamp_to_datetime
 from cuadrnt.utils.utils import daterange
 from cuadrnt.utils.utils import get_json
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.data_management.services.pop_db import PopDBService
 from cuadrnt.data_management.tools.sites import SiteManager
 from cuadrnt.data_management.tools.datasets import DatasetManager
@@ -32,12 +34,36 @@ class PopularityManager(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.pop_db = PopDBService(self.config)
-        self.sites = SiteManager(self.config)
-        self.datasets = DatasetManager(self.config)
-        self.storage = StorageManager(self.config)
         self.MAX_THREADS = int(config['threading']['max_threads'])
 
+    @lazy_property
+    def pop_db(self):
+        """
+        Popularity DB service, created on first use
+        """
+        return PopDBService(self.config)
+
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
+
+    @lazy_property
+    def datasets(self):
+        """
+        Dataset manager, created on first use
+        """
+        return DatasetManager(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
     def initiate_db(self):
         """
         Collect popularity data
@@ -108,6 +134,7 @@ class PopularityManager(object):
             params = {'sitename':'summary', 'tstart':tstart, 'tstop':tstop}
             json_data = self.pop_db.fetch(api=api, params=params)
             # sort it in dictionary for easy fetching
+            requests = list()
             for dataset in json_data['DATA']:
                 dataset_name = dataset['COLLNAME']
                 popularity_data = {'name':dataset_name, 'date':date}
@@ -116,7 +143,8 @@ class PopularityManager(object):
                 popularity_data['n_users'] = dataset['NUSERS']
                 query = {'name':dataset_name, 'date':date}
                 data = {'$set':popularity_data}
-                self.storage.update_data(coll=coll, query=query, data=data, upsert=True)
+                requests.append(UpdateOne(query, data, upsert=True))
+            self.storage.bulk_write(coll=coll, requests=requests)
             q.task_done()
 
     def get_average_popularity(self, dataset_name, date):
@@ -140,3 +168,33 @@ class PopularityManager(object):
                 pops.append(0.0)
         avg = np.mean(pops)
         return avg
+
+    def get_average_popularities(self, dataset_names, date):
+        """
+        Get average popularity of the week before date for many datasets at once
+        Same values as get_average_popularity, but all popularity data of the week is read in one
+        aggregation and the averages are computed with numpy
+        Datasets without popularity data get 0.0
+        """
+        start_date = date - datetime.timedelta(days=7)
+        end_date = date - datetime.timedelta(days=1)
+        coll = 'dataset_popularity'
+        pipeline = list()
+        match = {'$match':{'date':{'$gte':start_date, '$lte':end_date}}}
+        pipeline.append(match)
+        project = {'$project':{'name':1, 'n_accesses':1, 'n_cpus':1, '_id':0}}
+        pipeline.append(project)
+        data = self.storage.get_data(coll=coll, pipeline=pipeline)
+        index = dict((dataset_name, i) for i, dataset_name in enumerate(set(dataset_names)))
+        rows = [(index[pop_data['name']], pop_data.get('n_accesses') or 0, pop_data.get('n_cpus') or 0) for pop_data in data if pop_data.get('name') in index]
+        pops = np.zeros(len(index))
+        if rows:
+            rows = np.array(rows, dtype=float)
+            products = rows[:,1]*rows[:,2]
+            # days without accesses count as 0.0, same as a failed log in get_average_popularity
+            valid = products > 0
+            logs = np.zeros(len(products))
+            logs[valid] = np.log(products[valid])
+            pops = np.bincount(rows[:,0].astype(int), weights=logs, minlength=len(index))
+        avgs = pops/7
+        return dict((dataset_name, float(avgs[i])) for dataset_name, i in index.items())
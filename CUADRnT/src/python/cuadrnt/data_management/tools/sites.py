@@ -11,10 +11,60 @@ import datetime
 
 # package modules
 from cuadrnt.utils.utils import get_json
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.data_management.services.intelroccs import IntelROCCSService
 from cuadrnt.data_management.services.crab import CRABService
 from cuadrnt.data_management.core.storage import StorageManager
 
+class SiteSnapshot(object):
+    """
+    Data used, quota and maximum number of CPU's of all sites
+    Read with one pipeline on site data, one on cpu samples and one on dataset data
+    Sites without samples in site_cpu fall back to the cpu data arrays in site data
+    """
+    def __init__(self, storage):
+        self.logger = logging.getLogger(__name__)
+        self.quotas = dict()
+        self.max_cpus = dict()
+        self.sizes = dict()
+        self.weighted_sizes = dict()
+        # samples older than 30 days are removed by the expiry index, match in case it has not run yet
+        date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
+        coll = 'site_data'
+        pipeline = list()
+        project = {'$project':{'name':1, 'quota_gb':1, 'cpu_data':1, '_id':0}}
+        pipeline.append(project)
+        data = storage.get_data(coll=coll, pipeline=pipeline)
+        for site_data in data:
+            site_name = site_data['name']
+            self.quotas[site_name] = site_data.get('quota_gb', 0)
+            # samples stored in site data before site_cpu existed, used until site_cpu has samples for the site
+            cpus = [cpu_data['cpus'] for cpu_data in site_data.get('cpu_data', list()) if ('cpus' in cpu_data) and (cpu_data.get('date', date) >= date)]
+            if cpus:
+                self.max_cpus[site_name] = max(cpus)
+        coll = 'site_cpu'
+        pipeline = list()
+        match = {'$match':{'date':{'$gte':date}}}
+        pipeline.append(match)
+        group = {'$group':{'_id':'$name', 'max_cpus':{'$max':'$cpus'}}}
+        pipeline.append(group)
+        data = storage.get_data(coll=coll, pipeline=pipeline)
+        for site_data in data:
+            self.max_cpus[site_data['_id']] = site_data['max_cpus']
+        # bytes at each site, plain and multiplied by the number of replicas of each dataset
+        coll = 'dataset_data'
+        pipeline = list()
+        project = {'$project':{'replicas':1, 'size_bytes':1, 'n_replicas':{'$size':{'$ifNull':['$replicas', list()]}}, '_id':0}}
+        pipeline.append(project)
+        unwind = {'$unwind':'$replicas'}
+        pipeline.append(unwind)
+        group = {'$group':{'_id':'$replicas', 'size_bytes':{'$sum':'$size_bytes'}, 'weighted_bytes':{'$sum':{'$multiply':['$size_bytes', '$n_replicas']}}}}
+        pipeline.append(group)
+        data = storage.get_data(coll=coll, pipeline=pipeline)
+        for site_data in data:
+            self.sizes[site_data['_id']] = site_data['size_bytes']
+            self.weighted_sizes[site_data['_id']] = site_data['weighted_bytes']
+
 class SiteManager(object):
     """
     Keep track of site data
@@ -22,11 +72,44 @@ class SiteManager(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.intelroccs = IntelROCCSService(self.config)
-        self.crab = CRABService(self.config)
-        self.storage = StorageManager(self.config)
         self.soft_limit = float(self.config['rocker_board']['soft_limit'])
         self.hard_limit = float(self.config['rocker_board']['hard_limit'])
+        self.snapshot = None
+
+    @lazy_property
+    def intelroccs(self):
+        """
+        IntelROCCS service, created on first use
+        """
+        return IntelROCCSService(self.config)
+
+    @lazy_property
+    def crab(self):
+        """
+        CRAB service, created on first use
+        """
+        return CRABService(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    def get_site_snapshot(self):
+        """
+        Site snapshot shared by all site queries, read on first use
+        """
+        if self.snapshot is None:
+            self.snapshot = SiteSnapshot(self.storage)
+        return self.snapshot
+
+    def clear_site_snapshot(self):
+        """
+        Read the site snapshot again on next use, call after site or replica data changed
+        """
+        self.snapshot = None
 
     def initiate_db(self):
         """
@@ -45,6 +128,7 @@ class SiteManager(object):
         intelroccs_data = self.intelroccs.fetch(api=api, params=file_, secure=False)
         for site_data in get_json(intelroccs_data, 'data'):
             self.insert_site_data(site_data)
+        self.clear_site_snapshot()
 
     def insert_site_data(self, site_data):
         """
@@ -60,28 +144,29 @@ class SiteManager(object):
 
     def update_cpu(self):
         """
-        Update maximum CPU capacity for site
+        Update maximum CPU capacity for all active sites
+        One CRAB query for the slots of all sites, CPU's are summed by site and all samples are
+        inserted at once, old samples expire through the index on site_cpu
         """
         active_sites = self.get_active_sites()
-        for site_name in active_sites:
-            # remove older values
-            date = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-            coll = 'site_data'
-            query = {'name':site_name}
-            data = {'$pull':{'cpu_data':{'date':{'$lt':date}}}}
-            self.storage.update_data(coll=coll, query=query, data=data)
-            # get CRAB data about site
-            query = 'GLIDEIN_CMSSite =?= "%s" && CPUs > 0' % (site_name)
-            attributes = ['GLIDEIN_CMSSite', 'CPUs']
-            ads = self.crab.fetch_cluster_ads(query, attributes=attributes)
-            cpus = 0
-            for ad in ads:
-                cpus += ad['CPUs']
-            # insert new data
-            date = datetime.datetime.utcnow()
-            query = {'name':site_name}
-            data = {'$push':{'cpu_data':{'date':date, 'cpus':cpus}}}
-            self.storage.update_data(coll=coll, query=query, data=data)
+        query = 'CPUs > 0 && GLIDEIN_CMSSite isnt undefined'
+        attributes = ['GLIDEIN_CMSSite', 'CPUs']
+        ads = self.crab.fetch_cluster_ads(query, attributes=attributes)
+        if not ads:
+            self.logger.warning('No CRAB data, CPU data not updated')
+            return
+        site_cpus = dict((site_name, 0) for site_name in active_sites)
+        for ad in ads:
+            site_name = ad.get('GLIDEIN_CMSSite')
+            if site_name in site_cpus:
+                site_cpus[site_name] += ad['CPUs']
+        # insert new data
+        date = datetime.datetime.utcnow()
+        coll = 'site_cpu'
+        data = [{'name':name, 'date':date, 'cpus':cpus} for name, cpus in site_cpus.items()]
+        if data:
+            self.storage.insert_data(coll=coll, data=data)
+        self.clear_site_snapshot()
 
     def get_active_sites(self):
         """
@@ -154,56 +239,24 @@ class SiteManager(object):
         """
         Get the amount of data at the site
         """
-        coll = 'dataset_data'
-        pipeline = list()
-        match = {'$match':{'replicas':site_name}}
-        pipeline.append(match)
-        group = {'$group':{'_id':None, 'size_bytes':{'$sum':'$size_bytes'}}}
-        pipeline.append(group)
-        project = {'$project':{'size_bytes':1, '_id':0}}
-        pipeline.append(project)
-        data = self.storage.get_data(coll=coll, pipeline=pipeline)
-        try:
-            size_gb = data[0]['size_bytes']/10**9
-        except:
-            return 0
+        size_bytes = self.get_site_snapshot().sizes.get(site_name, 0)
+        size_gb = size_bytes/10**9
         return size_gb
 
     def get_quota(self, site_name):
         """
         Get the AnalysisOps quota for the site
         """
-        coll = 'site_data'
-        pipeline = list()
-        match = {'$match':{'name':site_name}}
-        pipeline.append(match)
-        project = {'$project':{'quota_gb':1, '_id':0}}
-        pipeline.append(project)
-        data = self.storage.get_data(coll=coll, pipeline=pipeline)
-        try:
-            quota_gb = data[0]['quota_gb']
-        except:
-            quota_gb = 0
+        quota_gb = self.get_site_snapshot().quotas.get(site_name, 0)
         return quota_gb
 
     def get_max_cpu(self, site_name):
         """
         Get the maximum number of CPU's in the last 30 days at the site
         """
-        coll = 'site_data'
-        pipeline = list()
-        match = {'$match':{'name':site_name}}
-        pipeline.append(match)
-        unwind = {'$unwind':'$cpu_data'}
-        pipeline.append(unwind)
-        group = {'$group':{'_id':'$name', 'max_cpus':{'$max':'$cpu_data.cpus'}}}
-        pipeline.append(group)
-        project = {'$project':{'max_cpus':1, '_id':0}}
-        pipeline.append(project)
-        data = self.storage.get_data(coll=coll, pipeline=pipeline)
         try:
-            max_cpus = data[0]['max_cpus']
-        except:
+            max_cpus = self.get_site_snapshot().max_cpus[site_name]
+        except KeyError:
             self.logger.warning('Could not get site performance for %s', site_name)
             return 0
         return max_cpus
@@ -0,0 +1,162 @@
+#!/usr/bin/env python2.7
+"""
+File       : replica_model.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: In memory model of dataset replicas and site capacity used to plan replications
+           : The model is loaded once from the database, planning itself does not touch the database
+"""
+
+# system modules
+import logging
+import heapq
+import random
+
+class WeightedSampler(object):
+    """
+    Weighted random selection where weights can be changed between draws
+    Weights are kept in a binary indexed tree, changing a weight and drawing both take O(log n)
+    Items with weight 0 are never drawn
+    """
+    def __init__(self, weights=dict()):
+        self.items = list(weights.keys())
+        self.index = dict((item, i) for i, item in enumerate(self.items))
+        self.size = len(self.items)
+        self.weights = [0.0]*self.size
+        self.tree = [0.0]*(self.size + 1)
+        self.n_positive = 0
+        self.top_step = 1
+        while self.top_step*2 <= self.size:
+            self.top_step *= 2
+        for item, weight in weights.items():
+            self.update(item, weight)
+
+    def update(self, item, weight):
+        """
+        Set the weight of an item, negative weights count as 0
+        """
+        i = self.index[item]
+        weight = max(0.0, float(weight))
+        if (weight > 0) != (self.weights[i] > 0):
+            self.n_positive += 1 if weight > 0 else -1
+        delta = weight - self.weights[i]
+        self.weights[i] = weight
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def weight(self, item):
+        """
+        Current weight of an item, 0 for unknown items
+        """
+        try:
+            return self.weights[self.index[item]]
+        except KeyError:
+            return 0.0
+
+    def total(self):
+        """
+        Sum of all weights
+        """
+        total = 0.0
+        i = self.size
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def choice(self):
+        """
+        Draw an item with probability proportional to its weight
+        Return None if no item has a positive weight
+        """
+        while self.n_positive > 0:
+            rand = random.uniform(0, self.total())
+            pos = 0
+            step = self.top_step
+            while step:
+                if (pos + step <= self.size) and (self.tree[pos + step] < rand):
+                    pos += step
+                    rand -= self.tree[pos]
+                step //= 2
+            # rounding can land on an empty slot, just draw again
+            if (pos < self.size) and (self.weights[pos] > 0):
+                return self.items[pos]
+        return None
+
+class ReplicaModel(object):
+    """
+    Snapshot of dataset sizes, replica sites and available storage at sites
+    """
+    def __init__(self, dataset_sizes=dict(), dataset_replicas=dict(), sites_available_storage_gb=dict()):
+        self.logger = logging.getLogger(__name__)
+        self.dataset_sizes = dataset_sizes
+        self.dataset_replicas = dict((dataset_name, set(site_names)) for dataset_name, site_names in dataset_replicas.items())
+        self.sites_available_storage_gb = dict(sites_available_storage_gb)
+
+    def plan(self, dataset_rankings, site_rankings, max_gb):
+        """
+        Plan new replicas, most wanted datasets first, until max_gb is subscribed
+        dataset_rankings are the number of missing replicas and are updated as replicas are planned
+        Sites are picked at random weighted by their rank among the sites with enough space
+        which do not have a replica yet
+        Return the subscriptions [(dataset_name, site_name), ...] and the subscribed GB
+        """
+        subscriptions = list()
+        subscribed_gb = 0
+        weights = dict()
+        for site_name, rank in site_rankings.items():
+            if (rank > 0) and (self.sites_available_storage_gb.get(site_name, 0) > 0):
+                weights[site_name] = rank
+        sampler = WeightedSampler(weights)
+        heap = [(-rank, dataset_name) for dataset_name, rank in dataset_rankings.items() if rank >= 1]
+        heapq.heapify(heap)
+        while heap and (subscribed_gb < max_gb) and sampler.n_positive:
+            dataset_rank, dataset_name = heapq.heappop(heap)
+            dataset_rank = -dataset_rank
+            try:
+                size_gb = self.dataset_sizes[dataset_name]
+            except KeyError:
+                self.logger.warning('No size for %s, skipping it', dataset_name)
+                del dataset_rankings[dataset_name]
+                continue
+            site_name = self.choose_site(sampler, dataset_name, size_gb)
+            if not site_name:
+                del dataset_rankings[dataset_name]
+                continue
+            subscriptions.append((dataset_name, site_name))
+            subscribed_gb += size_gb
+            self.dataset_replicas.setdefault(dataset_name, set()).add(site_name)
+            self.sites_available_storage_gb[site_name] -= size_gb
+            self.logger.debug('%s : added', dataset_name)
+            if self.sites_available_storage_gb[site_name] <= 0:
+                sampler.update(site_name, 0)
+            dataset_rankings[dataset_name] = dataset_rank - 1
+            if dataset_rank - 1 >= 1:
+                heapq.heappush(heap, (-(dataset_rank - 1), dataset_name))
+        return subscriptions, subscribed_gb
+
+    def choose_site(self, sampler, dataset_name, size_gb):
+        """
+        Pick a site for a new replica of the dataset, None if no site can take it
+        Sites with a replica or without enough space are taken out of the sampler for this draw only
+        """
+        site_name = None
+        excluded = dict()
+        for replica_site in self.dataset_replicas.get(dataset_name, set()):
+            weight = sampler.weight(replica_site)
+            if weight > 0:
+                excluded[replica_site] = weight
+                sampler.update(replica_site, 0)
+        while True:
+            candidate = sampler.choice()
+            if candidate is None:
+                break
+            if self.sites_available_storage_gb[candidate] >= size_gb:
+                site_name = candidate
+                break
+            excluded[candidate] = sampler.weight(candidate)
+            sampler.update(candidate, 0)
+        for excluded_site, weight in excluded.items():
+            sampler.update(excluded_site, weight)
+        return site_name
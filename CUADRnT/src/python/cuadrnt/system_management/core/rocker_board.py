@@ -10,13 +10,12 @@ import logging
 import sys
 import getopt
 import datetime
-import operator
 from logging.handlers import TimedRotatingFileHandler
 
 # package modules
-from cuadrnt.utils.utils import weighted_choice
 from cuadrnt.utils.utils import timestamp_to_datetime
 from cuadrnt.utils.utils import datetime_day
+from cuadrnt.utils.utils import lazy_property
 from cuadrnt.utils.config import get_config
 from cuadrnt.data_management.services.phedex import PhEDExService
 from cuadrnt.data_management.services.mit_db import MITDBService
@@ -25,6 +24,7 @@ from cuadrnt.data_management.tools.sites import SiteManager
 from cuadrnt.data_management.tools.popularity import PopularityManager
 from cuadrnt.data_management.core.storage import StorageManager
 from cuadrnt.data_analysis.rankings.ranker import Ranker
+from cuadrnt.system_management.core.replica_model import ReplicaModel
 
 class RockerBoard(object):
     """
@@ -34,16 +34,58 @@ class RockerBoard(object):
     def __init__(self, config=dict()):
         self.logger = logging.getLogger(__name__)
         self.config = config
-        self.phedex = PhEDExService(self.config)
-        self.mit_db = MITDBService(self.config)
-        self.datasets = DatasetManager(self.config)
-        self.sites = SiteManager(self.config)
-        self.popularity = PopularityManager(self.config)
-        self.storage = StorageManager(self.config)
-        self.rankings = Ranker(self.config)
         self.max_gb = int(self.config['rocker_board']['max_gb'])
         self.csv_data = list()
 
+    @lazy_property
+    def phedex(self):
+        """
+        PhEDEx service, created on first use
+        """
+        return PhEDExService(self.config)
+
+    @lazy_property
+    def mit_db(self):
+        """
+        MIT DB service, created on first use
+        """
+        return MITDBService(self.config)
+
+    @lazy_property
+    def datasets(self):
+        """
+        Dataset manager, created on first use
+        """
+        return DatasetManager(self.config)
+
+    @lazy_property
+    def sites(self):
+        """
+        Site manager, created on first use
+        """
+        return SiteManager(self.config)
+
+    @lazy_property
+    def popularity(self):
+        """
+        Popularity manager, created on first use
+        """
+        return PopularityManager(self.config)
+
+    @lazy_property
+    def storage(self):
+        """
+        Storage manager, created on first use
+        """
+        return StorageManager(self.config)
+
+    @lazy_property
+    def rankings(self):
+        """
+        Ranker, created on first use
+        """
+        return Ranker(self.config)
+
     def start(self, date=datetime_day(datetime.datetime.utcnow())):
         """
         Begin Rocker Board Algorithm
@@ -74,41 +116,12 @@ class RockerBoard(object):
     def replicate(self, dataset_rankings, site_rankings):
         """
         Balance system by creating new replicas based on popularity
+        Dataset sizes, replicas and available storage are loaded once, the plan is made in memory
         """
-        subscriptions = list()
-        subscribed_gb = 0
+        sizes, replicas = self.datasets.get_replica_snapshot()
         sites_available_storage_gb = self.sites.get_all_available_storage()
-        while (subscribed_gb < self.max_gb) and site_rankings:
-            tmp_site_rankings = dict()
-            for k, v in site_rankings.items():
-                tmp_site_rankings[k] = v
-            dataset = max(dataset_rankings.iteritems(), key=operator.itemgetter(1))
-            dataset_name = dataset[0]
-            dataset_rank = dataset[1]
-            if (not dataset_name) or (dataset_rank < 1):
-                break
-            size_gb = self.datasets.get_size(dataset_name)
-            unavailable_sites = set(self.datasets.get_sites(dataset_name))
-            for site_name in tmp_site_rankings.keys():
-                if (self.sites.get_available_storage(site_name) < size_gb) or (tmp_site_rankings[site_name] <= 0):
-                    unavailable_sites.add(site_name)
-            for site_name in unavailable_sites:
-                try:
-                    del tmp_site_rankings[site_name]
-                except:
-                    continue
-            if not tmp_site_rankings:
-                del dataset_rankings[dataset_name]
-                continue
-            site_name = weighted_choice(tmp_site_rankings)
-            subscription = (dataset_name, site_name)
-            subscriptions.append(subscription)
-            subscribed_gb += size_gb
-            sites_available_storage_gb[site_name] -= size_gb
-            self.logger.info('%s : added', dataset_name)
-            if sites_available_storage_gb[site_name] <= 0:
-                del site_rankings[site_name]
-            dataset_rankings[dataset_name] -= 1
+        model = ReplicaModel(sizes, replicas, sites_available_storage_gb)
+        subscriptions, subscribed_gb = model.plan(dataset_rankings, site_rankings, self.max_gb)
         self.logger.info('Subscribed %dGB', subscribed_gb)
         return subscriptions
 
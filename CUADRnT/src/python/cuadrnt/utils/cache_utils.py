@@ -0,0 +1,112 @@
+#!/usr/bin/env python2.7
+"""
+File       : cache_utils.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: In process caching helpers shared between threads
+"""
+
+# system modules
+import logging
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Get module specific logger
+logger = logging.getLogger(__name__)
+
+def canonical_params(params):
+    """
+    Stable string for service parameters, same for equal dicts and for lists of tuples in any order
+    Values which are lists keep their order
+    """
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, (list, tuple)):
+        items = list(params)
+    else:
+        return str(params)
+    items = sorted((str(key), value) for key, value in items)
+    return json.dumps(items, sort_keys=True, default=str)
+
+class LRUCache(object):
+    """
+    Thread safe least recently used cache holding at most max_size entries
+    Entries older than ttl seconds are dropped when they are looked up, no expiry if ttl is None
+    """
+    def __init__(self, max_size=256, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Get value and mark it as recently used
+        """
+        with self.lock:
+            try:
+                value, insert_time = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if (self.ttl is not None) and (time.time() - insert_time > self.ttl):
+                self.misses += 1
+                return default
+            self.data[key] = (value, insert_time)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Insert value, the least recently used entry is dropped if the cache is full
+        """
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, time.time())
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all entries
+        """
+        with self.lock:
+            self.data.clear()
+
+class SingleFlight(object):
+    """
+    Coalesce concurrent calls for the same key, only the first caller runs the function
+    and the others wait for and share its result (or exception)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = dict()
+
+    def do(self, key, function):
+        """
+        Run function for key unless a call for key is already running
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event':threading.Event(), 'result':None, 'error':None}
+                self.calls[key] = call
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = function()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['event'].set()
+        return call['result']
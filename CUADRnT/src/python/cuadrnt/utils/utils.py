@@ -112,3 +112,20 @@ def get_json(json_data, field):
         return json_data[field]
     except (KeyError, TypeError, IndexError):
         return list()
+
+class lazy_property(object):
+    """
+    Decorator for attributes which are only created on first access
+    The created object replaces the property on the instance, so later lookups cost nothing
+    """
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = self.func(obj)
+        obj.__dict__[self.__name__] = value
+        return value
@@ -9,40 +9,215 @@ Description: Useful functions to deal with internet services
 import logging
 import os
 import json
+import zlib
+import socket
+import decimal
 import urllib
 import httplib
 import urllib2
+import urlparse
+import threading
+
+# optional, used to decode very large responses while they are read
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # Get module specific logger
 logger = logging.getLogger(__name__)
 
-class HTTPSClientAuthHandler(urllib2.HTTPSHandler):
+# defaults, can be changed using the web section of the config, see configure
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 300
+MAX_CONNECTIONS = 4
+# responses of these apis, or larger than STREAM_SIZE bytes, are decoded while they are read
+STREAM_APIS = set(['blockreplicas'])
+STREAM_SIZE = 100*10**6
+CHUNK_SIZE = 2**16
+MAX_REDIRECTS = 5
+
+def configure(config=dict()):
+    """
+    Set timeouts, connections per host and streaming options from the web section of the config
+    """
+    global CONNECT_TIMEOUT, READ_TIMEOUT, MAX_CONNECTIONS, STREAM_APIS, STREAM_SIZE
+    CONNECT_TIMEOUT = float(config.get('connect_timeout', CONNECT_TIMEOUT))
+    READ_TIMEOUT = float(config.get('read_timeout', READ_TIMEOUT))
+    MAX_CONNECTIONS = int(config.get('max_connections', MAX_CONNECTIONS))
+    if 'stream_apis' in config:
+        STREAM_APIS = set(api.strip() for api in config['stream_apis'].split(',') if api.strip())
+    STREAM_SIZE = int(config.get('stream_size', STREAM_SIZE))
+
+def get_proxy():
+    """
+    Proxy used as key and certificate for client authentication
+    """
+    proxy = os.environ.get('X509_USER_PROXY')
+    if not proxy:
+        proxy = "/tmp/x509up_u%d" % (os.geteuid(),)
+    return proxy
+
+class GzipReader(object):
+    """
+    File like object decompressing a gzip encoded response while it is read
+    """
+    def __init__(self, response):
+        self.response = response
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        """
+        Read up to size decompressed bytes, everything if size is negative
+        """
+        while (size < 0) or (len(self.buffer) < size):
+            data = self.response.read(CHUNK_SIZE)
+            if not data:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(data)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+class HTTPSSession(object):
     """
-    Simple HTTPS client authentication class
-    Require that a valid proxy exists
+    Thread safe pool of keep-alive https connections per host
+    Connections authenticate using the proxy and ask for gzip encoded responses
     """
     def __init__(self):
-        urllib2.HTTPSHandler.__init__(self)
-        self.key = self.get_proxy()
-        self.cert = self.key
+        self.lock = threading.Lock()
+        self.connections = dict()
 
-    def get_proxy(self):
-        proxy = os.environ.get('X509_USER_PROXY')
-        if not proxy:
-            proxy = "/tmp/x509up_u%d" % (os.geteuid(),)
-        return proxy
+    def get_connection(self, host):
+        """
+        Idle connection to host, a new one if there are none
+        """
+        with self.lock:
+            connections = self.connections.get(host, list())
+            if connections:
+                return connections.pop()
+        proxy = get_proxy()
+        if os.path.exists(proxy):
+            return httplib.HTTPSConnection(host, key_file=proxy, cert_file=proxy, timeout=CONNECT_TIMEOUT)
+        return httplib.HTTPSConnection(host, timeout=CONNECT_TIMEOUT)
 
-    def https_open(self, request):
-        """Open request method"""
-        return self.do_open(self.get_connection, request)
+    def release_connection(self, host, connection):
+        """
+        Keep connection for the next request to host unless there are enough idle connections already
+        """
+        with self.lock:
+            connections = self.connections.setdefault(host, list())
+            if len(connections) < MAX_CONNECTIONS:
+                connections.append(connection)
+                return
+        connection.close()
 
-    def get_connection(self, host, timeout=300):
-        """Connection method"""
-        if self.cert:
-            return httplib.HTTPSConnection(host, key_file=self.key, cert_file=self.cert)
-        return httplib.HTTPSConnection(host)
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            for connections in self.connections.values():
+                for connection in connections:
+                    connection.close()
+            self.connections.clear()
 
-def get_secure_data(target_url, api, params=dict(), method='get'):
+    def send(self, host, method, path, body=None, content_type='application/x-www-form-urlencoded'):
+        """
+        Send request and return the response and the connection it was read from
+        A kept alive connection can have been closed by the server, then retry on a new one
+        POST requests are only retried if sending failed, a read timeout is never retried
+        """
+        headers = {'Accept':'application/json', 'Accept-Encoding':'gzip', 'Connection':'keep-alive'}
+        if body is not None:
+            headers['Content-Type'] = content_type
+        for i in range(2):
+            connection = self.get_connection(host)
+            reused = connection.sock is not None
+            sent = False
+            try:
+                connection.request(method, path, body, headers)
+                sent = True
+                connection.sock.settimeout(READ_TIMEOUT)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                stale = (not sent) or ((method == 'GET') and not isinstance(e, socket.timeout))
+                if reused and stale and (i == 0):
+                    continue
+                raise
+            return response, connection
+
+    def request(self, url, data=None, stream=False, content_type='application/x-www-form-urlencoded'):
+        """
+        GET url, or POST data to it, and return the decoded json data
+        Redirects are followed
+        """
+        method = 'GET' if data is None else 'POST'
+        for i in range(MAX_REDIRECTS + 1):
+            parsed_url = urlparse.urlsplit(url)
+            path = parsed_url.path or '/'
+            if parsed_url.query:
+                path = '%s?%s' % (path, parsed_url.query)
+            response, connection = self.send(parsed_url.netloc, method, path, data, content_type)
+            try:
+                if response.status in (301, 302, 303, 307) and response.getheader('location'):
+                    response.read()
+                    self.release_connection(parsed_url.netloc, connection)
+                    url = urlparse.urljoin(url, response.getheader('location'))
+                    if response.status == 303:
+                        method, data = 'GET', None
+                    continue
+                if response.status != 200:
+                    response.read()
+                    raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+                content_length = int(response.getheader('content-length') or 0)
+                json_data = decode_json(response, stream=stream or (content_length > STREAM_SIZE))
+            except:
+                connection.close()
+                raise
+            self.release_connection(parsed_url.netloc, connection)
+            return json_data
+        raise urllib2.URLError('Too many redirects for %s' % (url))
+
+def decode_json(response, stream=False):
+    """
+    Decode json data of a response, gzip encoded responses are decompressed while they are read
+    If stream is true and ijson is installed decode while reading, the full text is never kept
+    The response is read to the end so the connection can be reused
+    """
+    reader = response
+    if response.getheader('content-encoding', '').lower() == 'gzip':
+        reader = GzipReader(response)
+    if stream and ijson:
+        builder = ijson.common.ObjectBuilder()
+        for prefix, event, value in ijson.parse(reader):
+            if isinstance(value, decimal.Decimal):
+                value = float(value)
+            builder.event(event, value)
+        while reader.read(CHUNK_SIZE):
+            pass
+        return builder.value
+    return json.loads(reader.read())
+
+# shared by all threads and services of the process, created on first use
+session = None
+session_lock = threading.Lock()
+
+def get_session():
+    """
+    Get the https session of the process
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = HTTPSSession()
+        return session
+
+def get_secure_data(target_url, api, params=dict(), method='get', stream=False):
     """
     Create https request for target_url, api and params of service
     Data should be json data returned as a string
@@ -50,26 +225,25 @@ def get_secure_data(target_url, api, params=dict(), method='get'):
     and the second is the value, this value can be a list of values which will
     then be split up
     Make sure host certificate for secure site is installed in SSL library
+    Requests use the pooled keep-alive connections of the https session
+    If method is json params are posted as a json document
     """
-    data = urllib.urlencode(params, doseq=True)
-    url = '%s/%s' % (target_url, api)
-    if method == 'post':
-        request = urllib2.Request(url, data)
+    if method == 'json':
+        data = json.dumps(params)
     else:
-        full_url = '%s?%s' % (str(url), str(data))
-        request = urllib2.Request(full_url)
-    handler = HTTPSClientAuthHandler()
-    opener = urllib2.build_opener(handler)
-    urllib2.install_opener(opener)
+        data = urllib.urlencode(params, doseq=True)
+    url = '%s/%s' % (target_url, api)
     try:
-        response = urllib2.urlopen(request)
+        if method == 'json':
+            json_data = get_session().request(url, data=data, stream=stream or (api in STREAM_APIS), content_type='application/json')
+        elif method == 'post':
+            json_data = get_session().request(url, data=data, stream=stream or (api in STREAM_APIS))
+        else:
+            full_url = '%s?%s' % (str(url), str(data))
+            json_data = get_session().request(full_url, stream=stream or (api in STREAM_APIS))
     except Exception as e:
         logger.warning("Couldn't fetch data for url %s?%s\n    Reason:\n    %s", str(url), str(data), str(e))
         json_data = dict()
-    else:
-        return_data = response.read()
-        response.close()
-        json_data = json.loads(return_data)
     return json_data
 
 def get_data(target_url, api, file_):
@@ -83,7 +257,7 @@ def get_data(target_url, api, file_):
     """
     json_data = list()
     try:
-        response = urllib2.urlopen('%s/%s/%s' % (target_url, api, file_))
+        response = urllib2.urlopen('%s/%s/%s' % (target_url, api, file_), timeout=READ_TIMEOUT)
     except Exception as e:
         logger.warning("Couldn't fetch data for url %s/%s/%s\n    Reason:\n    %s", str(target_url), str(api), str(file_), str(e))
     else:
@@ -0,0 +1,81 @@
+#!/usr/bin/env python2.7
+"""
+File       : dm_feature_store_t.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: Test class for the feature store
+"""
+
+# system modules
+import unittest
+import shutil
+import tempfile
+import numpy as np
+
+# package modules
+from cuadrnt.data_management.core.feature_store import FeatureStore
+
+class FeatureStoreTests(unittest.TestCase):
+    """
+    A test class for the feature store
+    """
+    def setUp(self):
+        "Set up for test"
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        "Clean up"
+        shutil.rmtree(self.path)
+
+    #@unittest.skip("Skip Test")
+    def test_append(self):
+        "Test appending days and reading them back memory mapped"
+        store = FeatureStore(self.path)
+        store.append('AOD', [[1.0, 2.0], [3.0, 4.0]], [1, 0], [0.5, 1.5], day='20160101', feature_names=['a', 'b'])
+        store.append('AOD', [[5.0, 6.0]], [1], [2.5], day='20160102')
+        store.append('MINIAOD', list(), list(), list(), day='20160102')
+        store = FeatureStore(self.path)
+        expected = 3
+        result = store.n_rows('AOD')
+        self.assertEqual(result, expected)
+        expected = set(['20160101', '20160102'])
+        result = store.days('AOD')
+        self.assertEqual(result, expected)
+        features, trends, avgs = store.load('AOD')
+        self.assertTrue(isinstance(features, np.memmap))
+        expected = [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+        self.assertEqual(features.tolist(), expected)
+        expected = [1, 0, 1]
+        self.assertEqual(trends.tolist(), expected)
+        expected = [0.5, 1.5, 2.5]
+        self.assertEqual(avgs.tolist(), expected)
+        self.assertRaises(IOError, store.load, 'MINIAOD')
+        self.assertRaises(ValueError, store.append, 'AOD', [[1.0, 2.0, 3.0]], [1], [1.0])
+
+    #@unittest.skip("Skip Test")
+    def test_split(self):
+        "Test training and test sets are views"
+        store = FeatureStore(self.path)
+        store.append('AOD', np.arange(20).reshape(10, 2), np.arange(10), np.arange(10))
+        training, test = store.split('AOD')
+        expected = 8
+        result = len(training[0])
+        self.assertEqual(result, expected)
+        expected = [8, 9]
+        result = test[1].tolist()
+        self.assertEqual(result, expected)
+        self.assertFalse(training[0].flags['OWNDATA'])
+        self.assertFalse(test[0].flags['OWNDATA'])
+
+    #@unittest.skip("Skip Test")
+    def test_interrupted_append(self):
+        "Test rows of an append which did not update the schema are dropped"
+        store = FeatureStore(self.path)
+        store.append('AOD', [[1.0, 2.0]], [1], [1.0])
+        store.schema['tiers']['AOD']['n_rows'] = 0
+        store.append('AOD', [[3.0, 4.0]], [0], [2.0])
+        features, trends, avgs = store.load('AOD')
+        expected = [[3.0, 4.0]]
+        self.assertEqual(features.tolist(), expected)
+
+if __name__ == '__main__':
+    unittest.main()
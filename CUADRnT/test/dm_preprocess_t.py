@@ -0,0 +1,54 @@
+#!/usr/bin/env python2.7
+"""
+File       : dm_preprocess_t.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: Test class for feature construction
+"""
+
+# system modules
+import unittest
+import numpy as np
+
+# package modules
+from cuadrnt.data_management.core.preprocess import featurize_tier
+
+class PreprocessTests(unittest.TestCase):
+    """
+    A test class for preprocessing
+    """
+    def setUp(self):
+        "Set up for test"
+        pass
+
+    def tearDown(self):
+        "Clean up"
+        pass
+
+    #@unittest.skip("Skip Test")
+    def test_featurize_tier(self):
+        "Test rolling window features and labels"
+        pops = np.zeros((3, 20))
+        pops[0, :] = 1.0
+        pops[1, 10:] = 2.0
+        sizes_gb = np.array([1.0, 2.0, 3.0])
+        n_files = np.array([10.0, 20.0, 30.0])
+        data_tier, results = featurize_tier(('AOD', pops, sizes_gb, n_files, [7, 12]))
+        expected = 'AOD'
+        self.assertEqual(data_tier, expected)
+        day_index, features, trends, avgs = results[1]
+        expected = 12
+        self.assertEqual(day_index, expected)
+        # dataset without any accesses is left out
+        expected = (2, 9)
+        self.assertEqual(features.shape, expected)
+        expected = [0, 0, 0, 0, 0, 2, 2, 2, 20]
+        self.assertEqual(features[1].tolist(), expected)
+        expected = [0, 1]
+        self.assertEqual(trends.tolist(), expected)
+        expected = [1.0, 2.0]
+        self.assertEqual(avgs.tolist(), expected)
+        day_index, features, trends, avgs = results[0]
+        self.assertAlmostEqual(avgs[1], 8.0/7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,9 +9,11 @@ Description: Test class for storage class
 import unittest
 import os
 from datetime import datetime
+from pymongo import UpdateOne
 
 # package modules
 from cuadrnt.utils.config import get_config
+from cuadrnt.utils.cache_utils import canonical_params
 from cuadrnt.data_management.services.phedex import PhEDExService
 from cuadrnt.data_management.core.storage import StorageManager
 
@@ -51,10 +53,10 @@ class StorageTests(unittest.TestCase):
         params = {'level':'block', 'dataset':'/DoubleElectron/Run2012D-22Jan2013-v1/AOD'}
         expected = '/DoubleElectron/Run2012D-22Jan2013-v1/AOD'
         phedex.fetch(api=api, params=params, cache_only=True, force_cache=True)
-        cache_data = self.storage.get_cache(coll='phedex', api=api, params=params)
+        cache_data = self.storage.get_cache(coll='phedex', api=api, params=canonical_params(params))
         try:
             result = cache_data['phedex']['dbs'][0]['dataset'][0]['name']
-        except KeyError:
+        except (KeyError, TypeError):
             self.assertTrue(False)
         else:
             self.assertEqual(result, expected)
@@ -92,5 +94,25 @@ class StorageTests(unittest.TestCase):
         datetime_2 = self.storage.get_last_insert_time(coll)
         self.assertTrue(datetime_1 <= datetime_2)
 
+    #@unittest.skip("Skip Test")
+    def test_bulk_write(self):
+        "Test batched bulk writes"
+        coll = 'test'
+        requests = [UpdateOne({'foo':i}, {'$set':{'foo':i, 'bar':0}}, upsert=True) for i in range(5)]
+        result = self.storage.bulk_write(coll=coll, requests=requests, batch_size=2)
+        expected = 5
+        self.assertEqual(result['upserted'], expected)
+        requests = [UpdateOne({'foo':i}, {'$set':{'bar':1}}) for i in range(3)]
+        result = self.storage.bulk_write(coll=coll, requests=requests)
+        expected = 3
+        self.assertEqual(result['modified'], expected)
+        pipeline = list()
+        match = {'$match':{'bar':1}}
+        pipeline.append(match)
+        data = self.storage.get_data(coll=coll, pipeline=pipeline)
+        expected = 3
+        result = len(data)
+        self.assertEqual(result, expected)
+
 if __name__ == '__main__':
     unittest.main()
@@ -8,6 +8,7 @@ Description: Test class for tool classes
 # system modules
 import unittest
 import os
+import datetime
 
 # package modules
 from cuadrnt.utils.config import get_config
@@ -69,5 +70,60 @@ class ToolsTests(unittest.TestCase):
         # popularity.initiate_db()
         # popularity.update_db()
 
+    #@unittest.skip("Skip Test")
+    def test_average_popularities(self):
+        "Test batch popularity averages against the single dataset version"
+        popularity = PopularityManager(config=self.config)
+        date = datetime.datetime(2016, 1, 8)
+        data = list()
+        for day in range(1, 8):
+            data.append({'name':'/A/B/C', 'date':datetime.datetime(2016, 1, day), 'n_accesses':day, 'n_cpus':10*day})
+        data.append({'name':'/D/E/F', 'date':datetime.datetime(2016, 1, 3), 'n_accesses':5, 'n_cpus':0})
+        popularity.storage.insert_data(coll='dataset_popularity', data=data)
+        dataset_names = ['/A/B/C', '/D/E/F', '/G/H/I']
+        result = popularity.get_average_popularities(dataset_names, date)
+        for dataset_name in dataset_names:
+            expected = popularity.get_average_popularity(dataset_name, date)
+            self.assertAlmostEqual(result[dataset_name], expected)
+        popularity.storage.drop_db()
+
+    #@unittest.skip("Skip Test")
+    def test_dataset_metadata(self):
+        "Test batched dataset metadata"
+        datasets = DatasetManager(config=self.config)
+        dataset_names = ['/ZMM/Summer11-DESIGN42_V11_428_SLHC1-v1/GEN-SIM', '/Not/A-Dataset/AOD']
+        phedex_data = datasets.get_phedex_data(dataset_names)
+        dbs_data = datasets.get_dbs_data(dataset_names)
+        expected = set(dataset_names[:1])
+        self.assertEqual(set(phedex_data.keys()), expected)
+        self.assertEqual(set(dbs_data.keys()), expected)
+        expected = 'GEN-SIM'
+        result = dbs_data[dataset_names[0]]['data_tier']
+        self.assertEqual(result, expected)
+        self.assertTrue(phedex_data[dataset_names[0]]['n_files'] > 0)
+
+    #@unittest.skip("Skip Test")
+    def test_max_cpu(self):
+        "Test maximum CPU's of sites from cpu samples"
+        sites = SiteManager(config=self.config)
+        date = datetime.datetime.utcnow()
+        data = list()
+        for day, cpus in ((1, 100), (5, 300), (40, 1000)):
+            data.append({'name':'T2_US_Nebraska', 'date':date - datetime.timedelta(days=day), 'cpus':cpus})
+        sites.storage.insert_data(coll='site_cpu', data=data)
+        cpu_data = [{'date':date - datetime.timedelta(days=2), 'cpus':200}, {'date':date - datetime.timedelta(days=2), 'cpus':500}]
+        data = [{'name':'T2_US_Nebraska', 'quota_gb':1000, 'cpu_data':cpu_data}, {'name':'T2_US_MIT', 'quota_gb':1000, 'cpu_data':cpu_data}]
+        sites.storage.insert_data(coll='site_data', data=data)
+        expected = 300
+        result = sites.get_max_cpu('T2_US_Nebraska')
+        self.assertEqual(result, expected)
+        expected = 500
+        result = sites.get_max_cpu('T2_US_MIT')
+        self.assertEqual(result, expected)
+        expected = 0
+        result = sites.get_max_cpu('T2_US_Florida')
+        self.assertEqual(result, expected)
+        sites.storage.drop_db()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python2.7
+"""
+File       : sm_replica_model_t.py
+Author     : Bjorn Barrefors <bjorn dot peter dot barrefors AT cern dot ch>
+Description: Test and benchmark the in memory replication planner with synthetic rankings
+"""
+
+# system modules
+import unittest
+import random
+import operator
+import time
+import logging
+
+# package modules
+from cuadrnt.utils.utils import weighted_choice
+from cuadrnt.system_management.core.replica_model import WeightedSampler
+from cuadrnt.system_management.core.replica_model import ReplicaModel
+
+logger = logging.getLogger(__name__)
+
+def synthetic_system(n_datasets, n_sites, seed=42):
+    """
+    Random dataset sizes, replicas, dataset rankings and site rankings
+    """
+    rand = random.Random(seed)
+    site_names = ['T2_XX_Site%d' % (i) for i in range(n_sites)]
+    dataset_sizes = dict()
+    dataset_replicas = dict()
+    dataset_rankings = dict()
+    for i in range(n_datasets):
+        dataset_name = '/Primary%d/Processed-v1/AOD' % (i)
+        dataset_sizes[dataset_name] = rand.uniform(1, 2000)
+        dataset_replicas[dataset_name] = rand.sample(site_names, rand.randint(1, 3))
+        dataset_rankings[dataset_name] = rand.randint(-2, 4)
+    sites_available_storage_gb = dict((site_name, rand.uniform(0, 200000)) for site_name in site_names)
+    site_rankings = dict((site_name, rand.uniform(-0.5, 5)) for site_name in site_names)
+    return dataset_sizes, dataset_replicas, dataset_rankings, sites_available_storage_gb, site_rankings
+
+def reference_replicate(dataset_sizes, dataset_replicas, dataset_rankings, sites_available_storage_gb, site_rankings, max_gb):
+    """
+    Previous RockerBoard.replicate loop on in memory data, max over all datasets and a copy of the
+    site rankings for every new replica
+    """
+    subscriptions = list()
+    subscribed_gb = 0
+    while (subscribed_gb < max_gb) and site_rankings:
+        tmp_site_rankings = dict(site_rankings)
+        dataset_name, dataset_rank = max(dataset_rankings.iteritems(), key=operator.itemgetter(1))
+        if dataset_rank < 1:
+            break
+        size_gb = dataset_sizes[dataset_name]
+        unavailable_sites = set(dataset_replicas[dataset_name])
+        for site_name in tmp_site_rankings.keys():
+            if (sites_available_storage_gb[site_name] < size_gb) or (tmp_site_rankings[site_name] <= 0):
+                unavailable_sites.add(site_name)
+        for site_name in unavailable_sites:
+            tmp_site_rankings.pop(site_name, None)
+        if not tmp_site_rankings:
+            del dataset_rankings[dataset_name]
+            continue
+        site_name = weighted_choice(tmp_site_rankings)
+        subscriptions.append((dataset_name, site_name))
+        subscribed_gb += size_gb
+        sites_available_storage_gb[site_name] -= size_gb
+        if sites_available_storage_gb[site_name] <= 0:
+            del site_rankings[site_name]
+        dataset_rankings[dataset_name] -= 1
+    return subscriptions, subscribed_gb
+
+class ReplicaModelTests(unittest.TestCase):
+    """
+    A test class for the replica model
+    """
+    def setUp(self):
+        "Set up for test"
+        random.seed(1)
+
+    def tearDown(self):
+        "Clean up"
+        pass
+
+    #@unittest.skip("Skip Test")
+    def test_sampler(self):
+        "Test weighted sampler"
+        sampler = WeightedSampler({'a':1, 'b':3, 'c':0, 'd':-1})
+        counts = {'a':0, 'b':0}
+        for i in range(4000):
+            counts[sampler.choice()] += 1
+        self.assertTrue(800 < counts['a'] < 1200)
+        sampler.update('b', 0)
+        expected = 'a'
+        result = sampler.choice()
+        self.assertEqual(result, expected)
+        sampler.update('a', 0)
+        expected = None
+        result = sampler.choice()
+        self.assertEqual(result, expected)
+        sampler.update('c', 2)
+        expected = 'c'
+        result = sampler.choice()
+        self.assertEqual(result, expected)
+
+    #@unittest.skip("Skip Test")
+    def test_plan(self):
+        "Test planned replicas respect replicas, space, ranks and volume"
+        dataset_sizes, dataset_replicas, dataset_rankings, sites_available_storage_gb, site_rankings = synthetic_system(2000, 60)
+        max_gb = 300000
+        ranks = dict(dataset_rankings)
+        model = ReplicaModel(dataset_sizes, dataset_replicas, sites_available_storage_gb)
+        subscriptions, subscribed_gb = model.plan(dataset_rankings, site_rankings, max_gb)
+        self.assertTrue(subscriptions)
+        used_gb = dict()
+        new_replicas = dict()
+        for dataset_name, site_name in subscriptions:
+            self.assertTrue(site_rankings[site_name] > 0)
+            self.assertFalse(site_name in dataset_replicas[dataset_name])
+            self.assertFalse(site_name in new_replicas.get(dataset_name, set()))
+            new_replicas.setdefault(dataset_name, set()).add(site_name)
+            used_gb[site_name] = used_gb.get(site_name, 0) + dataset_sizes[dataset_name]
+            self.assertTrue(used_gb[site_name] <= sites_available_storage_gb[site_name] + dataset_sizes[dataset_name])
+        for dataset_name, site_names in new_replicas.items():
+            self.assertTrue(len(site_names) <= ranks[dataset_name])
+        self.assertTrue(subscribed_gb - max(dataset_sizes.values()) < max_gb)
+
+    #@unittest.skip("Skip Test")
+    def test_benchmark(self):
+        "Benchmark planner against the previous replicate loop"
+        print ""
+        for n_datasets in (2000, 20000):
+            system = synthetic_system(n_datasets, 60)
+            dataset_sizes, dataset_replicas, dataset_rankings, sites_available_storage_gb, site_rankings = system
+            max_gb = 10**6
+            t1 = time.time()
+            subscriptions, subscribed_gb = reference_replicate(dataset_sizes, dataset_replicas, dict(dataset_rankings), dict(sites_available_storage_gb), dict(site_rankings), max_gb)
+            t2 = time.time()
+            model = ReplicaModel(dataset_sizes, dataset_replicas, sites_available_storage_gb)
+            new_subscriptions, new_subscribed_gb = model.plan(dict(dataset_rankings), dict(site_rankings), max_gb)
+            t3 = time.time()
+            print "%6d datasets: previous loop %.3fs (%d replicas), replica model %.3fs (%d replicas)" % (n_datasets, t2 - t1, len(subscriptions), t3 - t2, len(new_subscriptions))
+            self.assertTrue(new_subscriptions)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,9 @@ import unittest
 import os
 import json
 import datetime
+import threading
+import gzip
+import StringIO
 from bson.objectid import ObjectId
 
 # package modules
@@ -30,6 +33,11 @@ from cuadrnt.utils.utils import phedex_timestamp_to_datetime
 from cuadrnt.utils.utils import pop_db_timestamp_to_datetime
 from cuadrnt.utils.utils import datetime_remove_timezone
 from cuadrnt.utils.utils import get_json
+from cuadrnt.utils.utils import lazy_property
+from cuadrnt.utils.cache_utils import canonical_params
+from cuadrnt.utils.cache_utils import LRUCache
+from cuadrnt.utils.cache_utils import SingleFlight
+from cuadrnt.utils.web_utils import decode_json
 
 # get local config file
 opt_path = os.path.join(os.path.split(os.path.dirname(os.path.realpath(__file__)))[0], 'etc')
@@ -208,5 +216,136 @@ class UtilsTests(unittest.TestCase):
         expected = [{'bar':1}, {'bar':2}]
         result = get_json(json_data, field)
 
+class LocalUtilsTests(unittest.TestCase):
+    """
+    A test class for util functions which need no database or network
+    """
+    def setUp(self):
+        "Set up for test"
+        pass
+
+    def tearDown(self):
+        "Clean up"
+        pass
+
+    #@unittest.skip("Skip Test")
+    def test_lazy_property(self):
+        "Test lazy_property decorator"
+        class Foo(object):
+            created = list()
+            @lazy_property
+            def bar(self):
+                self.created.append('bar')
+                return list()
+        foo = Foo()
+        expected = list()
+        self.assertEqual(Foo.created, expected)
+        foo.bar.append(1)
+        foo.bar.append(2)
+        expected = [1, 2]
+        self.assertEqual(foo.bar, expected)
+        expected = ['bar']
+        self.assertEqual(Foo.created, expected)
+
+    #@unittest.skip("Skip Test")
+    def test_canonical_params(self):
+        "Test canonical_params function"
+        params_1 = [('node', 'T2_US_Nebraska'), ('dataset', '/A/B/C'), ('create_since', 0)]
+        params_2 = [('create_since', 0), ('node', 'T2_US_Nebraska'), ('dataset', '/A/B/C')]
+        self.assertEqual(canonical_params(params_1), canonical_params(params_2))
+        self.assertEqual(canonical_params(dict(params_1)), canonical_params(params_2))
+        params_3 = [('node', 'T2_US_Nebraska'), ('dataset', '/A/B/D'), ('create_since', 0)]
+        self.assertNotEqual(canonical_params(params_1), canonical_params(params_3))
+
+    #@unittest.skip("Skip Test")
+    def test_lru_cache(self):
+        "Test LRUCache class"
+        cache = LRUCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        expected = 1
+        result = cache.get('a')
+        self.assertEqual(result, expected)
+        cache.put('c', 3)
+        expected = None
+        result = cache.get('b')
+        self.assertEqual(result, expected)
+        expected = 3
+        result = cache.get('c')
+        self.assertEqual(result, expected)
+        expected = (2, 1)
+        result = (cache.hits, cache.misses)
+        self.assertEqual(result, expected)
+        cache = LRUCache(max_size=2, ttl=-1)
+        cache.put('a', 1)
+        expected = None
+        result = cache.get('a')
+        self.assertEqual(result, expected)
+
+    #@unittest.skip("Skip Test")
+    def test_single_flight(self):
+        "Test SingleFlight class"
+        class CountingLock(object):
+            "Lock which counts the calls that passed it"
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.passed = threading.Condition()
+                self.count = 0
+            def __enter__(self):
+                self.lock.acquire()
+            def __exit__(self, *args):
+                self.lock.release()
+                with self.passed:
+                    self.count += 1
+                    self.passed.notify_all()
+        flight = SingleFlight()
+        flight.lock = CountingLock()
+        calls = list()
+        started = threading.Event()
+        release = threading.Event()
+        def function():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return {'data':1}
+        results = list()
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', function))) for i in range(5)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        # the leader and the four others have registered with the flight, release the leader
+        with flight.lock.passed:
+            while flight.lock.count < 5:
+                flight.lock.passed.wait()
+        release.set()
+        for thread in threads:
+            thread.join()
+        expected = [1]
+        self.assertEqual(calls, expected)
+        expected = [{'data':1}]*5
+        self.assertEqual(results, expected)
+
+    #@unittest.skip("Skip Test")
+    def test_decode_json(self):
+        "Test decode_json function"
+        class Response(StringIO.StringIO):
+            headers = dict()
+            def getheader(self, name, default=None):
+                return self.headers.get(name, default)
+        json_data = {'phedex':{'block':[{'name':'/A/B/C#1', 'bytes':10, 'replica':[{'node':'T2_US_Nebraska'}]}]}}
+        response = Response(json.dumps(json_data))
+        result = decode_json(response)
+        self.assertEqual(result, json_data)
+        data = StringIO.StringIO()
+        gzip_file = gzip.GzipFile(fileobj=data, mode='w')
+        gzip_file.write(json.dumps(json_data))
+        gzip_file.close()
+        response = Response(data.getvalue())
+        response.headers = {'content-encoding':'gzip'}
+        result = decode_json(response, stream=True)
+        self.assertEqual(result, json_data)
+        self.assertEqual(response.read(), '')
+
 if __name__ == '__main__':
     unittest.main()
@@ -18,9 +18,9 @@
 # Failures of any essential part of this assignment will lead to a non-zero return code. For now the
 # failure return code is always 1.
 #
-# Implementation: by design this should be a standalone script that will work when you copy it into
-# your directory. It is important so that it virtually runs anywhere and anyone can easily use it
-# without having to checkout anything from github.
+# Implementation: the script is not standalone anymore, it has to be run from an IntelROCCS
+# checkout. PhEDEx calls go through the shared phedexClient module, which is imported from Api/src
+# of the same checkout (copying the script alone into your directory does not work).
 #
 # Set up dbs3 client (of course you have to install it first):
 #   VO_CMS_SW_DIR=$HOME/cms/cmssoft
@@ -30,8 +30,19 @@
 #
 # Unit test:
 #   ./assignDatasetToSite.py --nCopies=2 --dataset=/DoubleElectron/Run2012A-22Jan2013-v1/AOD
+#
+# PhEDEx calls go over the persistent connections of the shared phedexClient.
+#
+# Batch mode (--datasetList=<file> or --batch): all datasets are looked up together in DBS, PhEDEx
+# subscriptions are queried once per group/site pattern, the placement is done against one shared
+# in-memory model of the site capacities and one subscription request is made per destination site.
+#   ./assignDatasetToSite.py --nCopies=1 --datasetList=datasets.txt
 #---------------------------------------------------------------------------------------------------
-import os, sys, subprocess, getopt, re, random, urllib, urllib2, httplib, json
+import os, sys, subprocess, getopt, re, random, urllib, urllib2, httplib, json, threading, Queue
+import time, StringIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                'Api', 'src'))
+import phedexClient
 from dbs.apis.dbsClient import DbsApi
 
 #===================================================================================================
@@ -63,29 +74,26 @@ class phedexApi:
         """
         self.phedexBase = "https://cmsweb.cern.ch/phedex/datasvc/"
 
-    def phedexCall(self, url, values):
+    def phedexCall(self, url, values, readOnly=True):
         """
         _phedexCall_
         Make http post call to PhEDEx API. Function only gaurantees that something is returned, the
-        caller need to check the response for correctness.
-        url    - URL to make API call
-        values - arguments to pass to the call
+        caller need to check the response for correctness. Only read-only calls are retried.
+        url      - URL to make API call
+        values   - arguments to pass to the call
+        readOnly - False for calls which change something (subscribe, delete, ...)
         Return values:
         1 -- Status, 0 = everything went well, 1 = something went wrong
         2 -- IF status == 0 : HTTP response ELSE : Error message
         """
-        data = urllib.urlencode(values)
-        opener = urllib2.build_opener(HTTPSGridAuthHandler())
-        request = urllib2.Request(url, data)
         try:
-            response = opener.open(request)
-        except urllib2.HTTPError, e:
-            return 1, " ERROR - urllib2.HTTPError %s \n  URL: %s\n  VALUES: %s"%\
-                   (e.read,str(url),str(values))
-        except urllib2.URLError, e:
-            return 1, " ERROR - urllib2.URLError %s \n  URL: %s\n  VALUES: %s"%\
-                   (e.args,str(url),str(values))
-        return 0, response
+            status, body = phedexClient.getClient(getProxy()).call(url, values, idempotent=readOnly)
+        except phedexClient.phedexClientError, e:
+            return 1, " ERROR - %s \n  URL: %s\n  VALUES: %s"%(str(e),str(url),str(values))
+        if status != 200:
+            return 1, " ERROR - HTTP status %d %s \n  URL: %s\n  VALUES: %s"%\
+                   (status,body,str(url),str(values))
+        return 0, StringIO.StringIO(body)
 
     def data(self, dataset='', block='', fileName='', level='block',
              createSince='', format='json', instance='prod'):
@@ -201,7 +209,7 @@ class phedexApi:
                    'time_start' : timeStart, 'request_only' : requestOnly, 'no_mail' : noMail,
                    'comments' : comments }
         subscriptionURL = urllib.basejoin(self.phedexBase, "%s/%s/subscribe" % (format, instance))
-        check, response = self.phedexCall(subscriptionURL, values)
+        check, response = self.phedexCall(subscriptionURL, values, readOnly=False)
         if check:
             return 1, "ERROR - subscription: check not zero"
         return 0, response
@@ -217,7 +225,7 @@ class phedexApi:
         values = { 'node' : node, 'data' : data, 'level' : level,
                    'rm_subscriptions' : rmSubscriptions, 'comments' : comments }
         deleteURL = urllib.basejoin(self.phedexBase, "%s/%s/delete" % (format, instance))
-        check, response = self.phedexCall(deleteURL, values)
+        check, response = self.phedexCall(deleteURL, values, readOnly=False)
         if check:
             return 1, " ERROR - self.phedexCall with response: " + response
         return 0, response
@@ -233,39 +241,23 @@ class phedexApi:
             return 1, "ERROR - %s: node and dataset are needed."%(name)
         values = {'node' : node, 'dataset' : dataset, 'group' : group}
         url = urllib.basejoin(self.phedexBase, "%s/%s/%s" % (format,instance,name))
-        check, response = self.phedexCall(url, values)
+        check, response = self.phedexCall(url, values, readOnly=False)
         if check:
             return 1, "ERROR - self.phedexCall with response: " + response
         return 0, response
 
 #---------------------------------------------------------------------------------------------------
-class HTTPSGridAuthHandler(urllib2.HTTPSHandler):
-    """
-    _HTTPSGridAuthHandler_
-    Get proxy to acces PhEDEx API. Needed for subscribe and delete calls.
-    Class variables:
-      key  -- user key to CERN with access to PhEDEx
-      cert -- user certificate connected to key
-    """
-
-    def __init__(self):
-        urllib2.HTTPSHandler.__init__(self)
-        self.key = self.getProxy()
-        self.cert = self.key
+proxyPath = None
 
-    def https_open(self, req):
-        return self.do_open(self.getConnection, req)
-
-    def getProxy(self):
+def getProxy():
+    # path of the user proxy, asked only once per run
+    global proxyPath
+    if proxyPath is None:
         #proxy = os.environ['X509_USER_PROXY']
         cmd = 'voms-proxy-info -path'
         for line in subprocess.Popen(cmd,shell=True,stdout=subprocess.PIPE).stdout.readlines():
-	    proxy = line[:-1]
-        
-        return proxy
-
-    def getConnection(self, host, timeout=300):
-        return httplib.HTTPSConnection(host, key_file=self.key, cert_file=self.cert)
+            proxyPath = line[:-1]
+    return proxyPath
 
 #===================================================================================================
 #  H E L P E R S
@@ -327,18 +319,20 @@ def convertSizeToGb(sizeTxt):
     # return the size in GB as a float
     return sizeGb
 
+def phedexGet(query):
+    # GET request to the PhEDEx data service, over the shared client
+
+    status, body = phedexClient.getClient(getProxy()).call('https://cmsweb.cern.ch' + query,
+                                                           method='GET')
+    return body
+
 def findExistingSubscriptions(dataset,group='AnalysisOps',sitePattern='T2*',debug=0):
     # Find existing subscriptions of full datasets at sites matching the pattern
 
     # speak with phedex interface
-    conn = httplib.HTTPSConnection('cmsweb.cern.ch', \
-                                   cert_file = os.getenv('X509_USER_PROXY'), \
-                                   key_file = os.getenv('X509_USER_PROXY'))
     subsc = '/phedex/datasvc/json/prod/subscriptions'
-    r1 = conn.request("GET",subsc + '?group=%s&node=%s&block=%s%%23*&collapse=y' \
-                          %(group,sitePattern,dataset))
-    r2 = conn.getresponse()
-    result = json.loads(r2.read())['phedex']
+    result = json.loads(phedexGet(subsc + '?group=%s&node=%s&block=%s%%23*&collapse=y' \
+                                      %(group,sitePattern,dataset)))['phedex']
 
     # loop overall datasets to find all sites the given dataset is on
     siteNames = []
@@ -366,6 +360,99 @@ def findExistingSubscriptions(dataset,group='AnalysisOps',sitePattern='T2*',debu
 
     return siteNames
 
+def loadSiteSnapshot(ttl=3600,debug=0):
+    # Load the site capacity snapshot (validity, quota, taken and last copy space in GB) of the
+    # AnalysisOps partition from the Detox SitesInfo.txt. The file is kept in a local cache and only
+    # downloaded again when it is older than ttl seconds.
+
+    url = 'http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox/SitesInfo.txt'
+    cacheFile = os.getenv('TMPDIR','/tmp') + '/IntelROCCS-SitesInfo-%d.txt'%(os.getuid())
+
+    text = ''
+    if os.path.exists(cacheFile) and time.time() - os.path.getmtime(cacheFile) < ttl:
+        if debug>0:
+            print ' Using cached site snapshot: ' + cacheFile
+        text = open(cacheFile,'r').read()
+    else:
+        try:
+            text = urllib2.urlopen(url,timeout=300).read()
+            tmpFile = cacheFile + '.%d'%(os.getpid())
+            output = open(tmpFile,'w')
+            output.write(text)
+            output.close()
+            os.rename(tmpFile,cacheFile)
+        except (urllib2.URLError,httplib.HTTPException,IOError,OSError), e:
+            print ' WARNING - could not download site snapshot: ' + str(e)
+            if os.path.exists(cacheFile):
+                print ' WARNING - using stale site snapshot: ' + cacheFile
+                text = open(cacheFile,'r').read()
+
+    # the file has one section per DDM partition, only AnalysisOps is relevant
+    snapshot = {}
+    partition = ''
+    for line in text.split('\n'):
+        if line.startswith('#- DDM Partition:'):
+            partition = line.split(':')[1].replace('-','').strip()
+            continue
+        f = line.split()
+        if line.startswith('#') or len(f) != 5:
+            continue
+        if partition != 'AnalysisOps' and (partition != '' or f[4] in snapshot):
+            continue
+        try:
+            snapshot[f[4]] = { 'valid': int(f[0]),
+                               'quota': float(f[1]) * 1000.,     # make sure it is GB
+                               'taken': float(f[2]) * 1000.,
+                               'lastCp': float(f[3]) * 1000.,
+                               'assigned': 0. }
+        except ValueError:
+            continue
+
+    if debug>1:
+        for site in sorted(snapshot):
+            print ' Snapshot %-20s valid: %d quota: %.1f GB lastCp: %.1f GB'\
+                %(site,snapshot[site]['valid'],snapshot[site]['quota'],snapshot[site]['lastCp'])
+
+    return snapshot
+
+# one snapshot per run, so copies assigned to a site are seen by all later placements
+siteSnapshot = None
+
+def getSiteSnapshot(debug=0):
+    # return the site capacity snapshot of this run, load it on first use
+
+    global siteSnapshot
+    if siteSnapshot is None:
+        siteSnapshot = loadSiteSnapshot(debug=debug)
+    return siteSnapshot
+
+def addSiteSummary(snapshot,site,debug=0):
+    # Add quota and last copy space (in GB) of the site from its Detox Summary.txt to the snapshot,
+    # the site is left out if the summary cannot be read
+
+    url = 'http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox/result/' + site + '/Summary.txt'
+    try:
+        text = urllib2.urlopen(url,timeout=300).read()
+    except (urllib2.URLError,httplib.HTTPException,IOError), e:
+        print ' WARNING - could not download site summary of %s: %s'%(site,str(e))
+        return
+
+    quota = 0
+    lastCp = 0
+    for line in text.split('\n'):
+        f = line.split(' ')
+        try:
+            if line.startswith('Total') and quota == 0:
+                quota = float(f[-1]) * 1000.   # make sure it is GB
+            elif line.startswith('Space last CP') and lastCp == 0:
+                lastCp = float(f[-1]) * 1000.  # make sure it is GB
+        except ValueError:
+            continue
+
+    if debug>0:
+        print ' Summary %-20s quota: %.1f GB lastCp: %.1f GB'%(site,quota,lastCp)
+    snapshot[site] = { 'valid': 1, 'quota': quota, 'taken': 0., 'lastCp': lastCp, 'assigned': 0. }
+
 def getActiveSites(debug=0):
     # find the list of sites to consider for subscription
 
@@ -380,27 +467,14 @@ def getActiveSites(debug=0):
                   'T2_US_Wisconsin'
                   ]
 
-    # download list of active sites
+    # active sites from the snapshot
     sites = []
-
-    # get the active site list
-    cmd  = 'wget http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox/SitesInfo.txt'
-    cmd += ' -O - 2> /dev/null | grep -v "#" | grep T2_ | tr -s " "'
-    for line in subprocess.Popen(cmd,shell=True,stdout=subprocess.PIPE).stdout.readlines():
-        site = line[:-1]
-        f = site.split(' ')
-        if debug>2:
-            print " Length: %d"%(len(f))
-        if len(f) != 7:
+    snapshot = getSiteSnapshot(debug)
+    for site in sorted(snapshot):
+        if not site.startswith('T2_'):
             continue
-
-        # decode
-        if debug>2:
-            print f
-        site = f[-2]
-        lastCopy = int(f[-3])
-        quota = int(f[-5])
-        valid = int(f[-6])
+        lastCopy = snapshot[site]['lastCp']
+        quota = snapshot[site]['quota']
 
         # sanity check
         if quota == 0:
@@ -412,7 +486,7 @@ def getActiveSites(debug=0):
                 %(lastCopy,quota,float(lastCopy)/quota)
 
         # check whether site is appropriate
-        if valid != 1:
+        if snapshot[site]['valid'] != 1:
             continue
 
         # is the site large enough
@@ -421,7 +495,6 @@ def getActiveSites(debug=0):
                 print '  -> skip %s as Last Copy too large or not valid.\n'%(site)
             continue
 
-
         if debug > 0:
             print '  -> adding %s\n'%(site)
                 
@@ -432,59 +505,82 @@ def getActiveSites(debug=0):
     if len(sites) < 10:
         print ' WARNINIG - too few sites found, reverting to hardcoded list'
         sites = tier2Base
+        # sites missing from the snapshot get their capacity from the per site Detox summary
+        for site in sites:
+            if site not in snapshot:
+                addSiteSummary(snapshot,site,debug)
 
-    # return the size in GB as a float
+    # return the list of site names
     return sites
 
-def chooseMatchingSite(tier2Sites,nSites,sizeGb,debug):
-    # Given a list of Tier-2 centers, a requested number of copies and the size of the sample to
-    # assign we choose a list of sites
+def chooseSitesFromSnapshot(snapshot,candidates,nSites,sizeGb,debug=0):
+    # Choose up to nSites sites from the candidates that can take the dataset. The choice is random,
+    # weighted by the space left at the site, and every site is tried at most once. The snapshot is
+    # updated with the new copies.
 
-    iRan = -1
-    quotas = []
-    lastCps = []
-    sites = []
+    # sites that can take the dataset and their room after the copy
+    rooms = {}
+    for site in candidates:
+        if site not in snapshot:
+            continue
+        quota = snapshot[site]['quota']
+        used = snapshot[site]['lastCp'] + snapshot[site]['assigned']
+        room = 0.7*quota - used - sizeGb
+        # small compared to the site (use 0.1 max) and last copies stay below 70%
+        if sizeGb >= 0.1*quota or room <= 0:
+            if debug > 0:
+                print ' Cannot fit %.1f GB into %s (quota: %.1f GB, used: %.1f GB)'%\
+                      (sizeGb,site,quota,used)
+            continue
+        rooms[site] = room
 
-    nTrials = 0
-
-    while len(sites) < nSites:
-        # we should put into the random choice the size of the site to ensure larger sites to
-        # be hit more often (NEXT PROJECT)
-        iRan = random.randint(0,len(tier2Sites)-1)
-        site = tier2Sites[iRan]
-        # not elegant or reliable (should use database directly)
-        cmd  = 'wget http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox/result/'+site+'/Summary.txt'
-        cmd += ' -O - 2> /dev/null | grep ^Total | head -1'
-        quota = 0
-        for line in subprocess.Popen(cmd,shell=True,stdout=subprocess.PIPE).stdout.readlines():
-            line = line[:-1]
-            f = line.split(' ')
-            quota = float(f[-1]) * 1000.   # make sure it is GB
+    sites = []
+    while len(sites) < nSites and len(rooms) > 0:
+        pick = random.uniform(0,sum(rooms.values()))
+        for site in sorted(rooms):
+            pick -= rooms[site]
+            if pick <= 0:
+                break
+        del rooms[site]
+        snapshot[site]['assigned'] += sizeGb
+        sites.append(site)
+        if debug > 0:
+            print ' Fit %.1f GB into Tier-2: %s with quota of %.1f GB'%\
+                  (sizeGb,site,snapshot[site]['quota'])
 
-        cmd  = 'wget http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox/result/'+site+'/Summary.txt'
-        cmd += ' -O - 2> /dev/null | grep ^\"Space last CP\"  | head -1'
+    return sites
 
-        lastCp = 0
-        for line in subprocess.Popen(cmd,shell=True,stdout=subprocess.PIPE).stdout.readlines():
-            line = line[:-1]
-            f = line.split(' ')
-            lastCp = float(f[-1]) * 1000.  # make sure it is GB
+def chooseMatchingSite(tier2Sites,nSites,sizeGb,debug):
+    # Given a list of Tier-2 centers, a requested number of copies and the size of the sample to
+    # assign we choose a list of sites
 
-        if sizeGb < 0.1*quota:
-            sites.append(site)
-            quotas.append(quota)
-            lastCps.append(lastCp)
-            tier2Sites.remove(site)
+    snapshot = getSiteSnapshot(debug)
+    sites = chooseSitesFromSnapshot(snapshot,tier2Sites,nSites,sizeGb,debug)
+    if len(sites) < nSites:
+        print ' ERROR - not enough matching sites could be found. Dataset too big? EXIT!'
+        sys.exit(1)
 
-        if debug > 0:
-            print ' Trying to fit %.1f GB into Tier-2 [%d]: %s with quota of %.1f GB (use 0.1 max)'%\
-                  (sizeGb,iRan,site,quota)
+    quotas = [ snapshot[site]['quota'] for site in sites ]
+    lastCps = [ snapshot[site]['lastCp'] for site in sites ]
+    return sites,quotas,lastCps
 
-        if nTrials > 20:
-            print ' ERROR - not enough matching sites could be found. Dataset too big? EXIT!'
-            sys.exit(1)
+def chargeDestinationSites(sites,sizeGb,debug):
+    # Given the Tier-2 centers requested by the user and the size of the sample to assign we add the
+    # sample to those sites in the snapshot, sites not in the snapshot have no quota and last copy
 
-        nTrials += 1
+    snapshot = getSiteSnapshot(debug)
+    quotas = []
+    lastCps = []
+    for site in sites:
+        if site not in snapshot:
+            if debug > 0:
+                print ' Destination %s is not in the site snapshot'%(site)
+            quotas.append(0)
+            lastCps.append(0)
+            continue
+        snapshot[site]['assigned'] += sizeGb
+        quotas.append(snapshot[site]['quota'])
+        lastCps.append(snapshot[site]['lastCp'])
     return sites,quotas,lastCps
 
 def submitSubscriptionRequests(sites,datasets=[],debug=0):
@@ -701,13 +797,13 @@ def assignOneDataset(dataset,nCopies,expectedSizeGb,destination,exe=0,debug=0):
             if debug>0:
                 print ' Site is not in list: ' + siteName
     
-    # choose a site randomly and exclude sites that are too small
-    
-    sites,quotas,lastCps = chooseMatchingSite(tier2Sites,nAdditionalCopies,sizeGb,debug)
+    # choose a site randomly and exclude sites that are too small, unless the sites are given
     
     if destination:
         print " INFO - overriding destination with ",destination
-        sites = destination
+        sites,quotas,lastCps = chargeDestinationSites(destination,sizeGb,debug)
+    else:
+        sites,quotas,lastCps = chooseMatchingSite(tier2Sites,nAdditionalCopies,sizeGb,debug)
     
     if not exe:
         print ''
@@ -742,6 +838,176 @@ def assignOneDataset(dataset,nCopies,expectedSizeGb,destination,exe=0,debug=0):
     
     return status
 
+#===================================================================================================
+#  B A T C H   H E L P E R S
+#===================================================================================================
+def findDatasetSizes(datasets,nThreads=8,debug=0):
+    # Look up validity and size (in GB) of all datasets, invalid or unknown datasets are not in the
+    # returned dictionary
+
+    dbsUrl = 'https://cmsweb.cern.ch/dbs/prod/global/DBSReader'
+    dbsapi = DbsApi(url=dbsUrl)
+
+    # validity in chunks, one call per chunk instead of one per dataset
+    validSets = []
+    chunkSize = 100
+    for i in range(0,len(datasets),chunkSize):
+        chunk = datasets[i:i+chunkSize]
+        for entry in dbsapi.listDatasetArray(dataset=chunk,dataset_access_type='VALID'):
+            validSets.append(entry['dataset'])
+    if debug>0:
+        print ' Valid datasets in DBS: %d of %d'%(len(validSets),len(datasets))
+
+    # block summaries are per dataset, spread them over a few threads (one api per thread)
+    queue = Queue.Queue()
+    for dataset in validSets:
+        queue.put(dataset)
+    sizes = {}
+    errors = []
+
+    def worker():
+        api = DbsApi(url=dbsUrl)
+        while True:
+            try:
+                dataset = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                size = str(sum([block['file_size'] for block in \
+                                    api.listBlockSummaries(dataset = dataset)]))+'UB'
+                sizes[dataset] = convertSizeToGb(size)
+            except Exception, e:
+                errors.append((dataset,str(e)))
+
+    threads = []
+    for i in range(min(nThreads,queue.qsize())):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    for dataset,error in errors:
+        print ' ERROR - Size lookup failed for %s: %s'%(dataset,error)
+
+    return sizes
+
+def findAllSubscriptions(group='AnalysisOps',sitePattern='T2*',debug=0):
+    # Find all existing full dataset subscriptions of the group at sites matching the pattern, in
+    # one query; returns a dictionary of dataset -> list of sites
+
+    subsc = '/phedex/datasvc/json/prod/subscriptions'
+    result = json.loads(phedexGet(subsc + '?group=%s&node=%s&collapse=y' \
+                                      %(group,sitePattern)))['phedex']
+
+    datasetSites = {}
+    for dataset in result['dataset']:
+        if not 'subscription' in dataset:
+            continue
+        for sub in dataset['subscription']:
+            if sub['level'] != "DATASET":
+                continue
+            siteNames = datasetSites.setdefault(dataset['name'],[])
+            if sub['node'] not in siteNames:
+                siteNames.append(sub['node'])
+
+    if debug>0:
+        print ' Found %d datasets subscribed by %s at %s'%(len(datasetSites),group,sitePattern)
+
+    return datasetSites
+
+def assignDatasets(datasets,nCopies,expectedSizeGb,destination,exe=0,debug=0):
+    # make assignments of all given datasets in one go, the status returned is 0 if all worked, 1 if
+    # anything did not work (there will be a printout)
+
+    status = 0
+
+    # sizes of all valid datasets
+    #----------------------------
+
+    sizes = findDatasetSizes(datasets,debug=debug)
+    for dataset in datasets:
+        if dataset not in sizes:
+            print ' ERROR - Dataset does not exist or is invalid: ' + dataset
+            status = 1
+        elif expectedSizeGb > 0:
+            sizes[dataset] = expectedSizeGb
+    datasets = [ dataset for dataset in datasets if dataset in sizes ]
+    print '\n Datasets to assign: %d (%.1f GB)'%(len(datasets),sum(sizes.values()))
+
+    # existing subscriptions, one query per group and site pattern
+    #-------------------------------------------------------------
+
+    tier1DataOps = findAllSubscriptions('DataOps','T1_*_Disk',debug)
+    tier2DataOps = findAllSubscriptions('DataOps','T2_*',debug)
+    tier2Analysis = findAllSubscriptions('AnalysisOps','T2_*',debug)
+
+    # re-assign DataOps copies to AnalysisOps (update is one call per dataset and site)
+    #----------------------------------------------------------------------------------
+
+    for dataset in datasets:
+        ownedSites = tier1DataOps.get(dataset,[]) + tier2DataOps.get(dataset,[])
+        if len(ownedSites) == 0:
+            continue
+        print ' DataOps copies of %s: %s'%(dataset,' '.join(ownedSites))
+        if exe:
+            rc = submitUpdateSubscriptionRequest(ownedSites,[dataset],debug)
+            if rc != 0:
+                print ' ERROR - Could not update subscription (DataOps->AnalysisOps): ' + dataset
+                status = 1
+
+    # placement against the shared capacity model
+    #--------------------------------------------
+
+    tier2Sites = getActiveSites(debug)
+    snapshot = getSiteSnapshot(debug)
+
+    siteDatasets = {}
+    for dataset in datasets:
+        siteNames = tier2Analysis.get(dataset,[])
+        isMiniAod = len(dataset.split("/")) > 3 and 'MINIAOD' in dataset.split("/")[3]
+
+        if destination:
+            sites = [ site for site in destination if site not in siteNames ]
+        else:
+            nAdditionalCopies = nCopies - len(siteNames)
+            sites = []
+            if nAdditionalCopies > 0:
+                candidates = [ site for site in tier2Sites if site not in siteNames ]
+                sites = chooseSitesFromSnapshot(snapshot,candidates,nAdditionalCopies,
+                                                sizes[dataset],debug)
+                if len(sites) < nAdditionalCopies:
+                    print ' ERROR - not enough matching sites for %s (%.1f GB)'%\
+                          (dataset,sizes[dataset])
+                    status = 1
+        if isMiniAod and 'T2_CH_CERN' not in siteNames and 'T2_CH_CERN' not in sites:
+            sites.append('T2_CH_CERN')
+
+        for site in sites:
+            siteDatasets.setdefault(site,[]).append(dataset)
+
+    # one subscription request per destination site
+    #-----------------------------------------------
+
+    print ''
+    for site in sorted(siteDatasets):
+        sizeGb = sum([ sizes[dataset] for dataset in siteDatasets[site] ])
+        print ' %-20s %5d datasets  %10.1f GB'%(site,len(siteDatasets[site]),sizeGb)
+        if debug>0:
+            for dataset in siteDatasets[site]:
+                print '   --> ' + dataset
+        if exe:
+            rc = submitSubscriptionRequests([site],siteDatasets[site],debug)
+            if rc != 0:
+                print ' ERROR - Could not make subscription at ' + site
+                status = 1
+
+    if not exe:
+        print '\n -> WARNING: not doing anything .... please use  --exec  option.\n'
+
+    return status
+
 #===================================================================================================
 #  M A I N
 #===================================================================================================
@@ -750,12 +1016,15 @@ usage =  " Usage: assignDatasetToSite.py   --dataset=<name of a CMS dataset>\n"
 usage += "                 [ --nCopies=1 ]           <-- number of desired copies \n"
 usage += "                 [ --expectedSizeGb=-1 ]   <-- open subscription to avoid small sites \n"
 usage += "                 [ --destination=... ]     <-- coma separated list of destination sites \n"
+usage += "                 [ --datasetList=... ]     <-- file with one dataset per line (batch mode)\n"
+usage += "                 [ --batch ]               <-- assign all given datasets in one go\n"
 usage += "                 [ --debug=0 ]             <-- see various levels of debug output\n"
 usage += "                 [ --exec ]                <-- add this to execute all actions\n"
 usage += "                 [ --help ]\n\n"
 
 # Define the valid options which can be specified and check out the command line
-valid = ['dataset=','debug=','nCopies=','expectedSizeGb=','destination=', 'exec','help']
+valid = ['dataset=','debug=','nCopies=','expectedSizeGb=','destination=','datasetList=','batch',
+         'exec','help']
 try:
     opts, args = getopt.getopt(sys.argv[1:], "", valid)
 except getopt.GetoptError, ex:
@@ -773,6 +1042,8 @@ nCopies = 1
 destination = []
 exe = False
 expectedSizeGb = -1
+datasetList = ''
+batch = False
 
 # Read new values from the command line
 for opt, arg in opts:
@@ -789,14 +1060,43 @@ for opt, arg in opts:
         destination = arg.split(",")
     if opt == "--debug":
         debug = int(arg)
+    if opt == "--datasetList":
+        datasetList = arg
+        batch = True
+    if opt == "--batch":
+        batch = True
     if opt == "--exec":
         exe = True
 
+# read the dataset list file (comments and empty lines are ignored)
+if datasetList != '':
+    names = []
+    if dataset != '':
+        names = dataset.split(",")
+    for line in open(datasetList,'r').readlines():
+        line = line.split('#')[0].strip()
+        if line != '':
+            names.append(line)
+    dataset = ",".join(names)
+
 # inspecting the local setup
 #---------------------------
 
 testLocalSetup(dataset,debug)
 
+# adjust for compact dataset format
+dsets = []
+for dset in dataset.split(","):
+    if dset[0] != '/':
+        dset = '/' + dset.replace('+','/')
+    dsets.append(dset)
+
+# batch mode: all datasets in one go
+if batch:
+    status = assignDatasets(dsets,nCopies,expectedSizeGb,destination,exe,debug)
+    print '\n Status of batch assignment: %d (%d datasets)\n'%(status,len(dsets))
+    sys.exit(status)
+
 # loop through the list of given datasets (all parameters are carried through)
 status = 0 
 for dset in dataset.split(","):
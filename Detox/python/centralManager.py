@@ -2,12 +2,13 @@
 #  C L A S S
 #===================================================================================================
 import sys, os, subprocess, re, time, datetime, smtplib, MySQLdb, shutil, string, glob 
-import math,statistics
+import statistics
 import phedexDataHandler, popularityDataHandler, phedexApi, deprecateDataHandler
 import siteProperties, datasetProperties
 import siteStatus, deletionRequest
 import dbInfoHandler
 import spreadLowRankSets 
+import siteHealth
 
 class CentralManager:
     def __init__(self):
@@ -28,6 +29,7 @@ class CentralManager:
         self.sitePropers = {}
         self.dataPropers = {}
         self.dataAccCorr = {}
+        self.siteHealth = None
 
         self.delRequests = {}
         self.siteRequests = {}
@@ -307,6 +309,9 @@ class CentralManager:
                self.sitePropers[site].addDataset(datasetName,rank,size,vali,part,
                                                  cust,isDeprecated,reqtime,updtime,wasUsed,isdone)
 
+       # transfer health of all sites in one pass over the replicas
+       self.siteHealth = siteHealth.SiteHealth(self.sitePropers,self.epochTime)
+
        for site in sorted(self.allSites.keys()):
            if self.allSites[site].getStatus() == 0:
                continue
@@ -748,8 +753,7 @@ class CentralManager:
         outputFile.write("#         [GB/Day]   [TB]    \n")
         outputFile.write("#--------------------------------------------\n")
         for site in sorted(self.sitePropers.keys(), key=str.lower, reverse=False):
-            sitePr = self.sitePropers[site]
-            (speed,volume,stuck) = sitePr.getDownloadStats()
+            (speed,volume,stuck) = self.siteHealth.getDownloadStats(site)
             outputFile.write("   %-6d %-10.1f %-7.1f %-20s \n"\
                                  %(stuck,speed,volume/1000,site))
         outputFile.write("#--------------------------------------------\n")
@@ -902,17 +906,20 @@ class CentralManager:
 
     def updateSiteStatus(self):
         # find all sites with stuck datasets, calculate mean and rms
-        nstuckAtSite = {}
+        activeSites = []
         for site in sorted(self.sitePropers.keys(), key=str.lower, reverse=False):
             theSite = self.allSites[site]
             active = theSite.getStatus()
             if active == 0 or active ==2 : 
                 continue
-
-            sitePr = self.sitePropers[site]
-            (speed,volume,stuck) = sitePr.getDownloadStats()
-            nstuckAtSite[site] = int(stuck)
-        stmean,strms = self.getMeanValue(nstuckAtSite,3,0.5)
+            activeSites.append(site)
+        nstuckAtSite = self.siteHealth.getStuckCounts(activeSites)
+        stmean,strms = siteHealth.trimmedMean(nstuckAtSite.values(),3,0.5)
+
+        # keep the history so trends can be looked at without recomputing
+        statusDir = os.environ['DETOX_DB'] + '/' + os.environ['DETOX_STATUS']
+        self.siteHealth.persist(statusDir + '/' + \
+                                    os.environ.get('DETOX_SITE_HEALTH','SiteHealthHistory.txt'))
         # set status=2 to all sites that are above 4xrms threshold
         changingStatus = {}
         for site in sorted(self.allSites):
@@ -1293,30 +1300,3 @@ class CentralManager:
             return -1
         else:
             return 0
-
-    def getMeanValue(self,aa,rmsW,frac):
-        meanPr = 999.0
-        mean = 0.0
-        rms = 999.9
-        loops = 0
-        while True:
-            mean = 0.0
-            meansq = 0.0
-            items = 0.0
-            for vkey in aa:
-                value = aa[vkey]
-                if abs(value - meanPr) > rmsW*rms:
-                    continue
-                mean = mean + value
-                meansq = meansq + value*value
-                items = items + 1
-            mean = mean/items
-            rms = math.sqrt(meansq/items - mean*mean)
-            if abs(mean - meanPr) < frac*rms:
-                break
-            else:
-                meanPr = mean
-            loops = loops + 1
-            if loops > 10:
-                break
-        return (mean, rms)
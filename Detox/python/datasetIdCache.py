@@ -0,0 +1,256 @@
+#===================================================================================================
+#  C L A S S
+#===================================================================================================
+import os, struct, mmap, array, shutil, tempfile
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  DatasetIdCache(fileName)
+On-disk, memory-mapped dictionary of dataset name -> (id, nFiles, size) built from the Datasets and
+DatasetProperties tables. The file is a sorted string table:
+
+  header    : magic, version, nRecords, maxDatasetId, maxPropertiesId, idTableSize, nProperties
+  records   : nRecords x (nameOffset, nameLength, datasetId, nFiles, sizeGb) sorted by name
+  id table  : idTableSize x record index (-1 if unknown), addressed directly by DatasetId
+  strings   : all dataset names, concatenated
+
+Names are found with a binary search over the records and ids with a direct lookup, so no lookup
+ever turns the table into python objects. The cache is refreshed incrementally: only Datasets rows
+beyond the largest DatasetId already seen are read from the database and merged in. NFiles and Size
+of a dataset can change at any time, so DatasetProperties is read completely at every refresh, row
+by row from the cursor into arrays indexed by DatasetId, and compared with the cached records on the
+way. The file is only rewritten if there are new datasets or changed properties.
+"""
+#---------------------------------------------------------------------------------------------------
+class DatasetIdCache:
+    "A DatasetIdCache maps dataset names to ids and sizes from a memory mapped file."
+
+    MAGIC = 'DSIC'
+    VERSION = 2
+    HEADER = struct.Struct('<4sIIiiII')
+    RECORD = struct.Struct('<QIiid')
+    INDEX = struct.Struct('<i')
+
+    def __init__(self,fileName):
+        self.fileName = fileName
+        self.fileHandle = None
+        self.map = None
+        self.nRecords = 0
+        self.maxDsetId = 0
+        self.maxPropId = 0
+        self.idTableSize = 0
+        self.nProperties = 0
+        self.recordsStart = self.HEADER.size
+        self.idTableStart = self.HEADER.size
+        self.open()
+
+    def open(self):
+        self.close()
+        if not os.path.exists(self.fileName) or os.path.getsize(self.fileName) < self.HEADER.size:
+            return
+        self.fileHandle = open(self.fileName,'rb')
+        self.map = mmap.mmap(self.fileHandle.fileno(),0,access=mmap.ACCESS_READ)
+        (magic,version,nRecords,maxDsetId,maxPropId,idTableSize,nProperties) = \
+            self.HEADER.unpack_from(self.map,0)
+        if magic != self.MAGIC or version != self.VERSION:
+            print ' WARNING - dataset id cache %s has wrong format, rebuilding.'%(self.fileName)
+            self.close()
+            return
+        self.nRecords = nRecords
+        self.maxDsetId = maxDsetId
+        self.maxPropId = maxPropId
+        self.idTableSize = idTableSize
+        self.nProperties = nProperties
+        self.recordsStart = self.HEADER.size
+        self.idTableStart = self.recordsStart + nRecords*self.RECORD.size
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        if self.fileHandle is not None:
+            self.fileHandle.close()
+        self.map = None
+        self.fileHandle = None
+        self.nRecords = 0
+        self.maxDsetId = 0
+        self.maxPropId = 0
+        self.idTableSize = 0
+        self.nProperties = 0
+
+    def getMaxDatasetId(self):
+        return self.maxDsetId
+    def getMaxPropertiesId(self):
+        return self.maxPropId
+    def size(self):
+        return self.nRecords
+
+    #-----------------------------------------------------------------------------------------------
+    # lookups
+    #-----------------------------------------------------------------------------------------------
+    def record(self,index):
+        return self.RECORD.unpack_from(self.map,self.recordsStart + index*self.RECORD.size)
+
+    def recordName(self,index):
+        (offset,length,dsetId,nFiles,size) = self.record(index)
+        return self.map[offset:offset+length]
+
+    def findName(self,dsetName):
+        # returns the index of the record with this name (last one if the name is duplicated)
+        low = 0
+        high = self.nRecords
+        while low < high:
+            middle = (low+high)//2
+            if self.recordName(middle) < dsetName:
+                low = middle + 1
+            else:
+                high = middle
+        if low >= self.nRecords or self.recordName(low) != dsetName:
+            return -1
+        while low+1 < self.nRecords and self.recordName(low+1) == dsetName:
+            low = low + 1
+        return low
+
+    def findId(self,dsetId):
+        if dsetId < 0 or dsetId >= self.idTableSize:
+            return -1
+        return self.INDEX.unpack_from(self.map,self.idTableStart + dsetId*self.INDEX.size)[0]
+
+    def getDatasetId(self,dsetName):
+        if self.map is None:
+            return -1
+        index = self.findName(dsetName)
+        if index < 0:
+            return -1
+        return self.record(index)[2]
+
+    def hasProperties(self,dsetId):
+        if self.map is None:
+            return False
+        index = self.findId(dsetId)
+        if index < 0:
+            return False
+        return self.record(index)[3] >= 0
+
+    def getDatasetName(self,dsetId):
+        index = self.findId(dsetId)
+        if self.map is None or index < 0:
+            raise KeyError(dsetId)
+        return self.recordName(index)
+
+    def getDatasetFiles(self,dsetId):
+        if not self.hasProperties(dsetId):
+            raise KeyError(dsetId)
+        return self.record(self.findId(dsetId))[3]
+
+    def getDatasetSize(self,dsetId):
+        if not self.hasProperties(dsetId):
+            raise KeyError(dsetId)
+        return self.record(self.findId(dsetId))[4]
+
+    #-----------------------------------------------------------------------------------------------
+    # incremental refresh
+    #-----------------------------------------------------------------------------------------------
+    def update(self,newDatasets,propFiles,propSizes,maxDsetId,maxPropId):
+        # newDatasets: list of (DatasetId, DatasetName) with DatasetId > current maximum
+        # propFiles  : NFiles indexed by DatasetId (up to maxDsetId), -1 for no properties
+        # propSizes  : Size indexed by DatasetId (up to maxDsetId), -1 for no properties
+        newDatasets = sorted(newDatasets,key=lambda x: (x[1],x[0]))
+        maxDsetId = max(maxDsetId,self.maxDsetId)
+        nRecords = self.nRecords + len(newDatasets)
+        idTable = array.array('i',[-1])*(maxDsetId+1)
+        nProperties = 0
+
+        directory = os.path.dirname(os.path.abspath(self.fileName))
+        (fd,tmpName) = tempfile.mkstemp(prefix='.DatasetIdCache',dir=directory)
+        outputFile = os.fdopen(fd,'wb')
+        strings = tempfile.TemporaryFile(dir=directory)
+        stringsStart = self.HEADER.size + nRecords*self.RECORD.size + len(idTable)*self.INDEX.size
+        offset = stringsStart
+
+        # the header is written again at the end, when the number of properties is known
+        outputFile.write(self.HEADER.pack(self.MAGIC,self.VERSION,nRecords,
+                                          maxDsetId,maxPropId,len(idTable),0))
+        # streaming merge of the existing (sorted) records with the new (sorted) datasets
+        old = 0
+        new = 0
+        index = 0
+        while old < self.nRecords or new < len(newDatasets):
+            if old < self.nRecords:
+                (oldOffset,length,dsetId,nFiles,size) = self.record(old)
+                name = self.map[oldOffset:oldOffset+length]
+            if new < len(newDatasets) and \
+                    (old >= self.nRecords or (newDatasets[new][1],newDatasets[new][0]) < (name,dsetId)):
+                (dsetId,name) = newDatasets[new]
+                new = new + 1
+            else:
+                old = old + 1
+            if propFiles[dsetId] >= 0:
+                nProperties = nProperties + 1
+
+            outputFile.write(self.RECORD.pack(offset,len(name),dsetId,propFiles[dsetId],
+                                              propSizes[dsetId]))
+            strings.write(name)
+            offset = offset + len(name)
+            idTable[dsetId] = index
+            index = index + 1
+
+        outputFile.write(idTable.tostring())
+        strings.seek(0)
+        shutil.copyfileobj(strings,outputFile)
+        strings.close()
+        outputFile.seek(0)
+        outputFile.write(self.HEADER.pack(self.MAGIC,self.VERSION,nRecords,
+                                          maxDsetId,maxPropId,len(idTable),nProperties))
+        outputFile.close()
+
+        self.close()
+        os.rename(tmpName,self.fileName)
+        self.open()
+        return True
+
+    def refresh(self,dbExecSql,dbIterSql=None):
+        # dbExecSql is a function taking a sql string and returning all rows, dbIterSql (default
+        # dbExecSql) returns the rows one by one and is used for the large properties table
+        if dbIterSql is None:
+            dbIterSql = dbExecSql
+
+        sql = "select DatasetId,DatasetName from Datasets where DatasetId>%d"%(self.maxDsetId)
+        newDatasets = []
+        maxDsetId = self.maxDsetId
+        for row in dbExecSql(sql):
+            dsetId = int(row[0])
+            newDatasets.append((dsetId,str(row[1])))
+            maxDsetId = max(maxDsetId,dsetId)
+
+        # properties are updated in place, so they are always read completely
+        propFiles = array.array('i',[-1])*(maxDsetId+1)
+        propSizes = array.array('d',[-1.0])*(maxDsetId+1)
+        maxPropId = 0
+        changed = 0
+        matched = 0
+        sql = "select DatasetId,NFiles,Size from DatasetProperties"
+        for row in dbIterSql(sql):
+            dsetId = int(row[0])
+            maxPropId = max(maxPropId,dsetId)
+            if dsetId > maxDsetId:
+                continue
+            propFiles[dsetId] = int(row[1])
+            propSizes[dsetId] = float(row[2])
+            index = -1
+            if self.map is not None:
+                index = self.findId(dsetId)
+            if index < 0:
+                continue
+            (offset,length,cachedId,cachedFiles,cachedSize) = self.record(index)
+            if cachedFiles >= 0:
+                matched = matched + 1
+            if (cachedFiles,cachedSize) != (propFiles[dsetId],propSizes[dsetId]):
+                changed = changed + 1
+        # cached properties without a row anymore
+        changed = changed + self.nProperties - matched
+
+        print ' Dataset id cache: %d new datasets, %d changed properties'\
+            %(len(newDatasets),changed)
+        if len(newDatasets) == 0 and changed == 0:
+            return False
+        return self.update(newDatasets,propFiles,propSizes,maxDsetId,maxPropId)
@@ -1,24 +1,22 @@
 #===================================================================================================
 #  C L A S S
 #===================================================================================================
-import os, re, sys, MySQLdb
+import os, re, sys, MySQLdb, MySQLdb.cursors
 import datetime
 import siteStatus
+import datasetIdCache
 
 class DbInfoHandler:
     def __init__(self):
         self.allSites = {}
         self.idToSite = {}
-        self.datasetNames = {}
-        self.datasetIds = {}
-        self.datasetSizes = {}
-        self.datasetFiles = {}
+        self.datasetRanks = {}
+        self.datasetCache = None
         self.phedexGroups = (os.environ['DETOX_GROUP']).split(',')
         self.phgroupIds = {}
         self.extractGroupIds()
         self.extractAllSites()
         self.extractDatasetIds()
-        self.extractDatasetSizes()
 
     def setDatasetRanks(self,dsetRanks):
         for dset in dsetRanks:
@@ -100,16 +98,14 @@ class DbInfoHandler:
         return siteSizeGb 
 
     def logRequest(self,site,datasets,reqid,rdate,reqtype):
-        self.extractDatasetIds(datasets)
-
         connection = self.getDbConnection()
         for dataset in datasets:
             siteId = self.allSites[site].getId()
-            if dataset not in self.datasetIds:
+            dsetId = self.getDatasetId(dataset)
+            if dsetId < 0:
                 continue
             if dataset not in self.datasetRanks:
                 continue
-            dsetId = self.datasetIds[dataset]
             groupId = 1
             rank = self.datasetRanks[dataset]
             
@@ -127,42 +123,14 @@ class DbInfoHandler:
         connection.close()
    
     def extractDatasetIds(self):
-        connection = self.getDbConnection()
-        cursor = connection.cursor()
-        sql = "select * from Datasets"
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-        except:
-            print " -- FAILED extract mysql info: %s"%(sql)
-            connection.close()
-            sys.exit(1)
-        connection.close()
-
-        for row in results:
-            dsetId = int(row[0])
-            dsetName = row[1]
-            self.datasetNames[dsetId] = dsetName
-            self.datasetIds[dsetName] = dsetId
+        # dataset names, ids and sizes live in a memory mapped file which only gets the rows added
+        # since the last cycle, instead of reading the full Datasets/DatasetProperties tables
+        statusDir = os.environ['DETOX_DB'] + '/' + os.environ['DETOX_STATUS']
+        fileName = statusDir + '/' + os.environ.get('DETOX_DATASET_CACHE','DatasetIdCache.bin')
+        if self.datasetCache is None:
+            self.datasetCache = datasetIdCache.DatasetIdCache(fileName)
+        self.datasetCache.refresh(self.dbExecSql,self.dbIterSql)
 
-    def extractDatasetSizes(self):
-        connection = self.getDbConnection()
-        cursor = connection.cursor()
-        sql = "select * from DatasetProperties"
-        try:
-            cursor.execute(sql)
-            results = cursor.fetchall()
-        except:
-            print " -- FAILED insert mysql info: %s"%(sql)
-            connection.close()
-            sys.exit(1)
-        connection.close()
-
-        for row in results:
-            dsetId = int(row[0])
-            self.datasetFiles[dsetId] = int(row[1])
-            self.datasetSizes[dsetId] = float(row[2])
-     
     def getAllSites(self):
         return self.allSites
 
@@ -177,23 +145,17 @@ class DbInfoHandler:
             return self.idToSite[siteId]
         
     def datasetExists(self,dsetId):
-        if dsetId in self.datasetSizes:
-            return True
-        else:
-            return False
+        return self.datasetCache.hasProperties(dsetId)
 
     def getDatasetName(self,dsetId):
-        return self.datasetNames[dsetId]
+        return self.datasetCache.getDatasetName(dsetId)
     def getDatasetSize(self,dsetId):
-        return self.datasetSizes[dsetId]
+        return self.datasetCache.getDatasetSize(dsetId)
     def getDatasetFiles(self,dsetId):
-        return self.datasetFiles[dsetId]
+        return self.datasetCache.getDatasetFiles(dsetId)
 
     def getDatasetId(self,dsetName):
-        if dsetName in self.datasetIds:
-            return self.datasetIds[dsetName]
-        else:
-            return -1
+        return self.datasetCache.getDatasetId(dsetName)
 
     def getGroupId(self,group):
         return self.phgroupIds[group]
@@ -212,6 +174,22 @@ class DbInfoHandler:
         connection.close()
         return results
 
+    def dbIterSql(self,sql):
+        # rows are fetched one by one from the server, for tables too large to hold in memory
+        connection = self.getDbConnection()
+        cursor = connection.cursor(MySQLdb.cursors.SSCursor)
+        try:
+            cursor.execute(sql)
+            for row in cursor:
+                yield row
+        except MySQLdb.Error:
+            print ' Error(%s) -- could not execute sql '%(sql)
+            print sys.exc_info()
+            connection.close()
+            sys.exit(1)
+        cursor.close()
+        connection.close()
+
     def updateSiteStatus(self, changingStatus):
         connection = self.getDbConnection()
         for site in changingStatus: 
@@ -19,11 +19,13 @@ import urllib2
 import httplib
 import time
 import datetime
+import StringIO
 try:
     import json
 except ImportError:
     import simplejson as json
 from cmsDataLogger import cmsDataLogger
+import phedexClient
 
 ####################################################################################################
 #
@@ -58,49 +60,47 @@ class phedexApi:
         statusDirectory = os.environ['DETOX_DB'] + '/' + os.environ['DETOX_STATUS']
         self.logger     = cmsDataLogger(statusDirectory+'/')
         self.phedexBase = "https://cmsweb.cern.ch/phedex/datasvc/"
+        self.client     = phedexClient.getClient(os.environ['DETOX_X509UP'])
 
     ############################################################################
     #                                                                          #
     #                           P h E D E x   C A L L                          #
     #                                                                          #
     ############################################################################
-    def phedexCall(self, url, values):
+    def phedexCall(self, url, values, readOnly=True):
         """
         _phedexCall_
 
-        Make http post call to PhEDEx API.
+        Make http post call to PhEDEx API, over the persistent connections of the shared
+        phedexClient. Only read-only calls are retried.
 
         Function only gaurantees that something is returned,
         the caller need to check the response for correctness.
 
         Keyword arguments:
-        url    -- URL to make API call
-        values -- Arguments to pass to the call
+        url      -- URL to make API call
+        values   -- Arguments to pass to the call
+        readOnly -- False for calls which change something (subscribe, delete, ...)
 
         Return values:
         1 -- Status, 0 = everything went well, 1 = something went wrong
         2 -- IF status == 0 : HTTP response ELSE : Error message
         """
         name = "phedexCall"
-        data = urllib.urlencode(values)
-        opener = urllib2.build_opener(HTTPSGridAuthHandler())
-        request = urllib2.Request(url, data)
-
         try:
-            response = opener.open(request)
-        except urllib2.HTTPError, e:
-            self.logger.error(name, e.read())
+            status, body = self.client.call(url, values, idempotent=readOnly)
+        except phedexClient.phedexClientError, e:
+            self.logger.error(name, str(e))
             self.logger.error(name, "URL: %s" % (str(url),))
             self.logger.error(name, "VALUES: %s" % (str(values),))
-            #print (name, "VALUES: %s" % (str(values),))
-            return 1, " ERROR - urllib2.HTTPError"
-        except urllib2.URLError, e:
-            self.logger.error(name, e.args)
+            return 1, " ERROR - connection failed"
+        if status != 200:
+            self.logger.error(name, body)
             self.logger.error(name, "URL: %s" % (str(url),))
             self.logger.error(name, "VALUES: %s" % (str(values),))
-            #print (name, "VALUES: %s" % (str(values)))
-            return 1, " ERROR - urllib2.URLError"
-        return 0, response
+            return 1, " ERROR - HTTP status %d" % (status)
+        # the body is read completely so the connection can be reused, callers get a file object
+        return 0, StringIO.StringIO(body)
     ############################################################################
     #                                                                          #
     #                                  D A T A                                 #
@@ -265,7 +265,7 @@ class phedexApi:
                    'time_start' : timeStart, 'request_only' : requestOnly, 'no_mail' : noMail,
                    'comments' : comments }
         subscriptionURL = urllib.basejoin(self.phedexBase, "%s/%s/subscribe" % (format, instance))
-        check, response = self.phedexCall(subscriptionURL, values)
+        check, response = self.phedexCall(subscriptionURL, values, readOnly=False)
         if check:
             # An error occurred
             self.logger.error(name, "Subscription call failed")
@@ -285,7 +285,7 @@ class phedexApi:
         values = { 'node' : node, 'data' : data, 'level' : level,
                    'rm_subscriptions' : rmSubscriptions, 'comments' : comments }
         deleteURL = urllib.basejoin(self.phedexBase, "%s/%s/delete" % (format, instance))
-        check, response = self.phedexCall(deleteURL, values)
+        check, response = self.phedexCall(deleteURL, values, readOnly=False)
         if check:
             self.logger.error(name, "Delete call failed")
             return 1, "ERROR - self.phedexCall with response: " + response
@@ -299,7 +299,7 @@ class phedexApi:
         name = "update"
         values = {'decision':decision, 'request':request, 'node':node, 'comments':comments}
         url = urllib.basejoin(self.phedexBase, "%s/%s/updaterequest" % (format, instance))
-        check, response = self.phedexCall(url, values)
+        check, response = self.phedexCall(url, values, readOnly=False)
         if check:
             self.logger.error(name, "Update call failed")
             return 1, "ERROR - self.phedexCall with response: " + response
@@ -311,7 +311,7 @@ class phedexApi:
         values = {'node':node, 'dataset':dataset, 'group':group}
         url = urllib.basejoin(self.phedexBase, "%s/%s/updatesubscription" % (format, instance))
 
-        check, response = self.phedexCall(url, values)
+        check, response = self.phedexCall(url, values, readOnly=False)
         if check:
             self.logger.error(name, "Change group call failed")
             print response
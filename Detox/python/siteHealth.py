@@ -0,0 +1,133 @@
+#====================================================================================================
+#  C L A S S E S  concerning the transfer health of all sites
+#====================================================================================================
+import os, time
+import numpy
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  SiteHealth(sitePropers,epochTime)
+Transfer health metrics (download speed, volume and number of stuck datasets) for all sites,
+computed in one vectorized pass over the replica table (site, request time, update time, done flag,
+size) instead of one python loop per site. The per cycle values can be appended to a history file
+so trends are available without recomputing them.
+"""
+#---------------------------------------------------------------------------------------------------
+class SiteHealth:
+    "A SiteHealth holds the download statistics of all sites."
+
+    STUCK_TIME = 60*60*24*14
+    MAX_LOAD_TIME = 60*60*24*14
+    MAX_AGE = 60*60*24*90
+    MIN_SIZE = 10
+
+    def __init__(self, sitePropers, epochTime=None):
+        if epochTime is None:
+            epochTime = int(time.time())
+        self.epochTime = epochTime
+        self.siteNames = sorted(sitePropers.keys())
+        self.siteIndex = {}
+        for index in range(len(self.siteNames)):
+            self.siteIndex[self.siteNames[index]] = index
+
+        # flatten the replicas of all sites into one table
+        nReplicas = 0
+        for site in self.siteNames:
+            nReplicas = nReplicas + len(sitePropers[site].datasetSizes)
+        self.site = numpy.empty(nReplicas,dtype=numpy.int32)
+        self.size = numpy.empty(nReplicas,dtype=numpy.float64)
+        self.reqTime = numpy.empty(nReplicas,dtype=numpy.float64)
+        self.updTime = numpy.empty(nReplicas,dtype=numpy.float64)
+        self.isDone = numpy.empty(nReplicas,dtype=numpy.int32)
+        start = 0
+        for site in self.siteNames:
+            sitePr = sitePropers[site]
+            dsets = sitePr.datasetSizes.keys()
+            end = start + len(dsets)
+            self.site[start:end] = self.siteIndex[site]
+            self.size[start:end] = [sitePr.datasetSizes[dset] for dset in dsets]
+            self.reqTime[start:end] = [sitePr.dsetReqTime[dset] for dset in dsets]
+            self.updTime[start:end] = [sitePr.dsetUpdTime[dset] for dset in dsets]
+            self.isDone[start:end] = [sitePr.dsetIsDone[dset] for dset in dsets]
+            start = end
+
+        self.computeStats()
+
+    def computeStats(self):
+        nSites = len(self.siteNames)
+        age = self.epochTime - self.reqTime
+        loadTime = self.updTime - self.reqTime
+
+        stuck = (self.isDone == 0) & (age > self.STUCK_TIME)
+        considered = (~stuck) & (loadTime > 0) & (loadTime <= self.MAX_LOAD_TIME) & \
+            (age <= self.MAX_AGE) & (self.size > self.MIN_SIZE)
+
+        self.nStuck = numpy.bincount(self.site,weights=stuck,minlength=nSites).astype(int)
+        self.loadSize = numpy.bincount(self.site,weights=self.size*considered,minlength=nSites)
+        loadTimes = numpy.bincount(self.site,weights=loadTime*considered,minlength=nSites)
+        self.speed = numpy.zeros(nSites)
+        hasLoad = loadTimes > 0
+        self.speed[hasLoad] = self.loadSize[hasLoad]/loadTimes[hasLoad]*(60*60*24)
+
+    def getDownloadStats(self, site):
+        if site not in self.siteIndex:
+            return (0, 0, 0)
+        index = self.siteIndex[site]
+        return (self.speed[index], self.loadSize[index], self.nStuck[index])
+
+    def getStuckCounts(self, sites=None):
+        if sites is None:
+            sites = self.siteNames
+        nstuckAtSite = {}
+        for site in sites:
+            nstuckAtSite[site] = int(self.getDownloadStats(site)[2])
+        return nstuckAtSite
+
+    def persist(self, fileName):
+        # append this cycle's values, one line per site: epoch site nStuck speed[GB/day] volume[GB]
+        outputFile = open(fileName,'a')
+        for index in range(len(self.siteNames)):
+            outputFile.write("%d %s %d %.1f %.1f\n"%(self.epochTime,self.siteNames[index],
+                                                     self.nStuck[index],self.speed[index],
+                                                     self.loadSize[index]))
+        outputFile.close()
+
+#---------------------------------------------------------------------------------------------------
+def trimmedMean(values, rmsW, frac):
+    # iteratively drop values further than rmsW*rms away from the mean until the mean is stable
+    values = numpy.asarray(values,dtype=numpy.float64)
+    meanPr = 999.0
+    mean = 0.0
+    rms = 999.9
+    for loops in range(11):
+        selected = values[numpy.abs(values - meanPr) <= rmsW*rms]
+        if len(selected) == 0:
+            break
+        mean = selected.mean()
+        rms = numpy.sqrt(max((selected*selected).mean() - mean*mean,0.0))
+        if abs(mean - meanPr) < frac*rms:
+            break
+        meanPr = mean
+    return (mean, rms)
+
+#---------------------------------------------------------------------------------------------------
+def readHistory(fileName, site=None, since=0):
+    # returns {site: [(epoch,nStuck,speed,volume), ...]} from a history file written by persist
+    history = {}
+    if not os.path.exists(fileName):
+        return history
+    inputFile = open(fileName,'r')
+    for line in inputFile.xreadlines():
+        items = line.split()
+        if len(items) != 5:
+            continue
+        epoch = int(items[0])
+        if epoch < since:
+            continue
+        if site is not None and items[1] != site:
+            continue
+        if items[1] not in history:
+            history[items[1]] = []
+        history[items[1]].append((epoch,int(items[2]),float(items[3]),float(items[4])))
+    inputFile.close()
+    return history
@@ -336,9 +336,6 @@ class SiteProperties:
     def reqTime(self,dset):
         return self.dsetReqTime[dset]
     
-    def dsetLoadTime(self,dset):
-        return (self.dsetUpdTime[dset] - self.dsetReqTime[dset])
-
     def spaceUnused(self):
         return self.spaceNotUsed
 
@@ -359,35 +356,6 @@ class SiteProperties:
                 return 1
         return 0
 
-    def considerForStats(self,dset):
-        if self.dsetLoadTime(dset) > 60*60*24*14:
-            return False
-        if self.dsetLoadTime(dset) <= 0:
-            return False
-        if (self.epochTime - self.dsetReqTime[dset]) > 60*60*24*90:
-            return False
-        return True
-
-    def getDownloadStats(self):
-        loadSize = 0
-        loadTime = 0
-        stuck = 0
-        for dset in self.datasetSizes:
-            if self.dsetIsStuck(dset) == 1:
-                stuck = stuck + 1
-                continue
-            if not self.considerForStats(dset):
-                continue
-
-            if self.datasetSizes[dset] > 10:
-                loadSize = loadSize + self.datasetSizes[dset]
-                loadTime = loadTime + self.dsetLoadTime(dset)
-
-        speed = 0
-        if loadTime > 0:
-            speed = loadSize/loadTime*(60*60*24)
-        return (speed, loadSize, stuck)
-      
     def getAverage(self,array):
         if len(array) < 3: return 0
         sortA = sorted(array)
@@ -25,6 +25,8 @@ export DETOX_MONITOR="monitor"
 export DETOX_PHEDEX_CACHE=DatasetsInPhedexAtSites.dat
 export DETOX_USED_DATASETS=UsedDatasets.txt
 export DETOX_DATASETS_TO_DELETE=RankedDatasets.txt
+export DETOX_DATASET_CACHE=DatasetIdCache.bin
+export DETOX_SITE_HEALTH=SiteHealthHistory.txt
 
 # PhEDEx group that is considered 
 
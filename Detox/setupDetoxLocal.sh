@@ -25,6 +25,8 @@ export DETOX_MONITOR="monitor"
 export DETOX_PHEDEX_CACHE=DatasetsInPhedexAtSites.dat
 export DETOX_USED_DATASETS=UsedDatasets.txt
 export DETOX_DATASETS_TO_DELETE=RankedDatasets.txt
+export DETOX_DATASET_CACHE=DatasetIdCache.bin
+export DETOX_SITE_HEALTH=SiteHealthHistory.txt
 
 
 # PhEDEx group that is considered 
@@ -81,4 +83,5 @@ export DETOX_PYTHONPATH="$DETOX_BASE/python"
 #then
 #  export PYTHONPATH="/usr/local/lib/python2.7:/usr/local/lib/python2.7/site-packages"
 #fi
-export PYTHONPATH="${DETOX_PYTHONPATH}:$PYTHONPATH"
+# the shared PhEDEx client is taken from Api in a local checkout
+export PYTHONPATH="${DETOX_PYTHONPATH}:`dirname $DETOX_BASE`/Api/src:$PYTHONPATH"
@@ -3,7 +3,7 @@
 #===================================================================================================
 import sys, os, subprocess, re, time, datetime, smtplib, shutil, string, glob
 import siteStatus,siteReadinessHandler,detoxWebReader, cleanStateKeeper, dbInfoHandler
-import phedexApi
+import phedexApi, resignPlanner
 
 class CentralManager:
     def __init__(self):
@@ -114,113 +114,89 @@ class CentralManager:
             self.siteSizeShift[siteName] = sizeShift
 
     def resignDatasets(self):
-        #get last copy datasets on the dead site
-        #assign them to sites with lowest % of last copies
+        #get last copy datasets on the dead and over-full sites
+        #assign them to sites with most space left, in one plan for all sites
         #make sure that sites can host them
         #make sure to update sites info
         basedir = self.basedir + '/' + os.environ['UNDERTAKER_TRDIR']
         
         self.siteSpace = self.detoxWebReader.getSiteSpace()
-        pendingSets = self.cleanStateKeeper.pendingSets()
-        setsToSites = {}
-        siteToSites = {}
+        pendingSets = set(self.cleanStateKeeper.pendingSets())
         worstStuck = self.detoxWebReader.getWorstStuck()
         lcsites = self.detoxWebReader.getFilledwLC()
         unifiedList =  self.sitesToDisable.keys() + lcsites
 	pending = self.cleanStateKeeper.siteDeletions.keys()
 	print unifiedList
-        for siteName in reversed(unifiedList):
-	    #if siteName == 'T2_RU_IHEP': pass
-	    #else:   continue
-	    if siteName in pending:
-		continue
-            #if siteName.startswith('T1_US'):
-            #    continue
-            print "Re-signing datasets for SITE=" + siteName
-            siteToSites[siteName] = []
+        sources = [site for site in unifiedList if site not in pending]
+        # download the Detox lists of all candidate sites in parallel
+        self.detoxWebReader.prefetchSites(sources)
+
+        planner = resignPlanner.ResignPlanner(maxPerSite=30000)
+        allRanks = {}
+        for siteName in sources:
             datasets = self.detoxWebReader.getDatasetsForSite(siteName)
             deprecated = self.detoxWebReader.getJunkDatasets(siteName)
             #make sure it is not deprectaed set
+            #part of the datasets might be already in pending request
             for dset in datasets.keys():
-                if dset in deprecated:
+                if dset in deprecated or dset in pendingSets:
                     del datasets[dset]
 
             #for just offloading some last copies do for half of the datasets
-            totalSets = len(datasets.keys())
-            deleted = 0
+            isDead = siteName in self.sitesToDisable
             if siteName in lcsites:
-                for dsetIt in sorted(datasets.items(), key=lambda e: e[1][0]):
-                    dset = dsetIt[0]
+                byRank = sorted(datasets.items(), key=lambda e: e[1][0])
+                for (dset,rankSize) in byRank[:len(byRank)/2+1]:
                     del datasets[dset]
-                    deleted = deleted + 1
-                    if deleted > totalSets/2:
-                        break
-                
-            totalSets = len(datasets.keys())
-            if totalSets < 1:
-                break
-
-            self.dbInfoHandler.setDatasetRanks(datasets)
-            for site in sorted(self.siteSpace,cmp=self.localCompare):
-                if site in unifiedList:
-                    continue
-                if site in self.siteSizeShift:
-                    continue
-                if site in worstStuck:
+
+            if len(datasets) < 1:
+                continue
+            print "Re-signing datasets for SITE=" + siteName
+            planner.addSource(siteName,datasets,isDead)
+            allRanks.update(datasets)
+
+        for site in self.siteSpace:
+            if site in unifiedList:
+                continue
+            if site in self.siteSizeShift:
+                continue
+            if site in worstStuck:
+                continue
+
+            #make sure sets do not go the dead or waiting room site
+            if site.startswith('T2_'):
+                siteInfo = self.siteReadinessHandler.getSiteReadiness(site)
+                dbStatus = self.allSites[site].getStatus() 
+                if dbStatus != 1 or siteInfo.inWaitingRoom() or siteInfo.isDead():
                     continue
+            sizeCanTake = (self.siteSpace[site][0]*0.88 - self.siteSpace[site][1])*1000
+	    if sizeCanTake < 30000:
+		continue
+            planner.addDestination(site,sizeCanTake)
 
-                #make sure sets do not go the dead or waiting room site
-                if site.startswith('T2_'):
-                    siteInfo = self.siteReadinessHandler.getSiteReadiness(site)
-                    dbStatus = self.allSites[site].getStatus() 
-                    if dbStatus != 1 or siteInfo.inWaitingRoom() or siteInfo.isDead():
-                        continue
-                sizeCanTake = (self.siteSpace[site][0]*0.88 - self.siteSpace[site][1])*1000
-                addedSize = 0
-                addedSets = 0
-		if sizeCanTake < 30000:
-		    continue
-
-                for dsetIt in sorted(datasets.items(), key=lambda e: e[1][0], reverse=True):
-                    dset = dsetIt[0]
-
-                    #part of the datasets might be already in pending request
-                    if dset in pendingSets:
-                        del datasets[dset]
-                        continue
-
-                    addedSize = addedSize + datasets[dset][1]
-                    datasets[dset][1]
-                    if (addedSize > sizeCanTake or addedSize > 30000) and addedSets > 0:
-                        addedSize = addedSize - datasets[dset][1]
-                        break
-                    if site not in setsToSites:
-                        setsToSites[site] = [dset]
-                    else:
-                        setsToSites[site].append(dset)
-                    del datasets[dset]
-                    addedSets = addedSets + 1
-                print " - site " + site + " can take " + str(sizeCanTake)
-                print " ------ will take " + str(addedSize)
-                siteToSites[siteName].append(site)
-                (quota,totalSize,lastCopy) = self.siteSpace[site]
-                totalSize = totalSize + addedSize
-                lastCopy = lastCopy + addedSize
-                self.siteSpace[site] = (quota,totalSize,lastCopy)
-                if len(datasets.keys()) < 1:
-                    break
-            #limit ourselves with one site at a time
-            break
-
-
-        for siteFrom in siteToSites:
-            for siteTo in siteToSites[siteFrom]:
+        (transfers,addedSizes) = planner.plan()
+        self.dbInfoHandler.setDatasetRanks(allRanks)
+
+        setsToSites = {}
+        for siteFrom in transfers:
+            for siteTo in transfers[siteFrom]:
+                dsets = transfers[siteFrom][siteTo]
+                if siteTo not in setsToSites:
+                    setsToSites[siteTo] = []
+                setsToSites[siteTo].extend(dsets)
                 fileOut = open(basedir+'/'+siteFrom+'-'+siteTo,'w')
-                dsets = setsToSites[siteTo]
                 for dset in dsets:
                     fileOut.write(dset+'\n')
                 fileOut.close()
 
+        for site in sorted(setsToSites):
+            addedSize = addedSizes[site]
+            print " - site " + site + " will take " + str(addedSize)
+            (quota,totalSize,lastCopy) = self.siteSpace[site]
+            totalSize = totalSize + addedSize
+            lastCopy = lastCopy + addedSize
+            self.siteSpace[site] = (quota,totalSize,lastCopy)
+
         #now cache files are created, time to submit actuall deletion request
         #disable deletions for now, no need 
         #for siteName in self.sitesToDisable:
@@ -232,10 +208,9 @@ class CentralManager:
         for site in setsToSites:
             dsets = setsToSites[site]
             self.submitTransferRequest(site,dsets)
-        #all requests are out, time to disable site
+        #all requests are out, time to disable the dead sites
         for site in self.sitesToDisable:
             self.dbInfoHandler.disableSite(site)
-            break
 
     def submitDeletionRequest(self,site,datasets2del):
         if len(datasets2del) < 1:
@@ -1,14 +1,9 @@
 #===================================================================================================
 #  C L A S S
 #===================================================================================================
-import sys, os, subprocess, re, time, shutil, string, signal, glob
+import sys, os, re, time, shutil, string, glob, hashlib
 import datetime
-
-class Alarm(Exception):
-    pass
-
-def alarm_handler(signum, frame):
-    raise Alarm
+import webFetcher, transferState
 
 class CleanStateKeeper:
     def __init__(self):
@@ -17,74 +12,54 @@ class CleanStateKeeper:
             raise Exception(' FATAL -- UNDERTAKER environment not defined: source setup.sh\n')
 
         self.basedir = os.environ['UNDERTAKER_DB']+'/'+os.environ['UNDERTAKER_TRDIR']
+        # the state lives next to (not in) the transfer directory, which only holds transfer files
+        self.transferState = transferState.TransferState(os.environ['UNDERTAKER_DB'] + '/' + \
+                                      os.environ.get('UNDERTAKER_TRSTATE','TransferState.db'))
 
         self.siteDeletions = {}
-        self.siteTransfers = {}
-        self.dsetTransfers = {}
         self.sitePendings = {}
-
-        self.dsetPlaces = {}
-        self.deletionFiles = {}
-        self.startTranferTime = {}
+        self.newTransfers = 0
         self.dateNow = datetime.datetime.now()
 
         self.olderRequests()
         self.extractDetoxDatasets()
 
     def olderRequests(self):
-        for fileName in glob.glob(self.basedir+'/*'):
-            lastpart = fileName.split('/')[-1]
-            siteFrom = lastpart.split('-')[0]
-            siteTo   = lastpart.split('-')[1]
-
-            if siteFrom not in self.deletionFiles:
-                self.deletionFiles[siteFrom] = []
-            self.deletionFiles[siteFrom].append(fileName)
-
-            crtime = os.path.getmtime(fileName)
-            crdate = datetime.datetime.fromtimestamp(crtime)
-            self.startTranferTime[siteFrom] = crdate
-
-            if siteFrom not in self.siteDeletions:
-                self.siteDeletions[siteFrom] = []
-            if siteTo not in self.siteTransfers:
-                self.siteTransfers[siteTo] = []
-
-            fileIn = open(fileName,'r')
-            for line in fileIn:
-                line = line.strip()
-                self.siteDeletions[siteFrom].append(line)
-                self.siteTransfers[siteTo].append(line)
-                self.dsetTransfers[line] = siteTo
-            fileIn.close()
+        # only new transfer files get read, the rest is already in the transfer state
+        self.newTransfers = self.transferState.syncFiles(glob.glob(self.basedir+'/*'))
+        for siteFrom in self.transferState.sourceSites():
+            self.siteDeletions[siteFrom] = \
+                [row[0] for row in self.transferState.transfersFrom(siteFrom)]
 
     def extractDetoxDatasets(self):
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB') + '/status/'
-        url = '"' + webServer + '/DatasetsInPhedexAtSites.dat' + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-        #print ' Access Detox Web:\n' + cmd
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to Detox web timed out, stopping")
-
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to Detox web failed, stopping")
-
-        lines = mystring.splitlines()
-        for li in lines:
+        # shared with the DetoxWebReader, so the file is only downloaded once per run
+        url = os.environ.get('UNDERTAKER_DETOXWEB') + '/status/DatasetsInPhedexAtSites.dat'
+        fetcher = webFetcher.getFetcher()
+        mystring = fetcher.get(url)
+        if mystring is None:
+            raise Exception(" FATAL -- Detox web file %s not found, stopping"%(url))
+
+        # nothing to do if neither the cache, the transfers nor the source sites changed since we
+        # last looked, otherwise the state of every transfer is computed again
+        (etag,lastModified) = fetcher.validators(url)
+        version = etag or lastModified or hashlib.md5(mystring).hexdigest()
+        sources = ' '.join(sorted(self.siteDeletions))
+        datasets = self.transferState.datasets()
+        if len(datasets) == 0:
+            return
+        if self.newTransfers == 0 and version == self.transferState.getMeta('phedexCacheVersion') \
+                and sources == self.transferState.getMeta('sourceSites'):
+            return
+
+        # only the datasets to be transferred are of interest
+        transferred = set()
+        for li in mystring.splitlines():
+            dsetname = li.split(None,1)[0] if li else ''
+            if dsetname not in datasets:
+                continue
             items = li.split()
-            if len(items) < 5:
+            if len(items) < 9:
                 continue
-            dsetname = items[0]
             group = items[1]
             valid = int(items[8])
             sitename = items[5]
@@ -94,25 +69,26 @@ class CleanStateKeeper:
                 continue
             if valid != 1:
                 continue
+            transferred.add(dsetname)
 
-            if dsetname in self.dsetPlaces:
-                self.dsetPlaces[dsetname].append(sitename)
-            else:
-                self.dsetPlaces[dsetname] = [sitename]
+        self.transferState.setDone(transferred)
+        self.transferState.setMeta('phedexCacheVersion',version)
+        self.transferState.setMeta('sourceSites',sources)
 
     def processPending(self):
         for siteFrom in self.siteDeletions:
-            daysPassed = (self.dateNow - self.startTranferTime[siteFrom]).days
+            files = self.transferState.filesFrom(siteFrom)
+            startTranferTime = datetime.datetime.fromtimestamp(max([row[1] for row in files]))
+            daysPassed = (self.dateNow - startTranferTime).days
             printedLine = ""
 
-            datasets = self.siteDeletions[siteFrom]
+            transfers = self.transferState.transfersFrom(siteFrom)
             transfd = 0
-            for dset in datasets:
+            for (dset,siteTo,done) in transfers:
                 # check if dataset already tranferred or not
-                if dset in self.dsetPlaces:
+                if done:
                     transfd = transfd + 1
                 else:
-                    siteTo = self.dsetTransfers[dset]
                     if siteTo not in self.sitePendings:
                         self.sitePendings[siteTo] = []
                     self.sitePendings[siteTo].append(dset)
@@ -123,18 +99,19 @@ class CleanStateKeeper:
                             print "\n " + printedLine + "\n"
                         print "  " + dset
 
-            allSets = len(datasets)
+            allSets = len(transfers)
             print "\n " + siteFrom
             print " -- Need to offload " + str(allSets) + " datasets"
             print " -- done with " + str(transfd)
-            if float(allSets-transfd)/allSets < 0.1:
+            if allSets == 0 or float(allSets-transfd)/allSets < 0.1:
                 # means all sets are found on other sites
                 # can delete the file and proceed
                 print " -- All datasets for " + siteFrom + " are accounted --"
-                allFiles = self.deletionFiles[siteFrom]
+                allFiles = [row[0] for row in files]
                 for fileName in allFiles:
-                    print "  -deleting file " + fileName 
+                    print "  -deleting file " + fileName
                     os.remove(fileName)
+                self.transferState.removeFiles(allFiles)
 
         return self.sitePendings
 
@@ -1,13 +1,8 @@
 #===================================================================================================
 #  C L A S S
 #===================================================================================================
-import os, subprocess, re, signal, sys, json, math
-
-class Alarm(Exception):
-    pass
-
-def alarm_handler(signum, frame):
-    raise Alarm
+import os, re, sys, json, math
+import webFetcher
 
 class DetoxWebReader:
     def __init__(self):
@@ -15,31 +10,37 @@ class DetoxWebReader:
         self.siteSpace = {}
         self.siteDiskSpace = {}
         self.stuckAtSite = {}
+        self.webServer = os.environ.get('UNDERTAKER_DETOXWEB')
+        self.fetcher = webFetcher.getFetcher()
+        # all global Detox artifacts are downloaded together
+        self.fetcher.prefetch([self.sitesInfoUrl(),self.phedexCacheUrl(),self.transferStatsUrl()])
         self.extractDetoxData()
         self.extractAllSiteSizes()
         self.extractStuckDsets()
         self.getWorstStuck()
     
-    def extractDetoxData(self):
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB') + '/SitesInfo.txt'
-        url = '"' + webServer + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-        print ' Access Detox Web:\n ' + cmd
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to DeadSites timed out, stopping")
+    def sitesInfoUrl(self):
+        return self.webServer + '/SitesInfo.txt'
+    def phedexCacheUrl(self):
+        return self.webServer + '/status/DatasetsInPhedexAtSites.dat'
+    def transferStatsUrl(self):
+        return self.webServer + '/TransferStats.txt'
+    def remainingDatasetsUrl(self,siteName):
+        return self.webServer + '/result/' + siteName + '/RemainingDatasets.txt'
+    def junkDatasetsUrl(self,siteName):
+        return self.webServer + '/result/' + siteName + '/DeprecatedSets.txt'
+
+    def prefetchSites(self,siteNames):
+        # download the per site lists of all sites we are going to look at in one go
+        urls = []
+        for siteName in siteNames:
+            urls.append(self.remainingDatasetsUrl(siteName))
+            urls.append(self.junkDatasetsUrl(siteName))
+        self.fetcher.prefetch(urls)
 
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to DeadSites failed, stopping")
+    def extractDetoxData(self):
+        print ' Access Detox Web:\n ' + self.sitesInfoUrl()
+        mystring = self.fetcher.get(self.sitesInfoUrl()) or ''
 
         lines = mystring.splitlines()
         readThatBlock = False
@@ -69,28 +70,10 @@ class DetoxWebReader:
             redSomeLines = True
 
     def getDatasetsForSite(self,siteName):
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB') + '/result/'
-        url = '"' + webServer + siteName +'/RemainingDatasets.txt' + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-        #print ' Access Detox Web:\n' + cmd
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to DeadSites timed out, stopping")
-
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to DeadSites failed, stopping")
+        mystring = self.fetcher.get(self.remainingDatasetsUrl(siteName))
 
         datasets = {}
-        if mystring.find('Not Found') != -1 :
+        if mystring is None or mystring.find('Not Found') != -1 :
             return datasets
 
         readThatBlock = False
@@ -117,28 +100,10 @@ class DetoxWebReader:
         return datasets
 
     def getJunkDatasets(self,siteName):
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB') + '/result/'
-        url = '"' + webServer + siteName +'/DeprecatedSets.txt' + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-        #print ' Access Detox Web:\n' + cmd
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to DeadSites timed out, stopping")
-
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to DeadSites failed, stopping")
+        mystring = self.fetcher.get(self.junkDatasetsUrl(siteName))
 
         datasets = {}
-        if mystring.find('Not Found') != -1 :
+        if mystring is None or mystring.find('Not Found') != -1 :
             return datasets
         lines = mystring.splitlines()
         for li in lines:
@@ -154,24 +119,7 @@ class DetoxWebReader:
 
     def extractAllSiteSizes(self):
 
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB') + '/status/'
-        url = '"' + webServer +'/DatasetsInPhedexAtSites.dat' + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to DeadSites timed out, stopping")
-
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to DeadSites failed, stopping")
+        mystring = self.fetcher.get(self.phedexCacheUrl()) or ''
 
         lines = mystring.splitlines()
         for li in lines:
@@ -192,24 +140,7 @@ class DetoxWebReader:
 
     def extractStuckDsets(self):
 
-        webServer = os.environ.get('UNDERTAKER_DETOXWEB')
-        url = '"' + webServer +'/TransferStats.txt' + '"'
-        cmd = 'curl -k -H "Accept: text" ' + url
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to TransferStats timed out, stopping")
-
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to TransferStats failed, stopping")
+        mystring = self.fetcher.get(self.transferStatsUrl()) or ''
 
         lines = mystring.splitlines()
         for li in lines:
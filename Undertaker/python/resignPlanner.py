@@ -0,0 +1,77 @@
+#===================================================================================================
+#  C L A S S
+#===================================================================================================
+import heapq
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  ResignPlanner(maxPerSite)
+Plans where the last copies of datasets on dead or over-full sites should go. All source sites
+are handled in one pass: the datasets of all sources sit in one heap (sets from dead sites first,
+then by rank, highest first) and the destinations in a max-heap of the space they can still take.
+Every dataset goes to the destination with most room left, or stays where it is if it fits nowhere.
+"""
+#---------------------------------------------------------------------------------------------------
+class ResignPlanner:
+    "A ResignPlanner assigns the datasets of all source sites to destination sites."
+
+    def __init__(self,maxPerSite=30000):
+        # at most this much [GB] is sent to one destination per run (unless it is a single dataset)
+        self.maxPerSite = maxPerSite
+        self.sources = {}
+        self.deadSources = {}
+        self.capacity = {}
+        self.added = {}
+
+    def addSource(self,siteName,datasets,isDead):
+        # datasets: {name: (rank,size)}
+        self.sources[siteName] = datasets
+        if isDead:
+            self.deadSources[siteName] = True
+
+    def addDestination(self,siteName,sizeCanTake):
+        self.capacity[siteName] = sizeCanTake
+        self.added[siteName] = 0
+
+    def room(self,site):
+        room = self.capacity[site] - self.added[site]
+        if self.added[site] > 0:
+            room = min(room,self.maxPerSite - self.added[site])
+        return room
+
+    def plan(self):
+        # returns {siteFrom: {siteTo: [datasets]}} and the size added to each destination
+        datasets = []
+        for siteFrom in self.sources:
+            priority = 0
+            if siteFrom in self.deadSources:
+                priority = 1
+            for dset in self.sources[siteFrom]:
+                (rank,size) = self.sources[siteFrom][dset]
+                datasets.append((-priority,-rank,dset,siteFrom,size))
+        heapq.heapify(datasets)
+
+        destinations = [(-self.room(site),site) for site in self.capacity]
+        heapq.heapify(destinations)
+
+        transfers = {}
+        assigned = {}
+        while datasets and destinations:
+            (priority,rank,dset,siteFrom,size) = heapq.heappop(datasets)
+            if dset in assigned:
+                continue
+            (room,siteTo) = destinations[0]
+            if size > -room:
+                # does not fit anywhere this time around
+                continue
+            assigned[dset] = siteTo
+            self.added[siteTo] = self.added[siteTo] + size
+            heapq.heapreplace(destinations,(-self.room(siteTo),siteTo))
+
+            if siteFrom not in transfers:
+                transfers[siteFrom] = {}
+            if siteTo not in transfers[siteFrom]:
+                transfers[siteFrom][siteTo] = []
+            transfers[siteFrom][siteTo].append(dset)
+
+        return (transfers,dict(self.added))
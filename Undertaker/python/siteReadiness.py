@@ -2,31 +2,66 @@
 #  C L A S S
 #===================================================================================================
 import os, re, sys
-import datetime
-
+import datetime, calendar, bisect
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  SiteReadiness(siteName)
+Readiness timeline of one site. For each state (0 = dead, 1 = waiting room) the days the site went
+'in' and 'out' are kept as sorted epoch arrays, so the current state, the state at a given day and
+the last time in a state are binary searches.
+"""
+#---------------------------------------------------------------------------------------------------
 class SiteReadiness:
     def __init__(self,siteName):
         self.siteName = siteName
-        self.status = {}
-        self.wasEverDead = False
-        self.wasEverWaiting = False
+        self.ins = {0: [], 1: []}
+        self.outs = {0: [], 1: []}
         self.epochDate = datetime.date(2000,1,1)
 
+    def toEpoch(self,timest):
+        return calendar.timegm(timest.timetuple())
+
+    def toDate(self,epoch):
+        return datetime.datetime.utcfromtimestamp(epoch).date()
+
     def update(self,state,status,timest):
-        self.status[timest] = (state,status)
+        # the latest status reported for a given day wins
+        epoch = self.toEpoch(timest)
+        self.remove(self.ins[state],epoch)
+        self.remove(self.outs[state],epoch)
         if status == 'in':
-            if state == 0:
-                self.wasEverDead = True
-            if state == 1:
-                self.wasEverWaiting = True
+            bisect.insort(self.ins[state],epoch)
+        else:
+            bisect.insort(self.outs[state],epoch)
+
+    def remove(self,epochs,epoch):
+        index = bisect.bisect_left(epochs,epoch)
+        if index < len(epochs) and epochs[index] == epoch:
+            del epochs[index]
+
+    def toDict(self):
+        return {'in': [self.ins[0],self.ins[1]], 'out': [self.outs[0],self.outs[1]]}
+
+    def fromDict(self,data):
+        for state in (0,1):
+            self.ins[state] = sorted(data['in'][state])
+            self.outs[state] = sorted(data['out'][state])
 
     def prStatus(self):
         print self.siteName
-        for timest in sorted(self.status):
-            print str(timest) + ":" + str(self.status[timest][0]) + ' ' + self.status[timest][1] 
+        for (epoch,state,status) in self.timeline():
+            print str(self.toDate(epoch)) + ":" + str(state) + ' ' + status
+
+    def timeline(self):
+        entries = []
+        for state in (0,1):
+            entries.extend([(epoch,state,'in') for epoch in self.ins[state]])
+            entries.extend([(epoch,state,'out') for epoch in self.outs[state]])
+        return sorted(entries)
 
     def hadProblems(self):
-        if self.wasEverDead or self.wasEverWaiting:
+        if len(self.ins[0]) > 0 or len(self.ins[1]) > 0:
             return True
         return False
 
@@ -36,16 +71,19 @@ class SiteReadiness:
     def inWaitingRoom(self):
         return self.isInState(1)
 
+    def lastBefore(self,epochs,epoch):
+        # latest entry strictly before epoch, None if there is none
+        index = bisect.bisect_left(epochs,epoch)
+        if index == 0:
+            return None
+        return epochs[index-1]
+
     def isInState(self,state):
-        for timest in sorted(self.status,reverse=True):
-            place = self.status[timest][0]
-            status = self.status[timest][1]
-            if place == state:
-                if status == 'in':
-                    return True
-                else:
-                    return False
-        return False
+        if len(self.ins[state]) == 0:
+            return False
+        if len(self.outs[state]) == 0:
+            return True
+        return self.ins[state][-1] > self.outs[state][-1]
 
     def wasDead(self,timeStampStr):
         return self.wasInState(timeStampStr,0)
@@ -55,17 +93,12 @@ class SiteReadiness:
 
     def wasInState(self,timeStampStr,state):
         timeStamp = datetime.datetime.strptime(timeStampStr,"%Y-%m-%d").date()
-        for timest in sorted(self.status,reverse=True):
-            place = self.status[timest][0]
-            status = self.status[timest][1]
-            if place != state:
-                continue
-            if timeStamp > timest:
-                if status == 'in':
-                    return True
-                else:
-                    return False
-        return False
+        epoch = self.toEpoch(timeStamp)
+        lastIn = self.lastBefore(self.ins[state],epoch)
+        if lastIn is None:
+            return False
+        lastOut = self.lastBefore(self.outs[state],epoch)
+        return lastOut is None or lastIn > lastOut
 
     def lastTimeDead(self):
        return self.lastTime(0)
@@ -73,43 +106,26 @@ class SiteReadiness:
     def lastTimeInWaitingRoom(self):
        return self.lastTime(1)
 
-
     def declaredDead(self):
-        for timest in sorted(self.status,reverse=True):
-            place = self.status[timest][0]
-            status = self.status[timest][1]
-            if place != 0:
-                continue
-            if status == 'in':
-                return timest
-        return None
-
+        if len(self.ins[0]) == 0:
+            return None
+        return self.toDate(self.ins[0][-1])
 
     def lastTime(self,state):
-        lastTimeIn = None
-        lastTimeOut = None
-        for timest in sorted(self.status,reverse=True):
-            place = self.status[timest][0]
-            status = self.status[timest][1]
-            if place != state:
-                continue
-            if status == 'out':
-                lastTimeOut = timest
-            if status == 'in':
-                lastTimeIn = timest
-                break
-        if lastTimeIn == None:
+        # day before the site left the state after its last 'in', today if it is still in
+        if len(self.ins[state]) == 0:
             return self.epochDate
-        if lastTimeOut == None:
-            return datetime.datetime.now()
-        return (lastTimeOut -  datetime.timedelta(days=1))
+        lastIn = self.ins[state][-1]
+        index = bisect.bisect_right(self.outs[state],lastIn)
+        if index == len(self.outs[state]):
+            return datetime.date.today()
+        return (self.toDate(self.outs[state][index]) -  datetime.timedelta(days=1))
 
     def printResults(self):
         isDead = False
         isInwr = False
-        for timest in sorted(self.status):
-            state = self.status[timest][0]
-            status = self.status[timest][1]
+        for (epoch,state,status) in self.timeline():
+            timest = self.toDate(epoch)
             if isDead == False and status == 'in' and state == 0:
                 print " - in morgue since    " + str(timest)
                 isDead = True
@@ -122,4 +138,3 @@ class SiteReadiness:
             if isInwr and status == 'out' and state == 1:
                 print " -- left waiting room " + str(timest)
                 isInwr = False
-            
@@ -1,98 +1,95 @@
 #===================================================================================================
 #  C L A S S
 #===================================================================================================
-import os, subprocess, re, signal, sys, MySQLdb, json
-from datetime import datetime
+import os, re, sys, json
+from datetime import datetime, date, timedelta
 import siteReadiness
-
-class Alarm(Exception):
-    pass
-
-def alarm_handler(signum, frame):
-    raise Alarm
+import webFetcher
 
 class SiteReadinessHandler:
-    def __init__(self):
+    # the readiness timelines are kept in a local store which only gets the days since the last
+    # update added, other tools (Detox) can query it by passing storeFile, without network access
+    def __init__(self,storeFile=None):
         self.siteReadiness = {}
-    
+        if storeFile is None:
+            storeFile = os.environ['UNDERTAKER_DB'] + '/' + \
+                os.environ.get('UNDERTAKER_READINESS','SiteReadiness.json')
+        self.storeFile = storeFile
+        self.lastUpdate = None
+        self.loadStore()
+
     def extractReadinessData(self):
-        self.getWaitingRoomData()
-        self.getDeadSitesData()
+        # overlap one day with the last update, the latest value of a day wins anyway
+        today = date.today()
+        if self.lastUpdate is None:
+            timeArgs = 'time=2184&dateFrom=&dateTo='
+        else:
+            dateFrom = self.lastUpdate - timedelta(days=1)
+            timeArgs = 'time=custom&dateFrom=%s&dateTo=%s'%(dateFrom,today+timedelta(days=1))
 
-    def getDeadSitesData(self):
         webServer = 'http://dashb-ssb.cern.ch/dashboard/request.py/getplotdata?'
-        args = 'columnid=199&time=2184&dateFrom=&dateTo=&sites=all&clouds=undefined&batch=1'
+        urls = {}
+        for (state,column) in ((0,199),(1,153)):
+            args = 'columnid=%d&%s&sites=all&clouds=undefined&batch=1'%(column,timeArgs)
+            urls[state] = webServer + args
+        print ' Access SiteReadiness: ' + str(urls.values())
 
-        url = '"' + webServer + args + '"'
-        cmd = 'curl -k -H "Accept: application/json" ' + url
-        print ' Access DeadSites: ' + cmd
+        fetcher = webFetcher.getFetcher()
+        fetcher.prefetch(urls.values(),accept='application/json')
+        self.getWaitingRoomData(fetcher.get(urls[1],accept='application/json'))
+        self.getDeadSitesData(fetcher.get(urls[0],accept='application/json'))
 
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to DeadSites timed out, stopping")
+        self.lastUpdate = today
+        self.saveStore()
 
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to DeadSites failed, stopping")
-
-        dataJson = json.loads(mystring)
-        data = dataJson["csvdata"]
-        for item in data:
-            site = item['VOName']
-            status = item['Status']
-            timest = datetime.strptime(item['Time'],"%Y-%m-%dT%H:%M:%S").date()
-            
-            if site not in self.siteReadiness:
-                self.siteReadiness[site] = siteReadiness.SiteReadiness(site)
-            self.siteReadiness[site].update(0,status,timest)
+    def getDeadSitesData(self,mystring):
+        self.readStatus(mystring,0)
 
         #forced = 'T2_TW_Taiwan'
         #if forced not in self.siteReadiness:
         #    self.siteReadiness[forced] = siteReadiness.SiteReadiness(forced)
         #self.siteReadiness[forced].update(0,'in',datetime.strptime('2014-11-03',"%Y-%m-%d").date())
-        
-    def getWaitingRoomData(self):
-        webServer = 'http://dashb-ssb.cern.ch/dashboard/request.py/getplotdata?'
-        args = 'columnid=153&time=2184&dateFrom=&dateTo=&sites=all&clouds=undefined&batch=1'
-
-        url = '"' + webServer + args + '"'
-        cmd = 'curl -k -H "Accept: application/json" ' + url
-        print ' Access SiteWaitingRoom: ' + cmd
-
-        process = subprocess.Popen(cmd,stdout=subprocess.PIPE,stderr=subprocess.PIPE,shell=True)
-        signal.signal(signal.SIGALRM, alarm_handler)
-        signal.alarm(10*60)  # 10 minutes
-        try:
-            mystring, error = process.communicate()
-            signal.alarm(0)
-        except Alarm:
-            print " Oops, taking too long!"
-            raise Exception(" FATAL -- Call to SiteWaitingRoom timed out, stopping")
 
-        if process.returncode != 0:
-            print " Received non-zero exit status: " + str(process.returncode)
-            raise Exception(" FATAL -- Call to SiteWaitingRoom failed, stopping")
+    def getWaitingRoomData(self,mystring):
+        self.readStatus(mystring,1)
 
+    def readStatus(self,mystring,state):
+        if mystring is None:
+            raise Exception(" FATAL -- Call to SiteReadiness failed, stopping")
         dataJson = json.loads(mystring)
         data = dataJson["csvdata"]
-        for item in data:
+        for item in sorted(data,key=lambda x: x['Time']):
             site = item['VOName']
             status = item['Status']
             timest = datetime.strptime(item['Time'],"%Y-%m-%dT%H:%M:%S").date()
-            
+
             if site not in self.siteReadiness:
                 self.siteReadiness[site] = siteReadiness.SiteReadiness(site)
-            self.siteReadiness[site].update(1,status,timest)
+            self.siteReadiness[site].update(state,status,timest)
+
+    def loadStore(self):
+        if not os.path.exists(self.storeFile):
+            return
+        inputFile = open(self.storeFile,'r')
+        store = json.load(inputFile)
+        inputFile.close()
+        self.lastUpdate = datetime.strptime(store['lastUpdate'],"%Y-%m-%d").date()
+        for site in store['sites']:
+            self.siteReadiness[site] = siteReadiness.SiteReadiness(site)
+            self.siteReadiness[site].fromDict(store['sites'][site])
+
+    def saveStore(self):
+        store = {'lastUpdate': str(self.lastUpdate), 'sites': {}}
+        for site in self.siteReadiness:
+            store['sites'][site] = self.siteReadiness[site].toDict()
+        tmpName = self.storeFile + '.tmp'
+        outputFile = open(tmpName,'w')
+        json.dump(store,outputFile)
+        outputFile.close()
+        os.rename(tmpName,self.storeFile)
 
     def getSites(self):
         return self.siteReadiness.keys()
-            
+
     def getSiteReadiness(self,site):
         return self.siteReadiness[site]
@@ -0,0 +1,122 @@
+#===================================================================================================
+#  C L A S S
+#===================================================================================================
+import os, sqlite3
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  TransferState(dbFile)
+Persistent state of the Undertaker transfers (sqlite). Every dataset of every transfer file is
+a row indexed by dataset, source and destination site, with a flag telling whether the dataset has
+been found at another site. Transfer files are only read once, and the PhEDEx cache only needs to
+be looked at when it, the transfers or the source sites have changed.
+"""
+#---------------------------------------------------------------------------------------------------
+class TransferState:
+    "A TransferState keeps track of the pending Undertaker transfers."
+
+    def __init__(self,dbFile):
+        self.dbFile = dbFile
+        self.connection = sqlite3.connect(dbFile)
+        self.connection.text_factory = str
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS TransferFiles '
+                                    '(FileName TEXT PRIMARY KEY, SiteFrom TEXT, SiteTo TEXT, '
+                                    'ModTime REAL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS Transfers '
+                                    '(DatasetName TEXT, SiteFrom TEXT, SiteTo TEXT, '
+                                    'FileName TEXT, Done INTEGER DEFAULT 0)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS Meta '
+                                    '(Key TEXT PRIMARY KEY, Value TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS TransfersDataset '
+                                    'ON Transfers (DatasetName)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS TransfersFrom '
+                                    'ON Transfers (SiteFrom)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS TransfersTo '
+                                    'ON Transfers (SiteTo)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS TransfersFile '
+                                    'ON Transfers (FileName)')
+
+    def close(self):
+        self.connection.close()
+
+    #-----------------------------------------------------------------------------------------------
+    # transfer files
+    #-----------------------------------------------------------------------------------------------
+    def syncFiles(self,fileNames):
+        # reads new (or rewritten) transfer files, forgets about the ones that are gone,
+        # returns the number of transfers that were added
+        nAdded = 0
+        known = {}
+        for (fileName,modTime) in self.connection.execute('SELECT FileName,ModTime FROM TransferFiles'):
+            known[fileName] = modTime
+
+        with self.connection:
+            for fileName in fileNames:
+                modTime = os.path.getmtime(fileName)
+                if fileName in known and known[fileName] == modTime:
+                    continue
+                lastpart = fileName.split('/')[-1]
+                siteFrom = lastpart.split('-')[0]
+                siteTo   = lastpart.split('-')[1]
+                fileIn = open(fileName,'r')
+                rows = [(line.strip(),siteFrom,siteTo,fileName) for line in fileIn if line.strip()]
+                fileIn.close()
+                self.connection.execute('DELETE FROM Transfers WHERE FileName=?',(fileName,))
+                self.connection.executemany('INSERT INTO Transfers (DatasetName,SiteFrom,SiteTo,'
+                                            'FileName) VALUES (?,?,?,?)',rows)
+                self.connection.execute('INSERT OR REPLACE INTO TransferFiles VALUES (?,?,?,?)',
+                                        (fileName,siteFrom,siteTo,modTime))
+                nAdded = nAdded + len(rows)
+            for fileName in set(known) - set(fileNames):
+                self.forgetFile(fileName)
+        return nAdded
+
+    def forgetFile(self,fileName):
+        self.connection.execute('DELETE FROM Transfers WHERE FileName=?',(fileName,))
+        self.connection.execute('DELETE FROM TransferFiles WHERE FileName=?',(fileName,))
+
+    def removeFiles(self,fileNames):
+        with self.connection:
+            for fileName in fileNames:
+                self.forgetFile(fileName)
+
+    def filesFrom(self,siteFrom):
+        sql = 'SELECT FileName,ModTime FROM TransferFiles WHERE SiteFrom=?'
+        return self.connection.execute(sql,(siteFrom,)).fetchall()
+
+    #-----------------------------------------------------------------------------------------------
+    # transfers
+    #-----------------------------------------------------------------------------------------------
+    def sourceSites(self):
+        sql = 'SELECT DISTINCT SiteFrom FROM TransferFiles'
+        return [row[0] for row in self.connection.execute(sql)]
+
+    def transfersFrom(self,siteFrom):
+        # list of (dataset, siteTo, done)
+        sql = 'SELECT DatasetName,SiteTo,Done FROM Transfers WHERE SiteFrom=?'
+        return self.connection.execute(sql,(siteFrom,)).fetchall()
+
+    def datasets(self):
+        sql = 'SELECT DISTINCT DatasetName FROM Transfers'
+        return set([row[0] for row in self.connection.execute(sql)])
+
+    def setDone(self,datasets):
+        # the given datasets are done, all others are not (copies can disappear again)
+        with self.connection:
+            self.connection.execute('UPDATE Transfers SET Done=0')
+            self.connection.executemany('UPDATE Transfers SET Done=1 WHERE DatasetName=?',
+                                        [(dset,) for dset in datasets])
+
+    #-----------------------------------------------------------------------------------------------
+    # bookkeeping
+    #-----------------------------------------------------------------------------------------------
+    def getMeta(self,key):
+        row = self.connection.execute('SELECT Value FROM Meta WHERE Key=?',(key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def setMeta(self,key,value):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO Meta VALUES (?,?)',(key,value))
@@ -0,0 +1,214 @@
+#===================================================================================================
+#  C L A S S
+#===================================================================================================
+import time, socket, ssl, threading, Queue, httplib, urlparse
+
+#---------------------------------------------------------------------------------------------------
+"""
+Class:  WebFetcher(ttl,timeout,nThreads)
+Fetches web artifacts (Detox summaries, PhEDEx cache files, ...) over a pool of keep-alive
+connections per host. Bodies are kept in an in-process cache keyed by url: within the ttl a url is
+never fetched twice, after the ttl it is revalidated with a conditional GET (ETag/Last-Modified).
+Concurrent requests for the same url are collapsed into one download and prefetch() downloads a
+list of urls in parallel.
+"""
+#---------------------------------------------------------------------------------------------------
+class WebFetcher:
+    "A WebFetcher downloads urls in parallel over persistent connections with a TTL cache."
+
+    def __init__(self,ttl=60*60,timeout=10*60,nThreads=8):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.nThreads = nThreads
+
+        # url -> (body, etag, lastModified, fetchTime), body is None for missing (404) files
+        self.cache = {}
+        self.inFlight = {}
+        self.cacheLock = threading.Lock()
+        # (scheme, host) -> idle connections
+        self.idle = {}
+        self.poolLock = threading.Lock()
+
+    #-----------------------------------------------------------------------------------------------
+    # connection pool
+    #-----------------------------------------------------------------------------------------------
+    def getConnection(self,scheme,host):
+        self.poolLock.acquire()
+        try:
+            connections = self.idle.get((scheme,host),[])
+            if len(connections) > 0:
+                return connections.pop()
+        finally:
+            self.poolLock.release()
+
+        if scheme == 'https':
+            # same as 'curl -k', the Detox web area is not verified
+            try:
+                context = ssl._create_unverified_context()
+                return httplib.HTTPSConnection(host,timeout=self.timeout,context=context)
+            except AttributeError:
+                return httplib.HTTPSConnection(host,timeout=self.timeout)
+        return httplib.HTTPConnection(host,timeout=self.timeout)
+
+    def releaseConnection(self,scheme,host,connection):
+        self.poolLock.acquire()
+        try:
+            if (scheme,host) not in self.idle:
+                self.idle[(scheme,host)] = []
+            self.idle[(scheme,host)].append(connection)
+        finally:
+            self.poolLock.release()
+
+    def close(self):
+        self.poolLock.acquire()
+        try:
+            for key in self.idle:
+                for connection in self.idle[key]:
+                    connection.close()
+            self.idle = {}
+        finally:
+            self.poolLock.release()
+
+    def request(self,url,headers):
+        parts = urlparse.urlsplit(url)
+        path = parts.path
+        if parts.query:
+            path = path + '?' + parts.query
+        # a pooled connection might have been closed by the server, retry once on a new one but
+        # not after a timeout, the server is slow and would only be asked to do the work again
+        for attempt in range(2):
+            connection = self.getConnection(parts.scheme,parts.netloc)
+            try:
+                connection.request('GET',path,headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except socket.timeout:
+                connection.close()
+                raise
+            except (httplib.HTTPException,socket.error):
+                connection.close()
+                if attempt > 0:
+                    raise
+                continue
+            if response.getheader('connection','').lower() == 'close':
+                connection.close()
+            else:
+                self.releaseConnection(parts.scheme,parts.netloc,connection)
+            return (response.status,response.getheader('etag'),
+                    response.getheader('last-modified'),body)
+
+    #-----------------------------------------------------------------------------------------------
+    # cached access
+    #-----------------------------------------------------------------------------------------------
+    def get(self,url,accept='text'):
+        # returns the body of the url, None if the file does not exist
+        self.cacheLock.acquire()
+        while True:
+            entry = self.cache.get(url)
+            if entry is not None and time.time() - entry[3] < self.ttl:
+                self.cacheLock.release()
+                return entry[0]
+            if url not in self.inFlight:
+                break
+            # somebody else is downloading it, wait for the result
+            event = self.inFlight[url]
+            self.cacheLock.release()
+            event.wait()
+            self.cacheLock.acquire()
+            if url not in self.cache:
+                self.cacheLock.release()
+                raise Exception(" FATAL -- Call to %s failed, stopping"%(url))
+        event = threading.Event()
+        self.inFlight[url] = event
+        self.cacheLock.release()
+
+        try:
+            headers = {'Accept': accept}
+            if entry is not None and entry[1]:
+                headers['If-None-Match'] = entry[1]
+            if entry is not None and entry[2]:
+                headers['If-Modified-Since'] = entry[2]
+            try:
+                (status,etag,lastModified,body) = self.request(url,headers)
+            except socket.timeout:
+                print " Oops, taking too long!"
+                raise Exception(" FATAL -- Call to %s timed out, stopping"%(url))
+            except (httplib.HTTPException,socket.error),e:
+                print " Received error: " + str(e)
+                raise Exception(" FATAL -- Call to %s failed, stopping"%(url))
+
+            if status == 304 and entry is not None:
+                entry = (entry[0],entry[1],entry[2],time.time())
+            elif status == 200:
+                entry = (body,etag,lastModified,time.time())
+            elif status == 404:
+                entry = (None,None,None,time.time())
+            else:
+                print " Received status: " + str(status)
+                raise Exception(" FATAL -- Call to %s failed, stopping"%(url))
+
+            self.cacheLock.acquire()
+            self.cache[url] = entry
+            self.cacheLock.release()
+            return entry[0]
+        finally:
+            self.cacheLock.acquire()
+            del self.inFlight[url]
+            self.cacheLock.release()
+            event.set()
+
+    def validators(self,url):
+        # (etag, lastModified) of the cached copy of url, as sent by the server
+        self.cacheLock.acquire()
+        try:
+            entry = self.cache.get(url)
+        finally:
+            self.cacheLock.release()
+        if entry is None:
+            return (None,None)
+        return (entry[1],entry[2])
+
+    def prefetch(self,urls,accept='text'):
+        # downloads all urls in parallel into the cache
+        queue = Queue.Queue()
+        for url in set(urls):
+            queue.put(url)
+        errors = []
+
+        def worker():
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self.get(url,accept)
+                except Exception,e:
+                    errors.append(e)
+
+        threads = []
+        for i in range(min(self.nThreads,queue.qsize())):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+#---------------------------------------------------------------------------------------------------
+# one fetcher per process so all Undertaker components share connections and cache
+#---------------------------------------------------------------------------------------------------
+sharedFetcher = None
+sharedFetcherLock = threading.Lock()
+
+def getFetcher():
+    global sharedFetcher
+    sharedFetcherLock.acquire()
+    try:
+        if sharedFetcher is None:
+            sharedFetcher = WebFetcher()
+        return sharedFetcher
+    finally:
+        sharedFetcherLock.release()
@@ -14,6 +14,12 @@ export UNDERTAKER_SITESTORAGE_PW="db78user?Cms"
 # sub directories
 export UNDERTAKER_TRDIR="transfers"
 
+# local site readiness store
+export UNDERTAKER_READINESS="SiteReadiness.json"
+
+# local transfer state
+export UNDERTAKER_TRSTATE="TransferState.db"
+
 # location of Detox web 
 export UNDERTAKER_DETOXWEB="http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox"
 
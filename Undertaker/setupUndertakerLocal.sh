@@ -14,6 +14,12 @@ export UNDERTAKER_SITESTORAGE_PW="db78user?Cms"
 # sub directories
 export UNDERTAKER_TRDIR="transfers"
 
+# local site readiness store
+export UNDERTAKER_READINESS="SiteReadiness.json"
+
+# local transfer state
+export UNDERTAKER_TRSTATE="TransferState.db"
+
 # location of Detox web 
 export UNDERTAKER_DETOXWEB="http://t3serv001.mit.edu/~cmsprod/IntelROCCS/Detox"
 
@@ -28,4 +34,5 @@ export UNDERTAKER_BASE=`pwd`
 export UNDERTAKER_PYTHONPATH="$UNDERTAKER_BASE/python"
 
 # Python path etc. (careful it might not be set)
-export PYTHONPATH="${UNDERTAKER_PYTHONPATH}:$PYTHONPATH"
+# the shared PhEDEx client is taken from Api in a local checkout
+export PYTHONPATH="${UNDERTAKER_PYTHONPATH}:`dirname $UNDERTAKER_BASE`/Api/src:$PYTHONPATH"
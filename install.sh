@@ -31,6 +31,8 @@ then
   rm -rf "$INTELROCCS_BASE"
 fi
 cp -r ../IntelROCCS $TRUNC
+# the shared PhEDEx client is kept only in Api
+cp ../IntelROCCS/Api/src/phedexClient.py $DETOX_BASE/python/
 
 
 # create log/db structure
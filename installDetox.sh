@@ -29,6 +29,8 @@ then
   rm -rf "$DETOX_BASE"
 fi
 cp -r ../IntelROCCS/Detox $TRUNC
+# the shared PhEDEx client is kept only in Api
+cp ../IntelROCCS/Api/src/phedexClient.py $DETOX_PYTHONPATH/
 
 # create log/db structure
 #========================
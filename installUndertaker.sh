@@ -29,6 +29,8 @@ then
   rm -rf "$UNDERTAKER_BASE"
 fi
 cp -r ../IntelROCCS/Undertaker $TRUNC
+# the shared PhEDEx client is kept only in Api
+cp ../IntelROCCS/Api/src/phedexClient.py $UNDERTAKER_PYTHONPATH/
 
 # create log/db structure
 #========================